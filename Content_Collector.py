@@ -1,67 +1,182 @@
+import codecs
 import os
 import re
-from typing import Union, Iterable, List, Dict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union, Iterable, Iterator, List, Dict, Optional, Tuple
 from langextract.data import Document
 
+from Metadata_Extractor import MetadataExtractor
+
+# 與 chunking 流程共用同一個文件掃描器；由 chunking 專案提供 (pip install -r requirements.txt)
+from file_scanner import scan_files, DEFAULT_EXCLUDES
+from run_metrics import RunMetrics
+from streaming_reader import iter_text_windows, should_stream
+from near_dup import NearDuplicateIndex, compact_diff
+
+# 編碼偵測設定
+# 只讀取一次原始位元組，先檢查 BOM 與 UTF-8，再依序嘗試 CJK 編碼
+BINARY_SNIFF_BYTES = 8192
+# gb18030 是 GBK 的超集，GBK 文件以 gb18030 解碼結果相同，不必另外嘗試
+CJK_FALLBACK_ENCODINGS = ("gb18030", "big5")
+# 只以開頭這麼多位元組為候選編碼評分，完整內容只以最佳候選解碼
+ENCODING_SAMPLE_BYTES = 64 * 1024
+
+_BOMS = (
+    (b"\xef\xbb\xbf", "utf-8-sig"),
+    (b"\xff\xfe\x00\x00", "utf-32"),
+    (b"\x00\x00\xfe\xff", "utf-32"),
+    (b"\xff\xfe", "utf-16"),
+    (b"\xfe\xff", "utf-16"),
+)
+
+# 簡繁常用字；GBK 與 Big5 的位元組範圍大量重疊，誤判時解出的多為罕用字，
+# 以常用字比例挑選最合理的解碼結果
+_COMMON_HANZI = frozenset(
+    "的一是不了在人有我他这這个個们們中来來上大为為和国國地到以说說时時要就出"
+    "会會可也你对對生能而子那得于於着著下自之年过過发發后後作里裡用道行所然家"
+    "种種事成方多经經么麼去法学學如都同现現当當没沒动動面起看定天分还還进進好"
+    "小部其些主样樣理心本前开開但因只从從想实實日意无無力与與长長把机機十第公"
+    "此已工使情明性知全三又关關点點正业業外将將两兩高间間由问問很最重并並物手"
+    "应應新设設文件戶户请請资資数數据據错錯误誤欄栏位值狀状态態送回傳传單单號号"
+    "碼码檢检查審审核批准流程客戶系統统處处執执行結结果取得更獲获"
+)
+
+
+def is_binary(prefix: bytes) -> bool:
+    """
+    以文件開頭的少量位元組判斷是否為二進位文件
+
+    :param prefix: 文件開頭的位元組
+    :return: 含有 NUL 字元時視為二進位
+    """
+    return b"\x00" in prefix
+
+
+def _hanzi_score(text: str) -> float:
+    non_ascii = len(text) - len(text.encode("ascii", "ignore"))
+    common = sum(map(_COMMON_HANZI.__contains__, text))
+    return common / non_ascii if non_ascii else 0.0
+
+
+def _decode(data: bytes, encoding: str, final: bool) -> str:
+    if final:
+        return data.decode(encoding)
+    # 只有開頭片段時，結尾被截斷的多位元組字元不算錯誤
+    return codecs.getincrementaldecoder(encoding)().decode(data, final=False)
+
+
+def detect_encoding(data: bytes,
+                    fallbacks: Iterable[str] = CJK_FALLBACK_ENCODINGS,
+                    final: bool = True) -> Tuple[Optional[str], Optional[str]]:
+    """
+    偵測位元組內容的編碼並解碼
+
+    :param data: 文件的完整位元組內容，或 final=False 時的開頭片段
+    :param fallbacks: UTF-8 失敗時依序嘗試的編碼
+    :param final: data 是否為完整內容
+    :return: (編碼名稱, 解碼後文字)，二進位或無法解碼時返回 (None, None)
+    """
+    for bom, encoding in _BOMS:
+        if data.startswith(bom):
+            try:
+                return encoding, _decode(data, encoding, final)
+            except UnicodeDecodeError:
+                break
+
+    if is_binary(data[:BINARY_SNIFF_BYTES]):
+        return None, None
+
+    if data.isascii():
+        return "ascii", data.decode("ascii")
+    try:
+        return "utf-8", _decode(data, "utf-8", final)
+    except UnicodeDecodeError:
+        pass
+
+    # 以開頭片段評分，同分時以 fallbacks 中較前面的編碼為準
+    sample = data[:ENCODING_SAMPLE_BYTES]
+    complete = len(data) <= ENCODING_SAMPLE_BYTES
+    candidates = []
+    for index, encoding in enumerate(fallbacks):
+        try:
+            text = _decode(sample, encoding, final and complete)
+        except UnicodeDecodeError:
+            continue
+        candidates.append((-_hanzi_score(text), index, encoding, text))
+    for _, _, encoding, text in sorted(candidates):
+        if complete:
+            return encoding, text
+        # 開頭可解碼不代表後段也可以，失敗時改用下一個候選
+        try:
+            return encoding, _decode(data, encoding, final)
+        except UnicodeDecodeError:
+            continue
+    return None, None
+
+
 class DocumentCollector:
     """收集文檔內容並轉換為LangExtract所需的Document對象"""
     
-    def __init__(self, file_path: str, extensions: List[str]):
+    def __init__(self, file_path: str, extensions: List[str],
+                 max_workers: int = 1, max_in_flight: Optional[int] = None,
+                 excludes: Iterable[str] = DEFAULT_EXCLUDES,
+                 max_file_size: Optional[int] = None, max_depth: Optional[int] = None,
+                 dedup: bool = False, dedup_threshold: float = 0.8, max_diff_ratio: float = 0.5):
+        """
+        :param file_path: 要掃描的根目錄
+        :param extensions: 要收集的副檔名列表
+        :param max_workers: 載入文件的執行緒數量，1 表示逐一載入
+        :param max_in_flight: 同時在載入中 (尚未被取走) 的文件上限，預設為 max_workers 的 4 倍
+        :param excludes: .gitignore 風格的排除規則 (目錄中的 .gitignore 也會套用)
+        :param max_file_size: 超過此大小 (bytes) 的文件會被略過
+        :param max_depth: 最大掃描深度
+        :param dedup: 是否啟用近似重複偵測；重複的文件只送出與代表文件的差異
+        :param dedup_threshold: 判定為近似重複的估計 Jaccard 相似度下限
+        :param max_diff_ratio: 差異長度超過原文此比例時，仍送出完整內容
+        """
         self.file_path = file_path
         self.extensions = extensions
+        self.excludes = list(excludes)
+        self.max_file_size = max_file_size
+        self.max_depth = max_depth
+        self.max_workers = max(1, max_workers)
+        self.max_in_flight = max(self.max_workers, max_in_flight or self.max_workers * 4)
         self.documents: List[Document] = []
+        # document_id -> 偵測到的編碼
+        self.document_encodings: Dict[str, str] = {}
+        self.metadata_extractor = MetadataExtractor()
+        self.dedup = dedup
+        self.dedup_threshold = dedup_threshold
+        self.max_diff_ratio = max_diff_ratio
+        self.near_duplicate_index = NearDuplicateIndex(threshold=dedup_threshold)
+        # document_id -> 代表文件的document_id
+        self.duplicate_of: Dict[str, str] = {}
+        self._streamed_ids = set()
+        # 計數、位元組總量與耗時；每次 iter_documents 重新開始
+        self.metrics = RunMetrics("collector")
     
-    def _enhanced_regex_extraction(self, documents: List[Dict]) -> List[Dict]:
+    def _enhanced_regex_extraction(self, documents: List[Dict], processes: Optional[int] = None) -> List[Dict]:
         """Enhanced regex-based extraction with better patterns"""
-        
-        extracted_docs = []
-        
-        for doc in documents:
-            metadata = {
-                'service': 'unknown',
-                'version': 'unknown',
-                'doc_type': 'reference', 
-                'rate_limits': [],
-                'deprecated': False
-            }
-            
-            title = doc.get('title', '')
-            content = doc['content']
-            
-            # Extract service name from title
-            service_match = re.search(r'([\w\s]+(?:API|Service))', title)
-            if service_match:
-                metadata['service'] = service_match.group(1).strip()
-            
-            # Extract version number
-            version_match = re.search(r'v?([\d.]+)', title)
-            if version_match:
-                metadata['version'] = version_match.group(1)
-            
-            # Determine document type
-            if 'troubleshooting' in title.lower():
-                metadata['doc_type'] = 'troubleshooting'
-            elif 'guide' in title.lower():
-                metadata['doc_type'] = 'guide'
-            else:
-                metadata['doc_type'] = 'reference'
-            
-            # Extract rate limits
-            rate_matches = re.findall(r'(\d+)\s*(?:requests?|req)[/\s]*(?:per\s*)?min', content.lower())
-            metadata['rate_limits'] = [f"{r} req/min" for r in rate_matches]
-            
-            # Check for deprecation
-            if 'deprecated' in content.lower():
-                metadata['deprecated'] = True
-            
-            extracted_docs.append({
-                'id': doc['id'],
-                'title': doc['title'], 
-                'content': doc['content'],
-                'metadata': metadata
-            })
-        
-        return extracted_docs
+        return self.metadata_extractor.extract_batch(documents, processes=processes)
+
+    def iter_files_with_extensions(self) -> Iterator[str]:
+        """
+        遞歸查找指定副檔名的文件，邊掃描邊產出，不必等整棵目錄樹掃描完成
+
+        :return: 文件路徑的生成器
+        """
+        scanned_files = scan_files(self.file_path, self.extensions, excludes=self.excludes,
+                                   max_depth=self.max_depth, max_size=self.max_file_size)
+        while True:
+            # 只計入掃描本身的時間，不含呼叫端處理每個文件的時間
+            with self.metrics.stage("scan"):
+                scanned = next(scanned_files, None)
+            if scanned is None:
+                return
+            self.metrics.incr("files_found")
+            self.metrics.log(f"找到文件: {scanned.path}")
+            yield scanned.path
 
     def find_files_with_extensions(self) -> List[str]:
         """
@@ -69,20 +184,41 @@ class DocumentCollector:
         
         :return: 找到的文件路徑列表
         """
-        found_files = []
+        return list(self.iter_files_with_extensions())
 
-        if not os.path.isdir(self.file_path):
-            raise FileNotFoundError(f"找不到目錄: {os.path.abspath(self.file_path)}")
+    def load_file(self, file_path: str) -> Tuple[str, Optional[str]]:
+        """
+        安全地載入單個文件內容並偵測其編碼，每個文件只讀取一次
 
-        for dirpath, _, filenames in os.walk(self.file_path):
-            for filename in filenames:
-                if any(filename.endswith(ext) for ext in self.extensions):
-                    file_path = os.path.join(dirpath, filename)
-                    found_files.append(file_path)
-                    print(f"找到文件: {file_path}")
+        :param file_path: 文件路徑
+        :return: (文件內容, 編碼)，出錯或為二進位文件時返回 ("", None)
+        """
+        try:
+            with open(file_path, 'rb') as f:
+                # 先讀取開頭判斷是否為二進位，是的話不必讀完整個文件
+                prefix = f.read(BINARY_SNIFF_BYTES)
+                if is_binary(prefix) and not prefix.startswith(tuple(bom for bom, _ in _BOMS)):
+                    self.metrics.incr("files_skipped_binary")
+                    self.metrics.log(f"⚠️ 跳過二進位檔案: {file_path}")
+                    return "", None
+                data = prefix + f.read()
+        except (FileNotFoundError, PermissionError) as e:
+            self.metrics.record_error("load", e, file_path)
+            return "", None
+        except Exception as e:
+            self.metrics.record_error("load", e, file_path)
+            return "", None
+
+        self.metrics.add_bytes("load", len(data))
+        encoding, content = detect_encoding(data)
+        if encoding is None:
+            self.metrics.incr("files_undecodable")
+            self.metrics.log(f"❌ 編碼錯誤: {file_path} - 無法判斷編碼")
+            return "", None
 
-        print(f"找到程式文件共 {len(found_files)} 個。")
-        return found_files
+        self.metrics.incr(f"encoding:{encoding}")
+        self.metrics.log(f"✅ 成功載入 ({encoding}): {file_path} ({len(content)} 字符)")
+        return content, encoding
 
     def load_file_content(self, file_path: str) -> str:
         """
@@ -91,41 +227,21 @@ class DocumentCollector:
         :param file_path: 文件路徑
         :return: 文件內容，出錯時返回空字符串
         """
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                print(f"✅ 成功載入: {file_path} ({len(content)} 字符)")
-                return content
-        except UnicodeDecodeError:
-            # 嘗試其他編碼
-            try:
-                with open(file_path, 'r', encoding='gbk') as f:
-                    content = f.read()
-                    print(f"✅ 成功載入 (GBK編碼): {file_path}")
-                    return content
-            except Exception as e:
-                print(f"❌ 編碼錯誤: {file_path} - {e}")
-                return ""
-        except FileNotFoundError:
-            print(f"❌ 找不到檔案: {file_path}")
-            return ""
-        except PermissionError:
-            print(f"❌ 沒有權限讀取檔案: {file_path}")
-            return ""
-        except Exception as e:
-            print(f"❌ 讀取檔案 {file_path} 時發生錯誤: {e}")
-            return ""
+        return self.load_file(file_path)[0]
 
-    def create_langextract_document(self, file_path: str, content: str) -> Document:
+    def create_langextract_document(self, file_path: str, content: str, window_index: Optional[int] = None) -> Document:
         """
         創建LangExtract Document對象
         
         :param file_path: 文件路徑
         :param content: 文件內容
+        :param window_index: 串流讀取的大文件中的視窗編號，會附加在document_id後
         :return: LangExtract Document對象
         """
         # 使用相對路徑作為document_id，更簡潔
         relative_path = os.path.relpath(file_path, self.file_path)
+        if window_index is not None:
+            relative_path = f"{relative_path}#{window_index}"
         
         # 創建Document時，確保參數正確
         doc = Document(
@@ -140,6 +256,214 @@ class DocumentCollector:
         )
         return doc
 
+    def _load_document(self, file_path: str) -> Optional[Document]:
+        """
+        載入單個文件並轉換為Document對象
+
+        :param file_path: 文件路徑
+        :return: Document對象，空文件或失敗時返回None
+        """
+        content, encoding = self.load_file(file_path)
+
+        # 只處理非空內容
+        if not (content and content.strip()):
+            self.metrics.incr("files_skipped_empty")
+            return None
+
+        try:
+            doc = self.create_langextract_document(file_path, content)
+        except Exception as e:
+            self.metrics.record_error("create_document", e, file_path)
+            return None
+
+        self.document_encodings[doc.document_id] = encoding
+        self.metrics.incr("documents_created")
+        self.metrics.log(f"📄 文檔創建成功: {os.path.basename(file_path)}")
+        return doc
+
+    def _iter_streamed_documents(self, file_path: str) -> Iterator[Document]:
+        """
+        以重疊視窗串流讀取超大文件，每個視窗產出一個Document，記憶體用量與文件大小無關
+
+        :param file_path: 文件路徑
+        :return: Document對象的生成器
+        """
+        try:
+            with open(file_path, 'rb') as f:
+                prefix = f.read(BINARY_SNIFF_BYTES * 8)
+        except Exception as e:
+            self.metrics.record_error("load", e, file_path)
+            return
+
+        if is_binary(prefix[:BINARY_SNIFF_BYTES]) and not prefix.startswith(tuple(bom for bom, _ in _BOMS)):
+            self.metrics.incr("files_skipped_binary")
+            return
+        # 只用開頭片段判斷編碼；後面若有無法解碼的位元組則以替代字元處理
+        encoding, _ = detect_encoding(prefix, final=False)
+        if encoding is None:
+            self.metrics.incr("files_undecodable")
+            return
+        stream_encoding = "utf-8" if encoding == "ascii" else encoding
+
+        try:
+            self.metrics.add_bytes("load", os.path.getsize(file_path))
+            for window in iter_text_windows(file_path, encoding=stream_encoding, errors="replace"):
+                if not window.text.strip():
+                    continue
+                doc = self.create_langextract_document(file_path, window.text, window_index=window.index)
+                self.document_encodings[doc.document_id] = stream_encoding
+                self._streamed_ids.add(doc.document_id)
+                self.metrics.incr("documents_created")
+                yield doc
+        except Exception as e:
+            self.metrics.record_error("load", e, file_path)
+            return
+        self.metrics.incr("files_streamed")
+        self.metrics.incr(f"encoding:{stream_encoding}")
+
+    def iter_documents(self) -> Iterator[Document]:
+        """
+        邊掃描、邊載入邊產出Document對象，不在記憶體中保留整個語料或文件清單
+
+        max_workers > 1 時使用執行緒池並行載入；同時載入中的文件數量
+        受 max_in_flight 限制，產出順序與掃描順序一致。結束時印出成功處理的文件數。
+
+        :return: Document對象的生成器
+        """
+        self.metrics = RunMetrics("collector")
+        self.near_duplicate_index = NearDuplicateIndex(threshold=self.dedup_threshold)
+        self.duplicate_of = {}
+        documents = self._iter_loaded(self.iter_files_with_extensions())
+        if self.dedup:
+            documents = self._iter_deduplicated(documents)
+        try:
+            yield from documents
+        finally:
+            self.metrics.set("near_duplicate_clusters", len(self.duplicate_clusters))
+            counters = self.metrics.counters
+            print(f"\n✅ 成功處理 {counters['files_loaded']}/{counters['files_found']} 個文件")
+            self.metrics.emit_summary()
+
+    @property
+    def duplicate_clusters(self) -> Dict[str, List[str]]:
+        """代表文件的document_id -> 近似重複文件的document_id列表"""
+        return self.near_duplicate_index.duplicate_clusters()
+
+    def _iter_deduplicated(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """
+        近似重複偵測：每個群組只送出代表文件的完整內容，其餘成員改為送出與代表文件的差異；
+        完全相同的成員送出指向代表文件的說明，差異過大的成員送出完整內容並移出群組
+
+        :param documents: 依掃描順序排列的Document
+        :return: Document對象的生成器
+        """
+        for doc in documents:
+            # 串流讀取的超大文件視窗不參與比對
+            if doc.document_id in self._streamed_ids:
+                yield doc
+                continue
+
+            with self.metrics.stage("dedup"):
+                rep_id, score = self.near_duplicate_index.add(doc.document_id, doc.text)
+            if rep_id is None:
+                yield doc
+                continue
+
+            self.duplicate_of[doc.document_id] = rep_id
+            self.metrics.incr("near_duplicates")
+            self.metrics.log(f"🔁 近似重複: {doc.document_id} ~ {rep_id} ({score:.2f})")
+
+            # 代表文件不保留在記憶體中，需要時再讀一次
+            rep_text = self._reload_text(rep_id)
+            diff = compact_diff(rep_text, doc.text, rep_id, doc.document_id)
+            if not diff:
+                # 內容完全相同：仍送出指向代表文件的簡短說明，下游才知道此文件存在
+                self.metrics.incr("near_duplicates_identical")
+                yield Document(
+                    text=f"{doc.document_id} 的內容與 {rep_id} 完全相同。",
+                    document_id=doc.document_id,
+                    additional_context=f"此文件與 {rep_id} 完全相同，內容請參考該文件。"
+                )
+                continue
+            if len(diff) > len(doc.text) * self.max_diff_ratio:
+                # 差異過大時送出完整內容，並改為獨立群組的代表文件
+                del self.duplicate_of[doc.document_id]
+                self.near_duplicate_index.promote(doc.document_id, doc.text)
+                self.metrics.incr("near_duplicates_promoted")
+                yield doc
+                continue
+            self.metrics.incr("near_duplicates_diffed")
+            yield Document(
+                text=diff,
+                document_id=doc.document_id,
+                additional_context=f"此文件與 {rep_id} 近似重複 (相似度 {score:.2f})，以下僅為相對於該文件的差異 (unified diff)。"
+            )
+
+    def _reload_text(self, document_id: str) -> str:
+        try:
+            with open(os.path.join(self.file_path, document_id), 'rb') as f:
+                return detect_encoding(f.read())[1] or ""
+        except OSError:
+            return ""
+
+    def _iter_streamed_file(self, file_path: str) -> Iterator[Document]:
+        loaded = False
+        for doc in self._iter_streamed_documents(file_path):
+            loaded = True
+            yield doc
+        if loaded:
+            self.metrics.incr("files_loaded")
+
+    def _iter_loaded(self, found_files: Iterable[str]) -> Iterator[Document]:
+        # 文件清單是邊掃描邊產生的，進度只顯示已處理數量
+        done = 0
+        if self.max_workers == 1:
+            for file_path in found_files:
+                if should_stream(file_path):
+                    yield from self._iter_streamed_file(file_path)
+                    done += 1
+                    continue
+                with self.metrics.stage("load"):
+                    doc = self._load_document(file_path)
+                done += 1
+                self.metrics.progress("load", done)
+                if doc is not None:
+                    self.metrics.incr("files_loaded")
+                    yield doc
+            return
+
+        # 並行模式下 stage 時間為各執行緒的加總
+        # 超大文件不送進執行緒池 (否則整份內容會留在 Future 中)，輪到它時才串流讀取
+        def submit(path):
+            return path if should_stream(path) else executor.submit(self._timed_load_document, path)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+            files = iter(found_files)
+            for file_path in files:
+                pending.append(submit(file_path))
+                if len(pending) >= self.max_in_flight:
+                    break
+
+            while pending:
+                item = pending.popleft()
+                next_file = next(files, None)
+                if next_file is not None:
+                    pending.append(submit(next_file))
+                done += 1
+                if isinstance(item, str):
+                    yield from self._iter_streamed_file(item)
+                    continue
+                doc = item.result()
+                self.metrics.progress("load", done)
+                if doc is not None:
+                    self.metrics.incr("files_loaded")
+                    yield doc
+
+    def _timed_load_document(self, file_path: str) -> Optional[Document]:
+        with self.metrics.stage("load"):
+            return self._load_document(file_path)
+
     def collect_documents(self) -> List[Document]:
         """
         收集所有文檔並轉換為LangExtract Document對象
@@ -148,35 +472,11 @@ class DocumentCollector:
         """
         # 清空之前的結果
         self.documents = []
-        
-        found_files = self.find_files_with_extensions()
-        print(f"準備載入 {len(found_files)} 個檔案...")
+        self.document_encodings = {}
 
-        successful_count = 0
-        
-        for file_path in found_files:
-            content = self.load_file_content(file_path)
-            
-            # 只處理非空內容
-            if content and content.strip():
-                try:
-                    doc = self.create_langextract_document(file_path, content)
-                    self.documents.append(doc)
-                    successful_count += 1
-                    
-                    # 顯示文件內容預覽
-                    preview = content[:100].replace('\n', '\\n')
-                    print(f"📄 文檔創建成功: {os.path.basename(file_path)} - 預覽: {preview}...")
-                    
-                except Exception as e:
-                    print(f"❌ 創建文檔失敗 {file_path}: {e}")
-                    continue
-            else:
-                print(f"⚠️ 跳過空文件: {file_path}")
+        for doc in self.iter_documents():
+            self.documents.append(doc)
 
-        print(f"\n✅ 成功處理 {successful_count}/{len(found_files)} 個文件")
-        print(f"📋 總共創建 {len(self.documents)} 個Document對象")
-        
         return self.documents
 
     def get_documents_for_langextract(self) -> List[Document]:
@@ -195,9 +495,8 @@ class DocumentCollector:
                 if doc.text and doc.text.strip():
                     valid_documents.append(doc)
                 else:
-                    print(f"⚠️ 跳過空內容文檔: {doc.document_id}")
+                    self.metrics.log(f"⚠️ 跳過空內容文檔: {doc.document_id}")
             else:
-                print(f"❌ 無效的Document對象: {doc}")
+                self.metrics.log(f"❌ 無效的Document對象: {doc}")
         
-        print(f"📊 最終有效文檔數量: {len(valid_documents)}")
         return valid_documents
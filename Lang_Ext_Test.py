@@ -308,9 +308,11 @@ postRecvTest2(httpMethod: "POST", groups: ["jira-administrators"]) { Multivalued
     return Response.status(result.status == 'success' ? 200 : 400).entity(result).build()
 }
 """
-documents = DocumentCollector(file_path=file_path, extensions=extensions).get_documents_for_langextract()
-doc_num = documents.__sizeof__
-print(f"總計找到幾個文檔 {doc_num}")
+# 以執行緒池邊掃描邊載入，lx.extract 可在掃描尚未完成時就開始處理
+# 近似重複的文件 (例如 postRecv*.groovy 的各個版本) 只送出與代表文件的差異
+collector = DocumentCollector(file_path=file_path, extensions=extensions, max_workers=8, max_in_flight=64,
+                              dedup=True)
+documents = collector.iter_documents()
 
 result = lx.extract(
     text_or_documents = documents,
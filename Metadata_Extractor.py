@@ -0,0 +1,126 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+
+class MetadataExtractor:
+    """以預編譯的正則表達式從文檔標題與內容中提取元數據"""
+
+    # 標題相關的模式
+    SERVICE_PATTERN = re.compile(r'([\w\s]+(?:API|Service))')
+    VERSION_PATTERN = re.compile(r'v?([\d.]+)')
+    RATE_LIMIT_PATTERN = re.compile(r'(\d+)\s*(?:requests?|req)[/\s]*(?:per\s*)?min')
+
+    def extract_metadata(self, title: str, content: str) -> Dict:
+        """
+        提取單個文檔的元數據
+
+        :param title: 文檔標題
+        :param content: 文檔內容
+        :return: 元數據字典
+        """
+        metadata = {
+            'service': 'unknown',
+            'version': 'unknown',
+            'doc_type': 'reference',
+            'rate_limits': [],
+            'deprecated': False
+        }
+
+        # Extract service name from title
+        service_match = self.SERVICE_PATTERN.search(title)
+        if service_match:
+            metadata['service'] = service_match.group(1).strip()
+
+        # Extract version number
+        version_match = self.VERSION_PATTERN.search(title)
+        if version_match:
+            metadata['version'] = version_match.group(1)
+
+        # Determine document type
+        title_lower = title.lower()
+        if 'troubleshooting' in title_lower:
+            metadata['doc_type'] = 'troubleshooting'
+        elif 'guide' in title_lower:
+            metadata['doc_type'] = 'guide'
+
+        # 內容只轉小寫一次，速率限制與 deprecated 檢查共用
+        content_lower = content.lower()
+        metadata['rate_limits'] = [f"{r} req/min" for r in self._find_rate_limits(content_lower)]
+        metadata['deprecated'] = 'deprecated' in content_lower
+
+        return metadata
+
+    def _find_rate_limits(self, content_lower: str) -> List[str]:
+        """
+        與 RATE_LIMIT_PATTERN.findall 結果相同，但只在出現 "req" 的位置嘗試匹配
+
+        逐字元掃描數字開頭的正則表達式是主要開銷；先用 str.find 找出字面量
+        "req"，再往回找緊鄰的數字，只在這些候選位置執行 match。
+        """
+        rates = []
+        last_end = 0
+        pos = content_lower.find('req')
+        while pos != -1:
+            # 往回跳過空白，再往回收集數字
+            digits_end = pos
+            while digits_end > last_end and content_lower[digits_end - 1].isspace():
+                digits_end -= 1
+            start = digits_end
+            while start > last_end and content_lower[start - 1].isdecimal():
+                start -= 1
+            if start < digits_end:
+                match = self.RATE_LIMIT_PATTERN.match(content_lower, start)
+                if match:
+                    rates.append(match.group(1))
+                    last_end = match.end()
+            pos = content_lower.find('req', max(pos + 3, last_end))
+        return rates
+
+    def extract(self, doc: Dict) -> Dict:
+        """
+        提取單個文檔並返回附帶元數據的新字典
+
+        :param doc: 含有 id、title、content 的文檔字典
+        :return: 附帶 metadata 的文檔字典
+        """
+        return {
+            'id': doc['id'],
+            'title': doc['title'],
+            'content': doc['content'],
+            'metadata': self.extract_metadata(doc.get('title', ''), doc['content'])
+        }
+
+    def extract_batch(self, documents: List[Dict], processes: Optional[int] = None,
+                      min_parallel_docs: int = 2000, chunksize: int = 256) -> List[Dict]:
+        """
+        批量提取元數據，文檔數量夠多時分散到進程池
+
+        :param documents: 文檔字典列表
+        :param processes: 進程數量，None 表示使用 CPU 核心數，1 表示不使用進程池
+        :param min_parallel_docs: 少於此數量時直接在當前進程處理，避免進程啟動成本
+        :param chunksize: 每次派發給子進程的文檔數量
+        :return: 附帶 metadata 的文檔字典列表，順序與輸入一致
+        """
+        processes = processes or os.cpu_count() or 1
+        if processes == 1 or len(documents) < min_parallel_docs:
+            return [self.extract(doc) for doc in documents]
+
+        # 子進程只回傳元數據，不把內容再序列化回主進程
+        titles = [doc.get('title', '') for doc in documents]
+        contents = [doc['content'] for doc in documents]
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            metadatas = executor.map(_extract_in_worker, titles, contents, chunksize=chunksize)
+            return [
+                {'id': doc['id'], 'title': doc['title'], 'content': doc['content'], 'metadata': metadata}
+                for doc, metadata in zip(documents, metadatas)
+            ]
+
+
+# 子進程共用的提取器，避免每個任務都序列化一次
+_worker_extractor = MetadataExtractor()
+
+
+def _extract_in_worker(title: str, content: str) -> Dict:
+    return _worker_extractor.extract_metadata(title, content)
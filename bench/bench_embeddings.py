@@ -0,0 +1,160 @@
+"""
+Embedding backend throughput and quality comparison.
+比較各 Embedding 後端 (見 chunking/embedding_backends.py) 在 CPU 上的吞吐量，以及與參考後端的品質差異：
+同一句子的向量餘弦相似度、最近鄰重疊率 (recall@k)，以及語義切割斷點是否與參考後端一致。
+
+Runs fully offline: Hugging Face models must already be in the local cache (or
+--model-dir), ONNX models are read from --model-dir. Backends that cannot be loaded
+are recorded as skipped. Each backend spec is name[:int8].
+
+Usage:
+    python bench/bench_embeddings.py --backends huggingface,huggingface:int8,hashing
+    python bench/bench_embeddings.py --backends onnx,onnx:int8 --model-dir models/qwen3-embedding-onnx
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chunking"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embedding_backends import BackendConfig, create_backend
+from embedding_pool import EMBEDDING_MODEL
+from semantic_batch import BatchedSemanticSplitter, SENTENCE_SPLIT_REGEX, combine_sentences
+from bench_pipeline import RssSampler
+from bench_semantic_split import make_chunks
+
+
+class LookupEmbeddings:
+    """Serves vectors computed during the throughput run, so the split comparison embeds nothing."""
+    def __init__(self, vectors: Dict[str, np.ndarray]):
+        self.vectors = vectors
+
+    def embed_documents(self, texts: List[str]) -> List[np.ndarray]:
+        return [self.vectors[t] for t in texts]
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.vectors[text]
+
+
+def sentence_windows(chunks: List[str]) -> List[str]:
+    """The distinct texts the semantic splitter embeds for these chunks, in first-seen order."""
+    texts = {}
+    for chunk in chunks:
+        sentences = re.split(SENTENCE_SPLIT_REGEX, chunk)
+        if len(sentences) > 1:
+            texts.update(dict.fromkeys(combine_sentences(sentences)))
+    return list(texts)
+
+
+def normalized(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def neighbor_recall(reference: np.ndarray, candidate: np.ndarray, k: int, queries: int) -> float:
+    """Mean overlap of each query's k nearest neighbours (by cosine) under both backends."""
+    ref, cand = normalized(reference), normalized(candidate)
+    rows = np.linspace(0, len(ref) - 1, min(queries, len(ref))).astype(int)
+    overlap = 0.0
+    for row in rows:
+        ref_scores, cand_scores = ref @ ref[row], cand @ cand[row]
+        ref_scores[row] = cand_scores[row] = -np.inf
+        ref_top = set(np.argpartition(-ref_scores, k)[:k])
+        cand_top = set(np.argpartition(-cand_scores, k)[:k])
+        overlap += len(ref_top & cand_top) / k
+    return overlap / len(rows)
+
+
+def run_backend(spec: str, args, texts: List[str]) -> Dict[str, Any]:
+    name, _, quantize = spec.partition(":")
+    config = BackendConfig(model_name=args.model, threads=args.threads, batch_size=args.batch_size,
+                           model_dir=args.model_dir or "", quantize=quantize)
+    record: Dict[str, Any] = {"backend": spec}
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        try:
+            embeddings = create_backend(name, config)
+            embeddings.embed_documents(texts[:1])
+        except Exception as e:
+            print(f"{spec:<20} skipped ({type(e).__name__}: {e})")
+            return {**record, "skipped": f"{type(e).__name__}: {e}"}
+        record["load_seconds"] = round(time.perf_counter() - start, 3)
+        start = time.perf_counter()
+        vectors = []
+        for i in range(0, len(texts), args.batch_size):
+            vectors.extend(embeddings.embed_documents(texts[i:i + args.batch_size]))
+        seconds = time.perf_counter() - start
+    record.update({
+        "texts": len(texts),
+        "seconds": round(seconds, 3),
+        "texts_per_second": round(len(texts) / seconds, 1) if seconds > 0 else None,
+        "peak_rss_mb": round(rss.peak_rss / 2 ** 20, 1),
+        "vectors": np.asarray(vectors, dtype=np.float32),
+    })
+    return record
+
+
+def compare(reference: Dict[str, Any], record: Dict[str, Any], texts: List[str], chunks: List[str],
+            reference_splits: List[List[str]], k: int, queries: int):
+    ref, cand = reference["vectors"], record["vectors"]
+    if ref.shape == cand.shape:
+        record["mean_cosine_to_reference"] = round(float(np.mean(np.sum(normalized(ref) * normalized(cand), axis=1))), 4)
+    record[f"neighbor_recall@{k}"] = round(neighbor_recall(ref, cand, k, queries), 4)
+    splitter = BatchedSemanticSplitter(LookupEmbeddings(dict(zip(texts, cand))))
+    splits = splitter.split_texts(chunks)
+    record["same_semantic_splits"] = round(sum(a == b for a, b in zip(splits, reference_splits)) / len(chunks), 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="huggingface,huggingface:int8,onnx,onnx:int8,hashing")
+    parser.add_argument("--reference", help="backend spec the others are compared to (default: first that loads)")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--model-dir", help="local model directory (required for onnx)")
+    parser.add_argument("--chunks", type=int, default=200, help="oversized code chunks to take sentences from")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON results to this file")
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks, args.seed)
+    texts = sentence_windows(chunks)
+    print(f"{len(chunks)} chunks, {len(texts)} sentence windows to embed")
+
+    records = [run_backend(spec, args, texts) for spec in args.backends.split(",")]
+    loaded = [r for r in records if "vectors" in r]
+    reference: Optional[Dict[str, Any]] = next((r for r in loaded if r["backend"] == args.reference),
+                                               loaded[0] if loaded else None)
+    if reference is None:
+        raise SystemExit("no backend could be loaded")
+    reference_splits = BatchedSemanticSplitter(LookupEmbeddings(dict(zip(texts, reference["vectors"])))).split_texts(chunks)
+    for record in loaded:
+        compare(reference, record, texts, chunks, reference_splits, args.k, args.queries)
+
+    print(f"reference: {reference['backend']}")
+    print(f"{'backend':<20} {'texts/s':>10} {'load s':>8} {'peak MB':>8} {'cosine':>8} {f'recall@{args.k}':>10} {'splits':>8}")
+    for record in loaded:
+        cosine = record.get("mean_cosine_to_reference")
+        print(f"{record['backend']:<20} {record['texts_per_second'] or 0:>10,.1f} {record['load_seconds']:>8.2f}"
+              f" {record['peak_rss_mb']:>8.1f} {cosine if cosine is not None else '-':>8}"
+              f" {record[f'neighbor_recall@{args.k}']:>10} {record['same_semantic_splits']:>8}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"reference": reference["backend"], "texts": len(texts),
+                       "results": [{k: v for k, v in r.items() if k != "vectors"} for r in records]}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+"""
+End-to-end benchmark on a synthetic code corpus.
+以合成的 Groovy / Python / Java / TS 語料對整條流程做基準測試：量測 DocumentCollector、
+切片流程的每個節點、CodeChunker 與 CodeParser 的吞吐量與峰值 RSS，結果寫成 JSON 以便比較。
+
+Embeddings and Graphiti are replaced by deterministic local stand-ins, so no model
+download, Neo4j or network access is needed. Suites whose dependencies are missing
+are recorded as skipped instead of failing the run.
+
+Usage:
+    python bench/bench_pipeline.py --files-per-language 100 --lines 400 --out bench/results/run.json
+    python bench/bench_pipeline.py --compare bench/results/run.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNKING_DIR = os.path.join(ROOT, "chunking")
+REF_DIR = os.path.join(ROOT, "ref")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, CHUNKING_DIR)
+# The graph suite embeds with the deterministic hashing backend, never a downloaded model
+os.environ["CHUNKING_EMBEDDING_BACKEND"] = "hashing"
+
+EXTENSIONS = [".groovy", ".py", ".java", ".ts"]
+
+
+# --- Synthetic corpus ---
+
+def _python_unit(rng: random.Random, n: int, body_lines: int) -> List[str]:
+    if rng.random() < 0.3:
+        lines = [f"class Service{n}:", "    def __init__(self, root):", "        self.root = root", ""]
+        for m in range(rng.randint(1, 3)):
+            lines.append(f"    def load_{n}_{m}(self, name):")
+            lines.append(f"        path = os.path.join(self.root, name + '_{m}.json')")
+            lines += [f"        value_{i} = json.dumps({{'key': name, 'index': {i}}})" for i in range(body_lines // 3)]
+            lines += ["        with open(path) as f:", "            return json.load(f)", ""]
+        return lines
+    lines = [f"def handler_{n}(event, context=None):", f"    \"\"\"Handles event type {n}.\"\"\"",
+             "    started = datetime.now()", "    payload = json.loads(event['body'])"]
+    lines += [f"    payload['field_{i}'] = os.environ.get('FIELD_{i}', str({i}))" for i in range(body_lines)]
+    lines += ["    return {'status': 200, 'elapsed': str(datetime.now() - started)}", "", ""]
+    return lines
+
+
+def _groovy_unit(rng: random.Random, n: int, body_lines: int) -> List[str]:
+    lines = [f"def postIssue{n}(issueKey, String target) {{",
+             "    def issue = issueManager.getIssueObject(issueKey)",
+             "    def builder = new JsonBuilder()"]
+    lines += [f"    def cf{i} = customFieldManager.getCustomFieldObjectByName(\"Field {i}\")"
+              f"\n    builder.field{i} = issue.getCustomFieldValue(cf{i})?.toString()" for i in range(body_lines // 2)]
+    lines += ["    def conn = new URL(target).openConnection()", "    conn.setRequestMethod(\"POST\")",
+              "    log.warn(\"posted ${issue.key} -> ${conn.responseCode}\")", "}", ""]
+    return lines
+
+
+def _java_unit(rng: random.Random, n: int, body_lines: int) -> List[str]:
+    lines = [f"    public Map<String, Object> process{n}(Request request) {{",
+             "        Map<String, Object> result = new HashMap<>();"]
+    lines += [f"        result.put(\"field{i}\", request.getParameter(\"field{i}\"));" for i in range(body_lines)]
+    lines += ["        LOG.info(\"processed {}\", request.getId());", "        return result;", "    }", ""]
+    return lines
+
+
+def _ts_unit(rng: random.Random, n: int, body_lines: int) -> List[str]:
+    lines = [f"export interface Payload{n} {{"]
+    lines += [f"  field{i}: string;" for i in range(min(body_lines, 8))]
+    lines += ["}", "", f"export async function send{n}(client: HttpClient, payload: Payload{n}): Promise<number> {{"]
+    lines += [f"  const value{i} = payload.field{i % 8} ?? '{i}';" for i in range(body_lines)]
+    lines += [f"  const response = await client.post('/api/v1/items/{n}', payload);",
+              "  return response.status;", "}", ""]
+    return lines
+
+
+_LANGUAGES = {
+    ".py": (["import os", "import json", "from datetime import datetime", "", ""], _python_unit),
+    ".groovy": (["import com.atlassian.jira.component.ComponentAccessor", "import groovy.json.JsonBuilder", "",
+                 "def issueManager = ComponentAccessor.getIssueManager()",
+                 "def customFieldManager = ComponentAccessor.getCustomFieldManager()", ""], _groovy_unit),
+    ".java": (["package com.example.bench;", "", "import java.util.HashMap;", "import java.util.Map;", "",
+               "public class Handler {", "    private static final Logger LOG = LoggerFactory.getLogger(Handler.class);",
+               ""], _java_unit),
+    ".ts": (["import { HttpClient } from './http';", ""], _ts_unit),
+}
+
+
+def make_source(ext: str, lines: int, rng: random.Random) -> str:
+    """Builds one file of roughly `lines` lines; about one unit in ten is long enough to need semantic splitting."""
+    header, unit = _LANGUAGES[ext]
+    out = list(header)
+    n = 0
+    while len(out) < lines:
+        body_lines = rng.randint(40, 80) if rng.random() < 0.1 else rng.randint(3, 15)
+        out += unit(rng, n, body_lines)
+        n += 1
+    if ext == ".java":
+        out.append("}")
+    return "\n".join(out) + "\n"
+
+
+def write_corpus(out_dir: str, files_per_language: int, lines: int, seed: int = 0) -> Dict[str, Any]:
+    """Writes the corpus under out_dir (nested a few directories deep) and returns its description."""
+    rng = random.Random(seed)
+    total_bytes = 0
+    count = 0
+    for ext in EXTENSIONS:
+        for i in range(files_per_language):
+            sub_dir = os.path.join(out_dir, ext.lstrip("."), f"module{i % 10}")
+            os.makedirs(sub_dir, exist_ok=True)
+            text = make_source(ext, rng.randint(lines // 2, lines * 3 // 2), rng)
+            with open(os.path.join(sub_dir, f"file{i}{ext}"), "w", encoding="utf-8") as f:
+                f.write(text)
+            total_bytes += len(text.encode("utf-8"))
+            count += 1
+    return {"files": count, "bytes": total_bytes, "files_per_language": files_per_language,
+            "lines": lines, "seed": seed, "extensions": EXTENSIONS}
+
+
+# --- Offline stand-ins ---
+
+class OfflineGraphiti:
+    """
+    Accepts episodes without a database; only counts them (after latency seconds per call)
+    and hands out new uuids, like Graphiti's AddBulkEpisodeResults.episodes.
+    """
+    episodes = 0
+    removed = 0
+    latency = 0.0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def add_episode_bulk(self, episodes, *args, **kwargs):
+        if OfflineGraphiti.latency:
+            await asyncio.sleep(OfflineGraphiti.latency)
+        OfflineGraphiti.episodes += len(episodes)
+        return SimpleNamespace(episodes=[SimpleNamespace(uuid=str(uuid.uuid4())) for _ in episodes])
+
+    async def remove_episode(self, episode_uuid):
+        if OfflineGraphiti.latency:
+            await asyncio.sleep(OfflineGraphiti.latency)
+        OfflineGraphiti.removed += 1
+
+    async def close(self):
+        pass
+
+
+async def offline_client(config) -> OfflineGraphiti:
+    """client_factory for GraphitiClientManager that never touches Neo4j."""
+    return OfflineGraphiti()
+
+
+# --- Measurement ---
+
+class RssSampler:
+    """Samples resident set size in a background thread to get the peak of one stage."""
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.start_rss = self.peak_rss = self.current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current_rss() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            # ru_maxrss is the process-wide peak (KiB on Linux, bytes on macOS)
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, self.current_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, self.current_rss())
+
+
+def measure(name: str, fn: Callable[[], Any], items: Callable[[Any], int], unit: str,
+            num_bytes: Optional[int] = None) -> Dict[str, Any]:
+    """Runs fn once with stdout silenced and returns its timing and memory record."""
+    with RssSampler() as rss, contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - start
+    count = items(result)
+    record = {
+        "name": name,
+        "seconds": round(seconds, 4),
+        "items": count,
+        "unit": unit,
+        "items_per_second": round(count / seconds, 2) if seconds > 0 else None,
+        "rss_start_mb": round(rss.start_rss / 2 ** 20, 1),
+        "peak_rss_mb": round(rss.peak_rss / 2 ** 20, 1),
+    }
+    if num_bytes is not None:
+        record["bytes"] = num_bytes
+        record["mb_per_second"] = round(num_bytes / 2 ** 20 / seconds, 3) if seconds > 0 else None
+    print(f"{name:<32} {seconds:9.3f}s  {record['items_per_second'] or 0:12,.1f} {unit}/s"
+          f"  peak RSS {record['peak_rss_mb']:8.1f} MB")
+    return record
+
+
+def skipped(name: str, exc: BaseException) -> Dict[str, Any]:
+    print(f"{name:<32} skipped ({type(exc).__name__}: {exc})")
+    return {"name": name, "skipped": f"{type(exc).__name__}: {exc}"}
+
+
+# --- Suites ---
+
+def bench_collector(corpus_dir: str, corpus: Dict[str, Any], workers: int) -> List[Dict[str, Any]]:
+    try:
+        from Content_Collector import DocumentCollector
+    except ImportError as e:
+        return [skipped("collector.collect_documents", e)]
+    collector = DocumentCollector(corpus_dir, EXTENSIONS, max_workers=workers)
+    return [measure("collector.collect_documents", collector.collect_documents, len, "files", corpus["bytes"])]
+
+
+def bench_graph(corpus_dir: str, corpus: Dict[str, Any], ingest_latency: float = 0.0,
+                graph_backend: str = "offline") -> List[Dict[str, Any]]:
+    try:
+        import chuncking
+        from chunk_ledger import ChunkLedger
+        from graphiti_client import GraphitiClientManager, backend_factory, set_manager
+        from run_metrics import RunMetrics
+    except ImportError as e:
+        return [skipped("graph", e)]
+
+    # "offline" only counts episodes; "memory" also indexes them (see chunking/memory_graph.py)
+    factory = offline_client if graph_backend == "offline" else backend_factory(graph_backend)
+    set_manager(GraphitiClientManager(client_factory=factory, health_interval=0))
+    # Simulated round trip per add_episode_bulk call, so batch size and concurrency matter
+    OfflineGraphiti.latency = ingest_latency
+
+    def new_state(incremental: bool = False) -> Dict[str, Any]:
+        return {"file_path": corpus_dir, "documents": [], "analysis_results": {}, "chunks": [],
+                "incremental": incremental, "deleted_files": [], "manifest_updates": {}, "changed_paths": [],
+                "metrics": RunMetrics("bench", verbose=False, progress=False)}
+
+    # Nodes run one after another on the same state so each sees realistic input
+    state = new_state()
+    nodes = [
+        ("load_code", chuncking.load_code_node, lambda s: len(s["documents"]), "files", corpus["bytes"]),
+        ("analyze_code", chuncking.analyze_code_node, lambda s: len(s["documents"]), "files", None),
+        ("chunk_code", chuncking.chunk_code_node, lambda s: len(s["chunks"]), "chunks", None),
+        ("enrich_chunks", chuncking.enrich_chunks_node, lambda s: len(s["chunks"]), "chunks", None),
+        ("send_to_graphiti", chuncking.send_to_graphiti_node, lambda s: len(s["chunks"]), "chunks", None),
+    ]
+    results = []
+    for name, node, items, unit, num_bytes in nodes:
+        try:
+            results.append(measure(f"graph.{name}", lambda: node(state), items, unit, num_bytes))
+        except Exception as e:
+            results.append(skipped(f"graph.{name}", e))
+            return results
+    # Batch count, episodes/s and batch latency percentiles of the ingestion (see graphiti_ingest.py)
+    results[-1]["ingest"] = state["metrics"].extra.get("ingest")
+
+    def forget_ingested():
+        # Without the chunk ledger every measured run sends all chunks again, as before it existed
+        ledger_path = ChunkLedger(corpus_dir).path
+        if os.path.exists(ledger_path):
+            os.remove(ledger_path)
+
+    app = chuncking.create_chunking_graph()
+    forget_ingested()
+    results.append(measure("graph.invoke", lambda: app.invoke(new_state()),
+                           lambda s: len(s["chunks"]), "chunks", corpus["bytes"]))
+    # An incremental re-run over unchanged files: the manifest skips every file before it is loaded
+    results.append(measure("graph.invoke_unchanged", lambda: app.invoke(new_state(incremental=True)),
+                           lambda s: s["metrics"].counters.get("files_unchanged", 0), "files", corpus["bytes"]))
+    # Streaming mode keeps only counts in the state; peak RSS should stay flat as the corpus grows
+    streaming_app = chuncking.create_chunking_graph(streaming=True)
+    forget_ingested()
+    results.append(measure("graph.invoke_streaming", lambda: streaming_app.invoke(new_state()),
+                           lambda s: s["metrics"].counters.get("chunks_final", 0), "chunks", corpus["bytes"]))
+    return results
+
+
+def bench_ref_chunker(corpus_dir: str, token_limit: int) -> List[Dict[str, Any]]:
+    sys.path.insert(0, REF_DIR)
+    try:
+        from Chunker import CodeChunker
+        from CodeParser import CodeParser
+    except ImportError as e:
+        return [skipped("ref.CodeParser", e), skipped("ref.CodeChunker", e)]
+
+    # CodeParser has grammars for Python and TypeScript but not Groovy or Java
+    sources = []
+    for ext in ("py", "ts"):
+        ext_dir = os.path.join(corpus_dir, ext)
+        for dir_path, _, names in os.walk(ext_dir):
+            for name in names:
+                with open(os.path.join(dir_path, name), encoding="utf-8") as f:
+                    sources.append((ext, f.read()))
+    num_bytes = sum(len(code.encode("utf-8")) for _, code in sources)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        parser = CodeParser(["py", "ts"])
+    missing = [lang for lang in ("python", "typescript") if lang not in parser.languages]
+    if missing:
+        exc = RuntimeError(f"tree-sitter grammars not available: {', '.join(missing)}")
+        return [skipped("ref.CodeParser", exc), skipped("ref.CodeChunker", exc)]
+
+    def parse_all():
+        return [parser.get_lines_for_points_of_interest(code, ext) for ext, code in sources]
+
+    def chunk_all():
+        chunkers = {ext: CodeChunker(ext) for ext in ("py", "ts")}
+        return [chunkers[ext].chunk(code, token_limit) for ext, code in sources]
+
+    return [
+        measure("ref.CodeParser", parse_all, len, "files", num_bytes),
+        measure("ref.CodeChunker", chunk_all, len, "files", num_bytes),
+    ]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous_path: str, results: List[Dict[str, Any]]):
+    """Prints the throughput ratio of this run against a previous result file."""
+    with open(previous_path, encoding="utf-8") as f:
+        previous = {r["name"]: r for r in json.load(f)["results"]}
+    print(f"\ncompared with {previous_path}:")
+    for record in results:
+        old = previous.get(record["name"])
+        if not old or not old.get("items_per_second") or not record.get("items_per_second"):
+            continue
+        ratio = record["items_per_second"] / old["items_per_second"]
+        print(f"{record['name']:<32} {ratio:6.2f}x throughput"
+              f"  peak RSS {old['peak_rss_mb']:.1f} -> {record['peak_rss_mb']:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files-per-language", type=int, default=50)
+    parser.add_argument("--lines", type=int, default=300, help="average lines per file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="DocumentCollector threads")
+    parser.add_argument("--token-limit", type=int, default=256, help="CodeChunker token limit")
+    parser.add_argument("--suites", default="collector,graph,ref", help="comma separated subset")
+    parser.add_argument("--ingest-latency-ms", type=float, default=0.0,
+                        help="simulated latency of each offline add_episode_bulk call")
+    parser.add_argument("--graph-backend", default="offline", choices=["offline", "memory"],
+                        help="where the graph suite ingests to")
+    parser.add_argument("--corpus-dir", help="reuse or keep the corpus here instead of a temp dir")
+    parser.add_argument("--out", help="write the JSON results to this file")
+    parser.add_argument("--compare", help="previous JSON results to compare against")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="chunking-bench-")
+    # The manifest and other state go to a throwaway directory, never to the real one
+    os.environ["CHUNKING_STATE_DIR"] = os.path.join(work_dir, "state")
+    corpus_dir = args.corpus_dir or os.path.join(work_dir, "corpus")
+    try:
+        corpus = write_corpus(corpus_dir, args.files_per_language, args.lines, args.seed)
+        print(f"corpus: {corpus['files']} files, {corpus['bytes'] / 2 ** 20:.1f} MB in {corpus_dir}")
+
+        suites = set(args.suites.split(","))
+        results = []
+        if "collector" in suites:
+            results += bench_collector(corpus_dir, corpus, args.workers)
+        if "graph" in suites:
+            results += bench_graph(corpus_dir, corpus, args.ingest_latency_ms / 1000, args.graph_backend)
+        if "ref" in suites:
+            results += bench_ref_chunker(corpus_dir, args.token_limit)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "corpus": corpus,
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    if args.compare:
+        compare(args.compare, results)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Retrieval load test against the in-process graph store.
+以行程內的圖儲存 (chunking/memory_graph.py) 對檢索做負載測試：先把合成語料跑過整條切片流程匯入，
+再以多個並行請求發出 search，量測每秒查詢數、延遲百分位數，以及查詢能否找回其來源切片 (self-hit@k)。
+
+Queries are single lines taken from stored facts, so a good index returns the fact the
+line came from. --distinct N replays a pool of N questions with Zipf-skewed frequencies,
+like help-desk traffic, and --cache routes the searches through the chatbot's retrieval
+cache (chunking/retrieval_cache.py) to report its hit rate and saved latency. No Neo4j, model download or network access is needed: embeddings use
+the hashing backend unless CHUNKING_EMBEDDING_BACKEND is set.
+
+Usage:
+    python bench/bench_retrieval.py --files-per-language 50 --queries 2000 --concurrency 8
+    python bench/bench_retrieval.py --center --out bench/results/retrieval.json
+    python bench/bench_retrieval.py --queries 5000 --distinct 300 --cache
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_pipeline import write_corpus, RssSampler  # also puts chunking/ on sys.path
+
+from graphiti_client import GraphitiClientManager, backend_factory, set_manager
+from retrieval_cache import RetrievalCache
+from run_metrics import RunMetrics
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def ingest(corpus_dir: str) -> Dict[str, Any]:
+    import chuncking
+    state = {"file_path": corpus_dir, "documents": [], "analysis_results": {}, "chunks": [],
+             "incremental": False, "deleted_files": [], "manifest_updates": {}, "changed_paths": [],
+             "metrics": RunMetrics("bench", verbose=False, progress=False)}
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        state = chuncking.create_chunking_graph().invoke(state)
+    return {"seconds": round(time.perf_counter() - start, 3), "chunks": len(state["chunks"]),
+            "ingest": state["metrics"].extra.get("ingest")}
+
+
+def make_queries(client: Any, count: int, rng: random.Random) -> List[Dict[str, str]]:
+    """(query, expected fact uuid, source node uuid) from random lines of random stored facts."""
+    edges = list(client.edges.values())
+    queries = []
+    while len(queries) < count:
+        edge = rng.choice(edges)
+        lines = [line.strip() for line in edge.fact.splitlines() if len(line.split()) >= 3]
+        if lines:
+            queries.append({"query": rng.choice(lines), "expected": edge.uuid, "node": edge.source_node_uuid})
+    return queries
+
+
+def repeat_queries(pool: List[Dict[str, str]], count: int, rng: random.Random) -> List[Dict[str, str]]:
+    """count draws from pool where the i-th question is asked ~1/(i+1) as often as the first."""
+    return rng.choices(pool, weights=[1 / (rank + 1) for rank in range(len(pool))], k=count)
+
+
+async def run_queries(manager: GraphitiClientManager, queries: List[Dict[str, str]], concurrency: int,
+                      num_results: int, center: bool, cache: Optional[RetrievalCache] = None) -> Dict[str, Any]:
+    latencies: List[float] = []
+    hits = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(query: Dict[str, str]):
+        nonlocal hits
+        async with semaphore:
+            start = time.perf_counter()
+            center_node_uuid = query["node"] if center else None
+            if cache is not None:
+                edges = await cache.search(manager, query["query"], center_node_uuid=center_node_uuid,
+                                           num_results=num_results)
+            else:
+                edges = await manager.arun(lambda client: client.search(
+                    query["query"], center_node_uuid=center_node_uuid, num_results=num_results))
+            latencies.append(time.perf_counter() - start)
+            hits += any(edge.uuid == query["expected"] for edge in edges)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(query) for query in queries))
+    seconds = time.perf_counter() - start
+    return {
+        "queries": len(queries),
+        "seconds": round(seconds, 3),
+        "queries_per_second": round(len(queries) / seconds, 1) if seconds > 0 else None,
+        "latency_p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        f"self_hit@{num_results}": round(hits / len(queries), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files-per-language", type=int, default=50)
+    parser.add_argument("--lines", type=int, default=300, help="average lines per file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8, help="searches in flight at once")
+    parser.add_argument("--num-results", type=int, default=5)
+    parser.add_argument("--center", action="store_true", help="rerank around the query's source file node")
+    parser.add_argument("--distinct", type=int, default=0,
+                        help="ask only this many distinct questions, Zipf-distributed (0: every query differs)")
+    parser.add_argument("--cache", action="store_true", help="search through the retrieval cache")
+    parser.add_argument("--out", help="write the JSON results to this file")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="chunking-retrieval-")
+    os.environ["CHUNKING_STATE_DIR"] = os.path.join(work_dir, "state")
+    manager = GraphitiClientManager(client_factory=backend_factory("memory"), health_interval=0)
+    set_manager(manager)
+    try:
+        corpus = write_corpus(os.path.join(work_dir, "corpus"), args.files_per_language, args.lines, args.seed)
+        with RssSampler() as rss:
+            ingested = ingest(os.path.join(work_dir, "corpus"))
+        print(f"ingested {ingested['chunks']} chunks from {corpus['files']} files in {ingested['seconds']:.2f}s"
+              f" (peak RSS {rss.peak_rss / 2 ** 20:.1f} MB)")
+        rng = random.Random(args.seed)
+        if args.distinct:
+            queries = repeat_queries(make_queries(manager.client, args.distinct, rng), args.queries, rng)
+        else:
+            queries = make_queries(manager.client, args.queries, rng)
+        cache = RetrievalCache() if args.cache else None
+        searched = asyncio.run(run_queries(manager, queries, args.concurrency, args.num_results, args.center, cache))
+        print(f"{searched['queries']} searches: {searched['queries_per_second']:,.1f}/s"
+              f"  p50 {searched['latency_p50_ms']} ms  p95 {searched['latency_p95_ms']} ms"
+              f"  p99 {searched['latency_p99_ms']} ms  self-hit@{args.num_results}"
+              f" {searched[f'self_hit@{args.num_results}']}")
+        if cache is not None:
+            searched["cache"] = cache.stats()
+            print(f"retrieval cache: hit rate {searched['cache']['hit_rate']}, {searched['cache']['coalesced']}"
+                  f" coalesced, saved {searched['cache']['saved_latency_seconds']:.2f}s of search time")
+        report = {"corpus": corpus, "args": vars(args), "ingest": ingested, "search": searched,
+                  "store": manager.stats().get("client")}
+    finally:
+        manager.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Per-chunk vs batched semantic splitting.
+比較逐區塊語義切割 (每個超大區塊一次 Embedding 呼叫) 與整批語義切割的吞吐量，並檢查兩者輸出一致。
+
+Without --model the deterministic hashing backend from embedding_backends.py is used;
+--call-overhead-ms adds a fixed cost per embed_documents call to mimic model dispatch.
+
+Usage:
+    python bench/bench_semantic_split.py --chunks 2000 --call-overhead-ms 5
+    python bench/bench_semantic_split.py --chunks 500 --model Qwen/Qwen3-Embedding-0.6B
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chunking"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from semantic_batch import BatchedSemanticSplitter, SENTENCE_SPLIT_REGEX, combine_sentences
+from embedding_backends import HashingEmbeddings
+from bench_pipeline import make_source
+
+
+class CountingEmbeddings:
+    """Wraps an Embeddings object, counting calls and optionally adding per-call latency."""
+    def __init__(self, embeddings, call_overhead: float = 0.0):
+        self.embeddings = embeddings
+        self.call_overhead = call_overhead
+        self.calls = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        if self.call_overhead:
+            time.sleep(self.call_overhead)
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def per_chunk_split(embeddings, text: str, percentile: float = 95.0) -> List[str]:
+    """SemanticChunker.split_text with breakpoint_threshold_type="percentile": one embedding call per text."""
+    sentences = re.split(SENTENCE_SPLIT_REGEX, text)
+    if len(sentences) == 1:
+        return sentences
+    vectors = embeddings.embed_documents(combine_sentences(sentences))
+    distances = []
+    for current, nxt in zip(vectors, vectors[1:]):
+        a, b = np.asarray(current, dtype=np.float64), np.asarray(nxt, dtype=np.float64)
+        denom = np.linalg.norm(a) * np.linalg.norm(b)
+        distances.append(1.0 - (float(a @ b) / denom if denom else 0.0))
+    threshold = np.percentile(distances, percentile)
+    chunks, start = [], 0
+    for index in [i for i, d in enumerate(distances) if d > threshold]:
+        chunks.append(" ".join(sentences[start:index + 1]))
+        start = index + 1
+    if start < len(sentences):
+        chunks.append(" ".join(sentences[start:]))
+    return chunks
+
+
+def make_chunks(count: int, seed: int) -> List[str]:
+    """Oversized (1500-4000 character) code chunks with comment sentences to split on."""
+    rng = random.Random(seed)
+    chunks = []
+    while len(chunks) < count:
+        source = make_source(rng.choice([".py", ".groovy", ".java", ".ts"]), 200, rng)
+        lines = source.split("\n")
+        for i in range(0, len(lines), 10):
+            lines.insert(i, f"// Step {i}. Validate the payload. Retry on failure!")
+        text = "\n".join(lines)
+        for start in range(0, len(text) - 1500, 3000):
+            chunks.append(text[start:start + rng.randint(1500, 4000)])
+    return chunks[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--call-overhead-ms", type=float, default=0.0)
+    parser.add_argument("--model", help="use this Hugging Face model through embedding_pool instead of the stand-in")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.model:
+        from embedding_pool import get_embeddings
+        base = get_embeddings(args.model, backend="huggingface").warm_up()
+    else:
+        base = HashingEmbeddings()
+    chunks = make_chunks(args.chunks, args.seed)
+    print(f"{len(chunks)} chunks, {sum(map(len, chunks)) / 1e6:.1f} M chars")
+
+    per_chunk = CountingEmbeddings(base, args.call_overhead_ms / 1000)
+    start = time.perf_counter()
+    expected = [per_chunk_split(per_chunk, text) for text in chunks]
+    per_chunk_seconds = time.perf_counter() - start
+
+    batched = CountingEmbeddings(base, args.call_overhead_ms / 1000)
+    splitter = BatchedSemanticSplitter(batched, batch_size=args.batch_size)
+    start = time.perf_counter()
+    actual = splitter.split_texts(chunks)
+    batched_seconds = time.perf_counter() - start
+
+    for label, seconds, calls in (("per-chunk", per_chunk_seconds, per_chunk.calls),
+                                  ("batched", batched_seconds, batched.calls)):
+        print(f"{label:<10} {seconds:8.3f}s  {len(chunks) / seconds:10,.1f} chunks/sec  {calls:6d} embedding calls")
+    print(f"speedup    {per_chunk_seconds / batched_seconds:.2f}x")
+    if actual != expected:
+        raise SystemExit("batched output differs from per-chunk splitting")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,9 @@
 Agentic RAG pipeline with LangChain, LangGraph, Graphiti
 """
 import asyncio
-import os
 import uuid
 from datetime import datetime, timezone
-from typing import TypedDict, Annotated
+from typing import Optional, TypedDict, Annotated
 
 from typing import TYPE_CHECKING
 
@@ -14,30 +13,35 @@ from langchain_openai import ChatOpenAI
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import StateGraph, END, START, add_messages
 from langchain_core.messages import AIMessage, SystemMessage, HumanMessage
-from graphiti_core import Graphiti
 from graphiti_core.nodes import EpisodeType
 from graphiti_core.edges import EntityEdge
 
+from graphiti_client import GraphitiClientManager, get_manager
+from retrieval_cache import (RetrievalCache, get_retrieval_cache, invalidate_retrieval_cache,
+                             RETRIEVAL_CACHE_INVALIDATE_ON_CHAT)
+
 class RagState(TypedDict):
     messages: Annotated[list, add_messages]
     user_name: str
     user_node_uuid: str
 
 
-async def build_graphiti_client():
-    neo4j_uri = os.environ.get("NEO4J_URI", "bolt://localhost:7687")
-    neo4j_user = os.environ.get("NEO4J_USER", "neo4j")
-    neo4j_password = os.environ.get("NEO4J_PASSWORD", "password")
-    return Graphiti(neo4j_uri, neo4j_user, neo4j_password)
+async def build_graphiti_client() -> GraphitiClientManager:
+    """共用整個行程的 Graphiti 客戶端 (見 graphiti_client.py)，不再為每個 agent 建立新連線"""
+    return await get_manager().astart()
 
 
-async def chatbot(state: RagState, client: Graphiti, llm) -> dict:
+async def chatbot(state: RagState, graphiti: GraphitiClientManager, llm,
+                  cache: Optional[RetrievalCache] = None) -> dict:
     facts_string = None
     last_message = None
+    cache = cache or get_retrieval_cache()
     if len(state["messages"]) > 0:
         last_message = state["messages"][-1]
         graphiti_query = f'{state["user_name"]}: {last_message.content}'
-        edge_results = await client.search(graphiti_query, center_node_uuid=state["user_node_uuid"], num_results=5)
+        # Repeated questions are answered from the retrieval cache (see retrieval_cache.py)
+        edge_results = await cache.search(graphiti, graphiti_query, center_node_uuid=state["user_node_uuid"],
+                                          num_results=5)
         facts_string = "-" + "\n-".join([edge.fact for edge in edge_results])
 
     system_message = SystemMessage(
@@ -48,8 +52,9 @@ async def chatbot(state: RagState, client: Graphiti, llm) -> dict:
     response = await llm.ainvoke(messages)
 
     if last_message:
-        asyncio.create_task(
-            client.add_episode(
+        # Fire and forget on the client's own loop, like the previous create_task
+        future = graphiti.submit(
+            lambda client: client.add_episode(
                 name="Chatbot Response",
                 episode_body=f"{state['user_name']}:{last_message.content}\nAgent:{response.content}",
                 source=EpisodeType.message,
@@ -57,6 +62,8 @@ async def chatbot(state: RagState, client: Graphiti, llm) -> dict:
                 source_description="Agentic Rag Bot",
             )
         )
+        if RETRIEVAL_CACHE_INVALIDATE_ON_CHAT:
+            future.add_done_callback(lambda f: invalidate_retrieval_cache())
     return {"messages": [response]}
 
 
@@ -64,7 +71,7 @@ async def init_agent():
     # init llm
     llm = ChatOpenAI(model="gpt-5-mini", temperature=0)
     memory = MemorySaver()
-    client = await build_graphiti_client()
+    graphiti = await build_graphiti_client()
 
     graph_builder = StateGraph(RagState)
 
@@ -72,7 +79,7 @@ async def init_agent():
         return {"messages": [AIMessage(content="Hello, how can I help you today?")]}
 
     async def agent_fn(state: RagState):
-        return await chatbot(state, client, llm)
+        return await chatbot(state, graphiti, llm)
 
     graph_builder.add_node("start", start_fn)
     graph_builder.add_node("agent", agent_fn)
@@ -102,4 +109,7 @@ if __name__ == "__main__":
                         last = msgs[-1]
                         print(getattr(last, "content", last))
 
-    asyncio.run(main())
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    finally:
+        get_manager().close()
\ No newline at end of file
@@ -2,22 +2,64 @@
 FastAPI service integrating Chunking pipeline + Graphiti (Agentic RAG)
 """
 from fastapi import FastAPI, UploadFile, File, Form
-from typing import List
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import List, Optional
 import asyncio
 import os
 from pathlib import Path
 
 from chuncking import create_chunking_graph, GraphState
+from embedding_pool import warm_up, registry, get_embeddings
+from graphiti_client import get_manager
+from symbol_table import SymbolTable
+from checkpoints import CHECKPOINTS_ENABLED, list_runs, new_run_id
+from graphiti_ingest import IngestError
+from retrieval_cache import get_retrieval_cache
+from run_lock import RunLock
 from agentic_rag import init_agent, RagState
 
-app = FastAPI(title="Agnetic RAG API")
-
 # Initialize global components
 chunking_app = create_chunking_graph()
+# CHUNKING_EMBEDDING_WARMUP=0 defers the model load to the first semantic split
+EMBEDDING_WARMUP = os.environ.get("CHUNKING_EMBEDDING_WARMUP", "1") == "1"
+# CHUNKING_GRAPHITI_CONNECT=0 defers creating the Graphiti client to the first request that needs it
+GRAPHITI_CONNECT = os.environ.get("CHUNKING_GRAPHITI_CONNECT", "1") == "1"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    預先載入共用的 Embedding 模型並建立共用的 Graphiti 客戶端 (連線池)，
+    避免第一個請求負擔載入與連線時間；關閉服務時釋放兩者
+    """
+    graphiti = get_manager()
+    if EMBEDDING_WARMUP:
+        await asyncio.to_thread(warm_up)
+    if GRAPHITI_CONNECT:
+        await graphiti.astart()
+        # A database that is down is reported by /health instead of failing startup
+        await graphiti.ahealth()
+    try:
+        yield
+    finally:
+        await asyncio.to_thread(graphiti.close)
+        registry.close_all()
+
+
+app = FastAPI(title="Agnetic RAG API", lifespan=lifespan)
+
 
 @app.post("/upload")
-async def upload_code():
-    """批量載入 docs/ 目錄內符合副檔名的文件，並送入 chunking pipeline"""
+async def upload_code(full: bool = False, resume: bool = False, run_id: Optional[str] = None):
+    """
+    批量載入 docs/ 目錄內符合副檔名的文件，並送入 chunking pipeline
+    預設只處理自上次匯入後新增或修改的文件；full=true 時強制完整重建
+    resume=true 時接續 run_id (未指定則為最近一次未完成的執行)，跳過已完成的階段與文件；
+    需設定 CHUNKING_CHECKPOINTS=1 (預設不寫檢查點，失敗後重跑仍只處理未匯入的文件)
+    已有流程在執行中 (本服務、watcher 或命令列) 時回傳 409，不會同時執行
+    """
     docs_dir = Path("docs")
     if not docs_dir.exists():
         return {"status": "error", "message": "docs/ 資料夾不存在"}
@@ -26,11 +68,76 @@ async def upload_code():
         "file_path": str(docs_dir),
         "documents": [],
         "analysis_results": {},
-        "chunks": []
+        "chunks": [],
+        "incremental": not full,
+        "deleted_files": [],
+        "manifest_updates": {},
+        "resume": resume,
     }
-    final_state = chunking_app.invoke(state)
-    num_chunks = len(final_state.get("chunks", []))
-    return {"status": "ok", "scanned_dir": str(docs_dir), "chunks": num_chunks}
+    if CHECKPOINTS_ENABLED and (run_id or not resume):
+        # Named up front so a failed run can be resumed by its run_id
+        state["run_id"] = run_id or new_run_id()
+    # Concurrent runs would overwrite each other's manifest, ledger and symbol table
+    lock = RunLock()
+    if not lock.acquire(blocking=False):
+        return JSONResponse(status_code=409, content={"status": "busy", "message": "已有切片流程正在執行，請稍後再試"})
+    # The graph is synchronous; running it in a thread keeps /health and /query responsive
+    try:
+        final_state = await asyncio.to_thread(chunking_app.invoke, state)
+    except IngestError as e:
+        # Files of the failed batches were not recorded as ingested; resume=true retries only them
+        return {"status": "error", "message": str(e), "run_id": state.get("run_id"), "failures": e.failures}
+    finally:
+        lock.release()
+    # The streaming graph does not keep documents and chunks in the state, only their counts
+    counters = final_state["metrics"].counters
+    num_chunks = len(final_state.get("chunks", [])) or counters.get("chunks_final", 0)
+    return {
+        "status": "ok",
+        "run_id": final_state.get("run_id"),
+        "scanned_dir": str(docs_dir),
+        "changed_files": len(final_state.get("documents", [])) or counters.get("files_loaded", 0),
+        "deleted_files": len(final_state.get("deleted_files", [])),
+        "chunks": num_chunks,
+        "metrics": final_state["metrics"].summary()
+    }
+
+
+@app.get("/health")
+async def health():
+    """Graphiti / Neo4j 連線狀態、Embedding 模型是否已載入，以及聊天檢索快取的命中率"""
+    graphiti = get_manager()
+    neo4j = await graphiti.ahealth()
+    return {
+        "status": neo4j["status"],
+        "neo4j": neo4j,
+        "graphiti": graphiti.stats(),
+        "retrieval_cache": get_retrieval_cache().stats(),
+        "embedding_loaded": get_embeddings().loaded,
+    }
+
+
+@app.get("/runs")
+async def list_checkpoint_runs():
+    """列出磁碟上的執行檢查點 (未完成的執行可用 /upload?resume=true 接續)"""
+    return {"runs": [{k: meta.get(k) for k in ("run_id", "status", "file_path", "created_at", "updated_at",
+                                                  "completed_stages")} for meta in list_runs()]}
+
+
+@app.get("/symbols")
+async def find_symbols(name: str, path: Optional[str] = None):
+    """
+    以名稱 (method 或 Class.method) 查詢最近一次匯入的符號表；可用 path 限定文件
+    path 可為相對於 docs/ 的路徑 (如 pkg/a.py)，或 docs/ 底下文件的任意寫法 (docs/pkg/a.py、絕對路徑)
+    """
+    docs_dir = Path("docs")
+    table = SymbolTable.load(str(docs_dir))
+    if path is not None:
+        symbol = table.find_in_file(path, name) or table.find_in_file(str(docs_dir / path), name)
+        symbols = [symbol] if symbol else []
+    else:
+        symbols = table.lookup(name)
+    return {"symbols": [{"qualified_name": s.qualified_name, **asdict(s)} for s in symbols]}
 
 
 @app.post("/query")
@@ -0,0 +1,236 @@
+"""
+Durable per-run stage checkpoints for the chunking graph.
+切片流程的持久化階段檢查點：每次執行有一個 run ID，各階段完成時記錄在 meta.json，
+切片與補充後的切片則逐文件寫到磁碟。執行失敗後以 resume 模式重跑同一個 run ID，
+已完成的階段與已處理過的文件都會直接從檢查點讀回，不必重新計算 Embedding。
+
+Per-file outputs are keyed by the file's content hash, so a file edited between the
+failed run and the resume is processed again instead of being served stale chunks.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from langchain_core.documents import Document
+
+from manifest import STATE_DIR
+
+CHECKPOINT_DIR = os.environ.get("CHUNKING_CHECKPOINT_DIR", os.path.join(STATE_DIR, "checkpoints"))
+# CHUNKING_CHECKPOINTS=1 enables checkpoints (and therefore resume); they write every
+# chunk to disk a second time, so runs without them are cheaper
+CHECKPOINTS_ENABLED = os.environ.get("CHUNKING_CHECKPOINTS", "0") == "1"
+# Keep the checkpoints of successful runs instead of deleting them
+CHECKPOINT_KEEP = os.environ.get("CHUNKING_CHECKPOINT_KEEP", "0") == "1"
+# Unfinished runs kept on disk; older ones are pruned when a new run starts
+CHECKPOINT_MAX_RUNS = int(os.environ.get("CHUNKING_CHECKPOINT_MAX_RUNS", "5"))
+# Files chunked and ingested between two checkpoint writes in the batch graph
+CHECKPOINT_GROUP_FILES = int(os.environ.get("CHUNKING_CHECKPOINT_GROUP_FILES", "64"))
+
+
+def new_run_id() -> str:
+    return f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{uuid.uuid4().hex[:8]}"
+
+
+def _file_key(path: str, sha: str) -> str:
+    return hashlib.sha1(f"{path}\0{sha}".encode("utf-8")).hexdigest()
+
+
+def _write_json(path: str, payload: Any):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, default=str)
+    os.replace(tmp_path, path)
+
+
+class CheckpointStore:
+    """
+    The checkpoint directory of one run: STATE_DIR/checkpoints/<run_id>/.
+    單次執行的檢查點目錄。
+
+    meta.json holds the plan (changed path -> sha256, deletions), the completed stages
+    and the files already ingested; <stage>.json holds a completed stage's output and
+    <stage>/<sha1(path, sha256)>.json one file's documents.
+    """
+    def __init__(self, run_id: str, directory: str = CHECKPOINT_DIR):
+        self.run_id = run_id
+        self.path = os.path.join(directory, run_id)
+        self._lock = threading.Lock()
+        self.meta: Dict[str, Any] = {"run_id": run_id, "status": "running", "plan": None,
+                                     "completed_stages": [], "ingested": {}}
+        meta_path = os.path.join(self.path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                self.meta.update(json.load(f))
+        # path -> sha256 of the content that was ingested
+        self._ingested: Dict[str, str] = dict(self.meta["ingested"])
+
+    @classmethod
+    def create(cls, file_path: str, run_id: Optional[str] = None, directory: str = CHECKPOINT_DIR,
+               max_runs: int = CHECKPOINT_MAX_RUNS) -> "CheckpointStore":
+        prune(directory, max_runs - 1)
+        store = cls(run_id or new_run_id(), directory)
+        store.meta.update({"file_path": file_path, "created_at": datetime.now(timezone.utc).isoformat()})
+        store._save_meta()
+        return store
+
+    @classmethod
+    def latest(cls, file_path: str, directory: str = CHECKPOINT_DIR) -> Optional["CheckpointStore"]:
+        """The most recent unfinished run over file_path (any spelling of it), if any."""
+        real_path = os.path.realpath(file_path)
+        for meta in reversed(list_runs(directory)):
+            if (meta.get("status") != "done" and meta.get("file_path")
+                    and os.path.realpath(meta["file_path"]) == real_path):
+                return cls(meta["run_id"], directory)
+        return None
+
+    def _save_meta(self):
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            self.meta["ingested"] = dict(self._ingested)
+            self.meta["updated_at"] = datetime.now(timezone.utc).isoformat()
+            _write_json(os.path.join(self.path, "meta.json"), self.meta)
+
+    # --- plan and stages ---
+    def set_plan(self, changed: Dict[str, str], deleted: Iterable[str]):
+        """
+        Records what this run has to do. A different plan than the one on disk (files
+        changed again before the resume) invalidates the completed stages, but per-file
+        outputs stay usable for every file whose hash still matches.
+        """
+        plan = {"changed": changed, "deleted": sorted(deleted)}
+        if self.meta.get("plan") != plan:
+            self.meta["plan"] = plan
+            self.meta["completed_stages"] = []
+        self._save_meta()
+
+    def sha_of(self, path: str) -> Optional[str]:
+        plan = self.meta.get("plan") or {}
+        return plan.get("changed", {}).get(path)
+
+    def stage_done(self, stage: str) -> bool:
+        return stage in self.meta["completed_stages"]
+
+    def stage_output(self, stage: str) -> Any:
+        """The output stored by complete_stage, or None."""
+        try:
+            with open(self.artifact_path(f"{stage}.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def complete_stage(self, stage: str, output: Any = None):
+        """Marks stage as done, first saving its JSON-serializable output when given."""
+        if output is not None:
+            os.makedirs(self.path, exist_ok=True)
+            _write_json(self.artifact_path(f"{stage}.json"), output)
+        if stage not in self.meta["completed_stages"]:
+            self.meta["completed_stages"].append(stage)
+        self._save_meta()
+
+    def artifact_path(self, name: str) -> str:
+        """A path inside this run's directory for other stage data (e.g. a symbol table snapshot)."""
+        return os.path.join(self.path, name)
+
+    # --- per-file documents ---
+    def _file_path(self, stage: str, path: str) -> Optional[str]:
+        sha = self.sha_of(path)
+        if sha is None:
+            return None
+        return os.path.join(self.path, stage, f"{_file_key(path, sha)}.json")
+
+    def has_file(self, stage: str, path: str) -> bool:
+        file_path = self._file_path(stage, path)
+        return file_path is not None and os.path.exists(file_path)
+
+    def get_file(self, stage: str, path: str) -> Optional[List[Document]]:
+        """The documents saved for path at stage, or None when missing or saved for other content."""
+        file_path = self._file_path(stage, path)
+        if file_path is None or not os.path.exists(file_path):
+            return None
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            # A corrupt checkpoint only costs recomputing the file
+            return None
+        if payload.get("path") != path:
+            return None
+        return [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in payload["documents"]]
+
+    def put_file(self, stage: str, path: str, documents: List[Document]):
+        file_path = self._file_path(stage, path)
+        if file_path is None:
+            return
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        _write_json(file_path, {
+            "path": path,
+            "sha256": self.sha_of(path),
+            "documents": [{"page_content": d.page_content, "metadata": d.metadata} for d in documents],
+        })
+
+    # --- ingestion ---
+    def is_ingested(self, path: str) -> bool:
+        sha = self.sha_of(path)
+        return sha is not None and self._ingested.get(path) == sha
+
+    def mark_ingested(self, paths: Iterable[str]):
+        with self._lock:
+            self._ingested.update((path, self.sha_of(path)) for path in paths)
+        self._save_meta()
+
+    def finish(self, keep: bool = CHECKPOINT_KEEP):
+        """Marks the run as done; its per-file data is deleted unless keep is True."""
+        self.meta["status"] = "done"
+        if keep:
+            self._save_meta()
+            return
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def list_runs(directory: str = CHECKPOINT_DIR) -> List[Dict[str, Any]]:
+    """meta.json of every run in directory, oldest first."""
+    runs = []
+    if not os.path.isdir(directory):
+        return runs
+    for name in os.listdir(directory):
+        meta_path = os.path.join(directory, name, "meta.json")
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                runs.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    runs.sort(key=lambda meta: meta.get("created_at", ""))
+    return runs
+
+
+def prune(directory: str = CHECKPOINT_DIR, keep: int = CHECKPOINT_MAX_RUNS):
+    """Deletes all but the keep most recent runs."""
+    runs = list_runs(directory)
+    for meta in runs[:max(0, len(runs) - keep)]:
+        shutil.rmtree(os.path.join(directory, meta["run_id"]), ignore_errors=True)
+
+
+def open_checkpoint(file_path: str, run_id: Optional[str] = None, resume: bool = False,
+                    enabled: Optional[bool] = None) -> Optional[CheckpointStore]:
+    """
+    The store for a graph run: run_id's store when given, the latest unfinished run over
+    file_path when resuming without a run_id, otherwise a new run. None when disabled
+    (enabled defaults to CHUNKING_CHECKPOINTS).
+    """
+    if not (CHECKPOINTS_ENABLED if enabled is None else enabled):
+        return None
+    if run_id:
+        store = CheckpointStore(run_id)
+        if store.meta.get("plan") is None:
+            return CheckpointStore.create(file_path, run_id)
+        return store
+    if resume:
+        store = CheckpointStore.latest(file_path)
+        if store is not None:
+            return store
+    return CheckpointStore.create(file_path)
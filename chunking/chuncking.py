@@ -1,82 +1,45 @@
-import ast
 import os
 import shutil
-from typing import List, Dict, Any, TypedDict, Annotated
+from concurrent.futures import Executor
+from typing import List, Dict, Any, Iterator, Optional, Tuple, TypedDict, Annotated
 
 from langchain_community.document_loaders import DirectoryLoader, TextLoader
 from langchain_core.documents import Document
 from langchain_experimental.text_splitter import SemanticChunker
-from langchain_huggingface import HuggingFaceEmbeddings
 # from langchain.text_splitter import RecursiveCharacterTextSplitter, Language
-from langchain_text_splitters.character import RecursiveCharacterTextSplitter
-from langchain_text_splitters.base import Language
 from langgraph.graph import StateGraph, END
 
-import asyncio
 from datetime import datetime, timezone
-from graphiti_core import Graphiti
 from graphiti_core.nodes import EpisodeType
 from graphiti_core.utils.bulk_utils import RawEpisode
-from graphiti_core.driver.neo4j_driver import Neo4jDriver
+
+from file_scanner import scan_files, has_extension, is_excluded
+from manifest import IngestManifest, ManifestDiff
+from run_metrics import RunMetrics, instrument_node
+from streaming_reader import iter_text_windows, should_stream
+from embedding_pool import get_embeddings
+from embedding_cache import cached_embeddings
+from semantic_batch import BatchedSemanticSplitter, SEMANTIC_BATCH, locate_sub_chunks
+from splitters import get_registry, extension_of
+from graphiti_ingest import BatchIngestor, IngestError, IngestReport
+from chunk_ledger import ChunkLedger, chunk_ids
 
 # 0. Global def
 extensions = [".py", ".java", ".groovy", ".kt", ".js", ".ts"]
+# Files larger than this (bytes) are skipped by the scanner; 0 disables the limit
+# 超過此大小 (bytes) 的文件會被略過；0 表示不限制
+MAX_FILE_SIZE = int(os.environ.get("CHUNKING_MAX_FILE_SIZE", "0")) or None
+# CHUNKING_STREAMING=1 runs files through overlapping stages instead of one node per stage (see streaming_pipeline.py)
+# CHUNKING_STREAMING=1 讓文件逐一流過重疊執行的各階段，而不是每個階段處理完全部文件才進入下一階段
+STREAMING = os.environ.get("CHUNKING_STREAMING", "0") == "1"
 
 
 # --- 1. Helper Class for Code Analysis ---
-class CodeAnalyzer(ast.NodeVisitor):
-    """
-    Analyzes a Python script using AST to find dependencies for each function and class.
-    使用 AST 分析 Python 腳本，找出每個函數和類的依賴項。
-    """
-    def __init__(self, source_code):
-        self.source_code = source_code
-        self.imports = {}  # alias -> module
-        self.dependencies = {}  # function/class name -> set of used modules
-        self.current_scope = None
-
-    def visit_Import(self, node):
-        for alias in node.names:
-            self.imports[alias.asname or alias.name] = alias.name.split('.')[0]
-        self.generic_visit(node)
-
-    def visit_ImportFrom(self, node):
-        module = node.module.split('.')[0] if node.module else ''
-        for alias in node.names:
-            self.imports[alias.asname or alias.name] = module
-        self.generic_visit(node)
-
-    def _track_dependencies(self, node):
-        scope_name = node.name
-        self.current_scope = scope_name
-        self.dependencies[scope_name] = set()
-        self.generic_visit(node)
-        self.current_scope = None
-
-    def visit_FunctionDef(self, node):
-        self._track_dependencies(node)
-
-    def visit_AsyncFunctionDef(self, node):
-        self._track_dependencies(node)
-
-    def visit_ClassDef(self, node):
-        self._track_dependencies(node)
-
-    def visit_Name(self, node):
-        if self.current_scope and node.id in self.imports:
-            self.dependencies[self.current_scope].add(self.imports[node.id])
-
-    def visit_Attribute(self, node):
-        # This handles cases like `pd.DataFrame` or `np.array`
-        if self.current_scope and isinstance(node.value, ast.Name) and node.value.id in self.imports:
-            self.dependencies[self.current_scope].add(self.imports[node.value.id])
-        self.generic_visit(node)
-
-    def analyze(self):
-        tree = ast.parse(self.source_code)
-        self.visit(tree)
-        # Convert sets to lists for JSON serialization
-        return {k: sorted(list(v)) for k, v in self.dependencies.items()}
+# CodeAnalyzer lives in code_analysis.py so process-pool workers can import it cheaply
+from code_analysis import CodeAnalyzer, AnalysisCache, analyze_sources, entry_error, ANALYSIS_WORKERS
+from symbol_table import SymbolTable
+from checkpoints import CheckpointStore, open_checkpoint, CHECKPOINT_GROUP_FILES
+from run_lock import RunLock
 
 
 # --- 2. LangGraph State Definition ---
@@ -87,216 +50,673 @@ class GraphState(TypedDict):
     """
     file_path: str
     documents: List[Document]
+    # Changed files above the stream threshold; chunk_code reads them window by window
+    # 超過串流門檻的變更文件，由 chunk_code 逐一視窗讀取並切片
+    streamed_files: List[str]
+    # Bare name -> dependencies, kept for callers of the original output; collisions overwrite
     analysis_results: Dict[str, List[str]]
+    # Symbols of the root keyed root-relative path::Class.method (see symbol_table.py)
+    symbol_table: SymbolTable
     chunks: List[Document]
+    # Incremental ingestion: only new/modified files are loaded when True
+    # 增量匯入: 為 True 時只載入新增或修改過的文件
+    incremental: bool
+    deleted_files: List[str]
+    manifest_updates: Dict[str, Dict[str, Any]]
+    # Counters, byte totals and stage timings for this run (see run_metrics.py)
+    metrics: RunMetrics
+    # Watch mode: only these paths are considered instead of scanning the tree
+    # 監看模式: 只處理這些路徑，不重新掃描整個目錄樹
+    changed_paths: List[str]
+    # Stage checkpoints (see checkpoints.py): resume=True continues run_id, or the latest
+    # unfinished run over file_path, reusing every stage and file it already completed
+    # 階段檢查點: resume=True 時接續 run_id (或同目錄最近一次未完成的執行)，已完成的階段與文件不再重做
+    run_id: str
+    resume: bool
+    checkpoint: CheckpointStore
 
 # --- 3. LangGraph Nodes ---
-def load_code_node(state: GraphState) -> GraphState:
+def plan_load(state: GraphState) -> ManifestDiff:
     """
-    Loads all specified script files from the directory using a recursive tree walk.
-    使用遞歸樹遍歷從目錄中加載所有指定的腳本文件。
+    Finds the files to (re)load: the changed paths in watch mode, otherwise a full scan,
+    compared against the ingestion manifest.
+    找出需要載入的文件：監看模式下為變更的路徑，否則掃描整個目錄，並與匯入清單比對。
     """
-    print("---正在從目錄樹中加載所有腳本文件---")
+    metrics = state['metrics']
     dir_path = state['file_path']
     if not os.path.isdir(dir_path):
         raise FileNotFoundError(f"找不到目錄: {dir_path}")
 
-    documents = []
-    
-    print(f"正在從 {dir_path} 以樹狀搜尋載入文件...")
+    metrics.log(f"正在從 {dir_path} 以樹狀搜尋載入文件...")
     
-    file_paths = []
-    for root, _, files in os.walk(dir_path):
-        for file in files:
-            if any(file.endswith(ext) for ext in extensions):
-                file_paths.append(os.path.join(root, file))
+    manifest = IngestManifest(dir_path)
+    changed_paths = state.get('changed_paths')
+    if changed_paths:
+        existing, removed = [], []
+        for path in dict.fromkeys(changed_paths):
+            if not has_extension(os.path.basename(path), extensions) or is_excluded(dir_path, path):
+                continue
+            if not os.path.isfile(path):
+                removed.append(path)
+            elif not MAX_FILE_SIZE or os.path.getsize(path) <= MAX_FILE_SIZE:
+                existing.append(path)
+        metrics.incr('files_scanned', len(existing))
+        diff = manifest.diff(existing, force=not state.get('incremental', True), removed=removed,
+                             retract_pending=True)
+    else:
+        scanned = list(scan_files(dir_path, extensions, max_size=MAX_FILE_SIZE, with_stat=True))
+        metrics.incr('files_scanned', len(scanned))
+        # Tombstones still waiting for retraction are reported again, so send_to_graphiti retries them
+        diff = manifest.diff([f.path for f in scanned], force=not state.get('incremental', True),
+                             stats={f.path: (f.size, f.mtime) for f in scanned}, retract_pending=True)
+    metrics.incr('files_changed', len(diff.changed))
+    metrics.incr('files_unchanged', len(diff.unchanged))
+    metrics.incr('files_deleted', len(diff.deleted))
+    return diff
+
+
+def load_file_documents(file_path: str, size: int, metrics: RunMetrics) -> Iterator[Document]:
+    """
+    Yields one file as a Document, or as window Documents read one at a time when it is very large.
+    逐一產出文件內容：一般文件為單一 Document，超大文件為逐一讀取的視窗 Document。
+    """
+    if should_stream(file_path, size):
+        # Very large files are read as overlapping windows instead of one string
+        # 超大文件以重疊視窗讀取，而不是一次讀成單一字串
+        for window in iter_text_windows(file_path):
+            yield Document(page_content=window.text, metadata={
+                'source': file_path,
+                'window': window.index,
+                'start_index': window.start_index,
+                'start_line': window.start_line,
+            })
+        metrics.incr('files_streamed')
+    else:
+        # Each file is loaded using TextLoader
+        loader = TextLoader(file_path, encoding='utf-8')
+        yield from loader.load()
+    metrics.incr('files_loaded')
+    metrics.add_bytes('load_code', size)
+
 
-    for file_path in file_paths:
+def chunk_streamed_file(file_path: str, size: int, metrics: RunMetrics) -> List[Document]:
+    """
+    Chunks a file above the stream threshold while reading it, so only one window of its
+    text is in memory next to the chunks. Windows are never analyzed (see analyze_documents).
+    讀取超大文件的同時逐一視窗切片，記憶體中除了切片之外只保留一個視窗。
+    """
+    chunks = []
+    for window in load_file_documents(file_path, size, metrics):
+        chunks.extend(split_into_chunks([window], metrics))
+    return chunks
+
+
+def open_run_checkpoint(state: GraphState, diff: ManifestDiff) -> Optional[CheckpointStore]:
+    """Opens (or resumes) this run's checkpoint store and records its plan in the state."""
+    if not diff.changed and not diff.deleted and not diff.updates:
+        # Nothing to checkpoint; route_after_load ends the run
+        state['checkpoint'] = None
+        return None
+    store = open_checkpoint(state['file_path'], state.get('run_id'), state.get('resume', False))
+    state['checkpoint'] = store
+    if store is None:
+        return None
+    store.set_plan({path: diff.updates[path]['sha256'] for path in diff.changed}, diff.deleted)
+    state['run_id'] = store.run_id
+    state['metrics'].set('run_id', store.run_id)
+    return store
+
+
+def changed_files(state: GraphState) -> List[str]:
+    """This run's changed files that loaded successfully, in load order."""
+    store = state.get('checkpoint')
+    updates = state.get('manifest_updates', {})
+    if store is not None:
+        return [path for path in store.meta['plan']['changed'] if path in updates]
+    sources = [doc.metadata.get('source', '') for doc in state['documents']] + state.get('streamed_files', [])
+    return [path for path in dict.fromkeys(sources) if path in updates]
+
+
+def load_code_node(state: GraphState) -> GraphState:
+    """
+    Loads all specified script files from the directory using a recursive tree walk.
+    使用遞歸樹遍歷從目錄中加載所有指定的腳本文件。
+    """
+    metrics = state['metrics']
+    diff = plan_load(state)
+    store = open_run_checkpoint(state, diff)
+    documents, streamed = [], []
+    file_paths = diff.changed
+    if store is not None:
+        # Files already chunked in an earlier attempt are only read again when the
+        # analysis has to be redone and they are Python
+        analyzed = store.stage_done('analyze_code')
+        def needs_text(path: str) -> bool:
+            if not (store.has_file('chunk_code', path) or store.has_file('enrich_chunks', path)):
+                return True
+            return path.endswith('.py') and not analyzed
+        file_paths = [path for path in diff.changed if needs_text(path)]
+        metrics.incr('checkpoint_skipped:load_code', len(diff.changed) - len(file_paths))
+
+    for i, file_path in enumerate(file_paths, 1):
+        size = diff.updates[file_path]['size']
+        if should_stream(file_path, size):
+            # Read while chunking instead, one window at a time (see chunk_streamed_file)
+            streamed.append(file_path)
+            continue
         try:
-            # Each file is loaded using TextLoader
-            loader = TextLoader(file_path, encoding='utf-8')
-            documents.extend(loader.load())
+            documents.extend(load_file_documents(file_path, size, metrics))
         except Exception as e:
-            print(f"載入文件 {file_path} 時出錯: {e}")
+            metrics.record_error('load_code', e, file_path)
+            # Leave it out of the manifest so the next run retries it
+            diff.updates.pop(file_path, None)
+        metrics.progress('load_code', i, len(file_paths))
 
-    if not documents:
-        print("警告: 在指定目錄中未找到任何有效文件。")
-
-    print(f"成功載入 {len(documents)} 個文件。")
     state['documents'] = documents
+    state['streamed_files'] = streamed
     state['analysis_results'] = {}
     state['chunks'] = []
+    state['deleted_files'] = diff.deleted
+    state['manifest_updates'] = diff.updates
     return state
 
 
+def route_after_load(state: GraphState) -> str:
+    """
+    Skips the rest of the pipeline when nothing changed since the last run.
+    自上次執行以來沒有任何變更時，跳過後續所有階段。
+    """
+    if not state['documents'] and not state.get('deleted_files') and not state.get('manifest_updates'):
+        state['metrics'].log("沒有任何文件變更，略過後續階段。")
+        return "report_metrics"
+    return "analyze_code"
+
+
+def analyze_documents(documents: List[Document], metrics: RunMetrics, cache: AnalysisCache,
+                      symbol_table: SymbolTable, processes: int = ANALYSIS_WORKERS,
+                      executor: Optional[Executor] = None) -> Dict[str, List[str]]:
+    """
+    Analyzes the Python documents and updates symbol_table; returns the bare-name results.
+    分析 Python 文件並更新符號表，回傳以簡短名稱為鍵的結果。
+    """
+    analysis_results = {}
+    # Windows of streamed files are not complete modules and cannot be parsed on their own
+    python_docs = [doc for doc in documents
+                   if doc.metadata.get('source', '').endswith('.py') and 'window' not in doc.metadata]
+    if not python_docs:
+        return analysis_results
+    # Unchanged sources are served from the cache, the rest are parsed in a process pool
+    with metrics.stage('analyze_code.parse'):
+        entries, cache_stats = analyze_sources([doc.page_content for doc in python_docs], cache,
+                                               processes=processes, executor=executor)
+    metrics.incr('analysis_cache_hits', cache_stats['hits'])
+    metrics.incr('files_parsed', cache_stats['parsed'])
+
+    for i, (doc, entry) in enumerate(zip(python_docs, entries), 1):
+        file_path = doc.metadata.get('source', '')
+        if 'error' in entry:
+            metrics.record_error('analyze_code', entry_error(entry), file_path)
+            symbol_table.remove_file(file_path)
+            continue
+        metrics.log(f"已分析: {file_path}")
+        # Simple merge, may have collisions if function/class names are not unique across files
+        analysis_results.update(entry['result'])
+        symbol_table.set_file(file_path, entry['symbols'])
+        metrics.incr('files_analyzed')
+        metrics.progress('analyze_code', i, len(python_docs))
+    return analysis_results
+
+
 def analyze_code_node(state: GraphState) -> GraphState:
     """
     Analyzes the loaded code to extract dependencies for functions and classes.
     Only analyzes Python files.
     分析已加載的代碼，提取函數和類的依賴關係 (僅限 Python 文件)。
     """
-    print("---正在進行靜態誓法分析 (AST)---  ") 
-    documents = state['documents']
-    all_analysis_results = {}
-
-    for doc in documents:
-        file_path = doc.metadata.get('source', '')
-        if any(file_path.endswith(ext) for ext in extensions):
-            try:
-                print(f"正在分析: {file_path}")
-                analyzer = CodeAnalyzer(doc.page_content)
-                analysis_results = analyzer.analyze()
-                # Simple merge, may have collisions if function/class names are not unique across files
-                all_analysis_results.update(analysis_results)
-            except Exception as e:
-                print(f"無法分析 {file_path}: {e}")
+    metrics = state['metrics']
+    store = state.get('checkpoint')
+    if store is not None and store.stage_done('analyze_code'):
+        # The previous attempt got past this stage with the same plan
+        state['analysis_results'] = store.stage_output('analyze_code') or {}
+        state['symbol_table'] = SymbolTable.load(state['file_path'], store.artifact_path('symbols.json'))
+        metrics.incr('checkpoint_skipped:analyze_code')
+        return state
+
+    # Symbols of unchanged files come from the previous run; changed and deleted files are replaced below
+    symbol_table = SymbolTable.load(state['file_path'])
+    for file_path in state.get('deleted_files', []):
+        symbol_table.remove_file(file_path)
+
+    with metrics.stage('analyze_code.cache_load'):
+        cache = AnalysisCache()
+    all_analysis_results = analyze_documents(state['documents'], metrics, cache, symbol_table)
+    with metrics.stage('analyze_code.cache_save'):
+        cache.save()
     
-    print(f"分析完成，找到 {len(all_analysis_results)} 個具備依贅關係的對象。" )
+    metrics.incr('symbols_analyzed', len(all_analysis_results))
+    metrics.set('symbol_table_size', len(symbol_table))
+    if store is not None:
+        symbol_table.save(store.artifact_path('symbols.json'))
+        store.complete_stage('analyze_code', all_analysis_results)
     state['analysis_results'] = all_analysis_results
+    state['symbol_table'] = symbol_table
     return state
 
-def chunk_code_node(state: GraphState) -> GraphState:
+def split_into_chunks(documents: List[Document], metrics: RunMetrics) -> List[Document]:
     """
-    Splits the code into chunks using a hybrid strategy.
-    使用混合策略將代碼分割成塊。
+    Splits documents into chunks using a hybrid strategy.
+    使用混合策略將文件分割成塊。
     """
-    print("---正在進行程式码切割---")
-    documents = state['documents']
 
     # Strategy 1: Structure-aware chunking by language
-    # 策略一: 基於程式語言的結構感知切割
-    # Note: This example focuses on Python, but you could add logic to select a splitter based on file extension
-    python_splitter = RecursiveCharacterTextSplitter.from_language(
-        language=Language.PYTHON, chunk_size=1000, chunk_overlap=100
-    )
-    initial_chunks = python_splitter.split_documents(documents)
-    print(f"初步結構化切割完成，生成 {len(initial_chunks)} 個區塊。" )
+    # 策略一: 基於程式語言的結構感知切割 (每種副檔名使用自己的切割器，見 splitters.py)
+    initial_chunks = get_registry().split_documents(documents)
+    metrics.incr('chunks_initial', len(initial_chunks))
+    for chunk in initial_chunks:
+        metrics.incr(f'chunks_initial:{extension_of(chunk) or "unknown"}')
 
     # Strategy 2: Semantic chunking for oversized chunks
     # 策略二: 對超大區塊進行語義切割
-    print("初始化 Qwen/Qwen2-1.5B-Instruct 模型...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name="Qwen/Qwen3-Embedding-0.6B",
-        model_kwargs={"device": "cpu"}  # Use 'cuda' if GPU is available
-    )
-    
-    semantic_splitter = SemanticChunker(
-        embeddings,
-        breakpoint_threshold_type="percentile" # More robust threshold
-    )
-
-    final_chunks = []
     # Set a threshold for when to apply semantic chunking
     SEMANTIC_CHUNK_THRESHOLD = 1500 # characters
 
-    for chunk in initial_chunks:
-        if len(chunk.page_content) > SEMANTIC_CHUNK_THRESHOLD:
-            print(f"區塊過長 (長度 {len(chunk.page_content)} 來自 {chunk.metadata.get('source')}) ，正在進行語義切割...")
-            semantic_sub_chunks = semantic_splitter.create_documents([chunk.page_content])
-            # Add metadata from the parent chunk
-            for sub_chunk in semantic_sub_chunks:
-                sub_chunk.metadata = chunk.metadata.copy()
-            final_chunks.extend(semantic_sub_chunks)
+    oversized = [i for i, chunk in enumerate(initial_chunks) if len(chunk.page_content) > SEMANTIC_CHUNK_THRESHOLD]
+    semantic_sub_chunks = {}
+    # The model is only loaded when at least one chunk needs semantic splitting
+    # 只有在確實需要語義切割時才載入模型
+    if oversized:
+        # Shared across graph runs and API requests (see embedding_pool.py)
+        embeddings = get_embeddings()
+        if not embeddings.loaded:
+            metrics.log(f"初始化 {embeddings.model_name} 模型...")
+        # Sentences embedded in earlier runs are read back from disk
+        embeddings = cached_embeddings(embeddings)
+        metrics.incr('chunks_semantic_split', len(oversized))
+        # Per-language count of chunks the structural splitter could not keep small
+        for i in oversized:
+            metrics.incr(f'semantic_fallback:{extension_of(initial_chunks[i]) or "unknown"}')
+
+        if SEMANTIC_BATCH:
+            # All oversized chunks share a few large embedding batches (see semantic_batch.py)
+            metrics.log(f"{len(oversized)} 個區塊過長，正在進行批次語義切割...")
+            batch_splitter = BatchedSemanticSplitter(embeddings)
+            split_results = batch_splitter.split_documents([initial_chunks[i] for i in oversized])
+            semantic_sub_chunks = dict(zip(oversized, split_results))
+            metrics.incr('semantic_embedding_calls', batch_splitter.embedding_calls)
+            metrics.incr('semantic_sentences', batch_splitter.sentences_embedded)
         else:
-            final_chunks.append(chunk)
-            
-    print(f"最終切割完成，共生成 {len(final_chunks)} 個區塊。" )
-    state['chunks'] = final_chunks
-    return state
+            semantic_splitter = SemanticChunker(
+                embeddings,
+                breakpoint_threshold_type="percentile" # More robust threshold
+            )
+            for n, i in enumerate(oversized, 1):
+                chunk = initial_chunks[i]
+                metrics.log(f"區塊過長 (長度 {len(chunk.page_content)} 來自 {chunk.metadata.get('source')}) ，正在進行語義切割...")
+                # Parent metadata, with each sub-chunk's own offsets and lines
+                semantic_sub_chunks[i] = locate_sub_chunks(chunk, semantic_splitter.split_text(chunk.page_content))
+                metrics.progress('chunk_code', n, len(oversized))
+
+    final_chunks = []
+    for i, chunk in enumerate(initial_chunks):
+        final_chunks.extend(semantic_sub_chunks.get(i, [chunk]))
 
+    metrics.incr('chunks_final', len(final_chunks))
+    return final_chunks
 
-def enrich_chunks_node(state: GraphState) -> GraphState:
+
+def record_embedding_stats(metrics: RunMetrics):
+    """Flushes the embedding cache and puts model and cache stats into the summary."""
+    embeddings = get_embeddings()
+    if not embeddings.loaded:
+        return
+    metrics.set('embedding', embeddings.stats())
+    cached = cached_embeddings(embeddings)
+    cache = getattr(cached, 'cache', None)
+    if cache is not None:
+        cache.flush()
+        metrics.set('embedding_cache', cache.stats())
+
+
+def chunk_code_node(state: GraphState) -> GraphState:
     """
-    Enriches each chunk with dependency information.
+    Splits the code into chunks using a hybrid strategy.
+    使用混合策略將代碼分割成塊。
     """
-    print("---正在國充區塊元數據與內容---")
-    analysis_results = state['analysis_results']
-    chunks = state['chunks']
-    enriched_chunks = []
-
-    for chunk in chunks:
-        # Only try to enrich Python code chunks
-        if not chunk.metadata.get('source', '').endswith('.py'):
-            enriched_chunks.append(chunk)
+    metrics = state['metrics']
+    store = state.get('checkpoint')
+    streamed = state.get('streamed_files', [])
+    if store is None:
+        chunks = split_into_chunks(state['documents'], metrics)
+        for path in streamed:
+            chunks.extend(chunk_streamed(state, path) or [])
+        state['chunks'] = chunks
+        record_embedding_stats(metrics)
+        return state
+
+    # Files are chunked and checkpointed a group at a time, so a failure loses at most
+    # one group of embedding work; files enriched in an earlier attempt are left to enrich_chunks
+    # 以文件群組為單位切片並寫入檢查點，失敗時最多只損失一個群組的 Embedding 計算
+    docs_by_file = group_by_source(state['documents'])
+    file_chunks: Dict[str, List[Document]] = {}
+    todo = []
+    for path in changed_files(state):
+        if store.has_file('enrich_chunks', path):
             continue
+        restored = store.get_file('chunk_code', path)
+        if restored is None:
+            todo.append(path)
+        else:
+            file_chunks[path] = restored
+            metrics.incr('checkpoint_restored:chunk_code')
+    for path in [path for path in todo if path in streamed]:
+        chunks = chunk_streamed(state, path)
+        if chunks is not None:
+            file_chunks[path] = chunks
+            store.put_file('chunk_code', path, chunks)
+    todo = [path for path in todo if path not in streamed]
+    for i in range(0, len(todo), CHECKPOINT_GROUP_FILES):
+        group = todo[i:i + CHECKPOINT_GROUP_FILES]
+        chunks_by_file = group_by_source(split_into_chunks(
+            [doc for path in group for doc in docs_by_file.get(path, [])], metrics))
+        for path in group:
+            file_chunks[path] = chunks_by_file.get(path, [])
+            store.put_file('chunk_code', path, file_chunks[path])
+    state['chunks'] = [chunk for path in changed_files(state) for chunk in file_chunks.get(path, [])]
+    store.complete_stage('chunk_code')
+    record_embedding_stats(metrics)
+    return state
+
+
+def chunk_streamed(state: GraphState, file_path: str) -> Optional[List[Document]]:
+    """chunk_streamed_file for a file of this run; None when reading it failed."""
+    metrics = state['metrics']
+    try:
+        return chunk_streamed_file(file_path, state['manifest_updates'][file_path]['size'], metrics)
+    except Exception as e:
+        metrics.record_error('load_code', e, file_path)
+        # Leave it out of the manifest so the next run retries it
+        state['manifest_updates'].pop(file_path, None)
+        return None
+
+
+def group_by_source(documents: List[Document]) -> Dict[str, List[Document]]:
+    """Documents grouped by metadata['source'], keeping their order."""
+    grouped: Dict[str, List[Document]] = {}
+    for doc in documents:
+        grouped.setdefault(doc.metadata.get('source', ''), []).append(doc)
+    return grouped
+
 
-        content = chunk.page_content
-        first_line = content.lstrip().split('\n')[0]
-        
+def enrich_chunk(chunk: Document, symbol_table: SymbolTable, metrics: RunMetrics) -> Document:
+    """
+    Adds the symbol and dependency information of one chunk.
+    為單一切片加入符號與依賴資訊。
+    """
+    # Only try to enrich Python code chunks
+    source = chunk.metadata.get('source', '')
+    if not source.endswith('.py'):
+        return chunk
+
+    start_line = chunk.metadata.get('start_line')
+    dependencies = []
+    symbol = None
+    if start_line is not None:
+        # Chunk lines are 0-based, symbol lines 1-based; the interval tree finds every
+        # symbol the chunk overlaps, even when it starts mid-function or at a decorator
+        symbol, dependencies = symbol_table.resolve_span(
+            source, start_line + 1, chunk.metadata.get('end_line', start_line) + 1
+        )
+    else:
+        # Chunks without offsets fall back to guessing the symbol from the first line
+        first_line = chunk.page_content.lstrip().split('\n')[0]
         obj_name = None
         if first_line.startswith("def "):
             obj_name = first_line.split("def ")[1].split("(")[0].strip()
-            chunk.metadata['type'] = 'function'
         elif first_line.startswith("class "):
             obj_name = first_line.split("class ")[1].split(":")[0].split("(")[0].strip()
-            chunk.metadata['type'] = 'class'
-        else:
-            chunk.metadata['type'] = 'script_block'
-
-        dependencies = []
-        if obj_name and obj_name in analysis_results:
-            dependencies = analysis_results[obj_name]
-        
-        chunk.metadata['dependencies'] = dependencies
-
-        if dependencies:
-            dep_comment = f"\n\n# DEPENDENCIES: {', '.join(dependencies)}"
-            chunk.page_content += dep_comment
-        
-        enriched_chunks.append(chunk)
+        # Looked up in this chunk's own file, so equal names in other files no longer collide
+        symbol = symbol_table.find_in_file(source, obj_name) if obj_name else None
+        if symbol is not None:
+            dependencies = symbol.dependencies
+
+    if symbol is not None:
+        chunk.metadata['type'] = symbol.kind
+        chunk.metadata['symbol'] = symbol.qualified_name
+    else:
+        chunk.metadata['type'] = 'script_block'
     
-    print("處理完成。" )
-    state['chunks'] = enriched_chunks
+    chunk.metadata['dependencies'] = dependencies
+
+    if dependencies:
+        dep_comment = f"\n\n# DEPENDENCIES: {', '.join(dependencies)}"
+        chunk.page_content += dep_comment
+        metrics.incr('chunks_enriched')
+    return chunk
+
+
+def enrich_chunks_node(state: GraphState) -> GraphState:
+    """
+    Enriches each chunk with dependency information.
+    """
+    metrics = state['metrics']
+    symbol_table = state.get('symbol_table') or SymbolTable(root=state['file_path'])
+    store = state.get('checkpoint')
+    if store is None:
+        state['chunks'] = [enrich_chunk(chunk, symbol_table, metrics) for chunk in state['chunks']]
+        return state
+
+    chunks_by_file = group_by_source(state['chunks'])
+    enriched = []
+    for path in changed_files(state):
+        file_chunks = store.get_file('enrich_chunks', path)
+        if file_chunks is not None:
+            metrics.incr('checkpoint_restored:enrich_chunks')
+        else:
+            file_chunks = [enrich_chunk(chunk, symbol_table, metrics) for chunk in chunks_by_file.get(path, [])]
+            store.put_file('enrich_chunks', path, file_chunks)
+        enriched.extend(file_chunks)
+    state['chunks'] = enriched
+    store.complete_stage('enrich_chunks')
     return state
 
+def build_episodes(chunks: List[Document], ids: Optional[List[str]] = None,
+                   updates: Optional[Dict[str, Dict[str, Any]]] = None) -> List[RawEpisode]:
+    """
+    Turns chunks into Graphiti episodes named after the chunk ID (see chunk_ledger.py); Graphiti
+    assigns their uuids. reference_time is the source file's mtime from the manifest updates.
+    """
+    episodes = []
+    updates = updates or {}
+    for cid, chunk in zip(ids or chunk_ids(chunks), chunks):
+        source = chunk.metadata.get("source", "")
+        mtime = updates.get(source, {}).get("mtime")
+        episodes.append(RawEpisode(
+            name=f"chunk-{cid}",
+            content=chunk.page_content,
+            source_description=source or "code_chunk",
+            source=EpisodeType.text,
+            reference_time=datetime.fromtimestamp(mtime, timezone.utc) if mtime is not None else datetime.now(timezone.utc)
+        ))
+    return episodes
+
+
+def _failed_removals(report: IngestReport) -> set:
+    return {failure["remove"] for failure in report.failures if "remove" in failure}
+
+
+def upsert_files(ingestor: BatchIngestor, ledger: ChunkLedger, files: List[Tuple[str, List[Document]]],
+                 updates: Dict[str, Dict[str, Any]]) -> IngestReport:
+    """
+    Sends the chunks of files that the ledger does not know yet, then removes the episodes of
+    the files' previous versions. A file is failed when any of its episodes could not be added
+    or removed; its old episodes then stay in the ledger, next to the episodes that did get
+    added, so the next run retries only the rest.
+    已在帳本中的切片略過；新切片匯入成功後才撤回舊版本的 episode。
+    """
+    metrics = ingestor.metrics
+    plans = [ledger.plan(path, chunks) for path, chunks in files]
+    items = []
+    names: Dict[str, List[Tuple[str, str]]] = {}
+    for plan in plans:
+        metrics.incr('chunks_unchanged', plan.unchanged)
+        new_ids = [cid for cid, _ in plan.new]
+        episodes = build_episodes([chunk for _, chunk in plan.new], new_ids, updates)
+        names[plan.path] = [(cid, episode.name) for cid, episode in zip(new_ids, episodes)]
+        items += [(plan.path, episode) for episode in episodes]
+    report = ingestor.ingest(items)
+    removal = ingestor.remove([(plan.path, uuid) for plan in plans
+                               if plan.path not in report.failed_sources for _, uuid in plan.stale])
+    failed_removals = _failed_removals(removal)
+    for plan in plans:
+        added = {cid: report.uuids[name] for cid, name in names[plan.path] if name in report.uuids}
+        if plan.path in report.failed_sources:
+            entries = {**dict(plan.stale), **plan.known}
+            # A chunk re-sent with the ledger disabled keeps its old episode under a key of its own
+            entries.update((cid if cid not in entries else f"{cid}@{uuid}", uuid) for cid, uuid in added.items())
+        else:
+            entries = {**plan.known, **added}
+            # Keys that are not current chunk IDs are stale again next run, so removal is retried
+            entries.update((cid if cid not in entries else f"{cid}@{uuid}", uuid)
+                           for cid, uuid in plan.stale if uuid in failed_removals)
+        ledger.record(plan.path, entries)
+    ledger.save()
+    report.failures += removal.failures
+    report.failed_sources |= removal.failed_sources
+    return report
+
+
+def retract_files(ingestor: BatchIngestor, ledger: ChunkLedger, paths: List[str]) -> IngestReport:
+    """
+    Removes every episode of deleted files (manifest tombstones) from Graphiti.
+    從 Graphiti 撤回已刪除文件的所有 episode。
+
+    A path the ledger does not know (e.g. ingested before the ledger existed) is left in
+    failed_sources, so its tombstone stays pending instead of being marked retracted.
+    帳本中沒有記錄的文件無法撤回，其墓碑保持待處理。
+    """
+    known = [path for path in paths if ledger.knows(path)]
+    report = ingestor.remove([(path, uuid) for path in known for uuid in ledger.entries(path).values()])
+    unknown = [path for path in paths if path not in known]
+    if unknown:
+        ingestor.metrics.incr('tombstones_unknown', len(unknown))
+        ingestor.metrics.log(f"{len(unknown)} 個已刪除文件不在帳本中，無法撤回其 episode")
+        report.failed_sources.update(unknown)
+    failed_removals = _failed_removals(report)
+    for path in known:
+        remaining = {cid: uuid for cid, uuid in ledger.entries(path).items() if uuid in failed_removals}
+        if remaining:
+            ledger.record(path, remaining)
+        else:
+            ledger.forget(path)
+    ledger.save()
+    return report
+
+
 def send_to_graphiti_node(state: GraphState) -> GraphState:
     """
     將最終切片 (chunks) 輸入到 Graphiti 知識圖，作為 RAG 用。
+    切片分批並行送出 (見 graphiti_ingest.py)；重試後仍失敗的文件不會記錄到清單中，下次執行會重新匯入。
+    內容未變的切片依帳本略過 (見 chunk_ledger.py)，已刪除文件的 episode 會被撤回。
     """
-    print("---正在將切片匯入 Graphiti ---")
-    async def _ingest(chunks):
-        driver = Neo4jDriver(uri="bolt://localhost:7687", user="neo4j", password="password")
-        client = Graphiti(graph_driver=driver)
-        episodes = []
-        for i, chunk in enumerate(chunks):
-            episodes.append(RawEpisode(
-                name=f"chunk-{i}",
-                content=chunk.page_content,
-                source_description=chunk.metadata.get("source", "code_chunk"),
-                source=EpisodeType.text,
-                reference_time=datetime.now(timezone.utc)
-            ))
-        if episodes:
-            await client.add_episode_bulk(episodes)
-            print(f"已匯入 {len(episodes)} 個切片到 Graphiti")
-    asyncio.run(_ingest(state["chunks"]))
+    metrics = state['metrics']
+    store = state.get('checkpoint')
+    updates = state.get("manifest_updates", {})
+    ingestor = BatchIngestor(metrics)
+    ledger = ChunkLedger(state['file_path'])
+    failed_sources = set()
+    failures = []
+
+    def _upsert(files):
+        report = upsert_files(ingestor, ledger, files, updates)
+        failed_sources.update(report.failed_sources)
+        failures.extend(report.failures)
+        return report
+
+    chunks_by_file = group_by_source(state["chunks"])
+    # Files that no longer produce any chunks still get their old episodes removed
+    files = changed_files(state)
+    if store is not None:
+        # Ingested group by group, each group's fully ingested files recorded in the checkpoint
+        for i in range(0, len(files), CHECKPOINT_GROUP_FILES):
+            group = [path for path in files[i:i + CHECKPOINT_GROUP_FILES] if not store.is_ingested(path)]
+            metrics.incr('checkpoint_skipped:send_to_graphiti', min(CHECKPOINT_GROUP_FILES, len(files) - i) - len(group))
+            report = _upsert([(path, chunks_by_file.get(path, [])) for path in group])
+            store.mark_ingested(path for path in group if path not in report.failed_sources)
+    else:
+        _upsert([(path, chunks_by_file.get(path, [])) for path in files])
+
+    # Only record the files as ingested once Graphiti accepted them
+    # 只有在 Graphiti 成功接收後才把文件記錄到清單中
+    manifest = IngestManifest(state['file_path'])
+    if failures:
+        # Deletions and the remaining updates wait for a run in which every batch succeeds
+        ingested = set(changed_files(state)) - failed_sources
+        manifest.apply({path: update for path, update in updates.items() if path in ingested})
+    else:
+        manifest.apply(updates, state.get("deleted_files", []))
+        tombstones = manifest.pending_tombstones()
+        retracted = retract_files(ingestor, ledger, tombstones)
+        manifest.mark_retracted(path for path in tombstones if path not in retracted.failed_sources)
+        failures.extend(retracted.failures)
+    manifest.save()
+    metrics.set('pending_tombstones', len(manifest.pending_tombstones()))
+    metrics.set('ledger_chunks', len(ledger))
+    if failures:
+        raise IngestError(failures)
+    if state.get("symbol_table") is not None:
+        state["symbol_table"].save()
+    if store is not None:
+        store.finish()
+    return state
+
+
+def report_metrics_node(state: GraphState) -> GraphState:
+    """
+    Emits the machine-readable run summary.
+    輸出本次執行的機器可讀摘要。
+    """
+    state['metrics'].emit_summary()
     return state
 
 
 # --- 4. Graph Assembly ---
-def create_chunking_graph():
+def create_chunking_graph(streaming: bool = STREAMING):
     """
     Creates and compiles the LangGraph workflow.
     創建並編譯 LangGraph 工作流程。
+
+    :param streaming: True 時以單一節點串流處理每個文件 (見 streaming_pipeline.py)，
+                      切片不會保留在 state['chunks'] 中，數量請看 metrics 的 chunks_final
     """
     workflow = StateGraph(GraphState)
 
-    # Add nodes
-    workflow.add_node("load_code", load_code_node)
-    workflow.add_node("analyze_code", analyze_code_node)
-    workflow.add_node("chunk_code", chunk_code_node)
-    workflow.add_node("enrich_chunks", enrich_chunks_node)
-    workflow.add_node("send_to_graphiti", send_to_graphiti_node)
+    if streaming:
+        # Imported here because streaming_pipeline builds on the node helpers in this module
+        from streaming_pipeline import stream_pipeline_node
+        workflow.add_node("stream_pipeline", instrument_node("stream_pipeline", stream_pipeline_node))
+        workflow.add_node("report_metrics", report_metrics_node)
+        workflow.set_entry_point("stream_pipeline")
+        workflow.add_edge("stream_pipeline", "report_metrics")
+        workflow.add_edge("report_metrics", END)
+        return workflow.compile()
+
+    # Add nodes (each one is timed into state['metrics'])
+    workflow.add_node("load_code", instrument_node("load_code", load_code_node))
+    workflow.add_node("analyze_code", instrument_node("analyze_code", analyze_code_node))
+    workflow.add_node("chunk_code", instrument_node("chunk_code", chunk_code_node))
+    workflow.add_node("enrich_chunks", instrument_node("enrich_chunks", enrich_chunks_node))
+    workflow.add_node("send_to_graphiti", instrument_node("send_to_graphiti", send_to_graphiti_node))
+    workflow.add_node("report_metrics", report_metrics_node)
 
     # Define edges
     workflow.set_entry_point("load_code")
-    workflow.add_edge("load_code", "analyze_code")
+    workflow.add_conditional_edges("load_code", route_after_load, ["analyze_code", "report_metrics"])
     workflow.add_edge("analyze_code", "chunk_code")
     workflow.add_edge("chunk_code", "enrich_chunks")
     workflow.add_edge("enrich_chunks", "send_to_graphiti")
-    workflow.add_edge("send_to_graphiti", END)
+    workflow.add_edge("send_to_graphiti", "report_metrics")
+    workflow.add_edge("report_metrics", END)
     app = workflow.compile()
-    print("✅ 程式码切片工作流 (Graph) 編譯完成！")
     return app
 
 # --- 5. Example Usage ---
@@ -315,9 +735,14 @@ if __name__ == '__main__':
             "file_path": docs_dir,
             "documents": [],
             "analysis_results": {},
-            "chunks": []
+            "chunks": [],
+            "incremental": True,
+            "deleted_files": [],
+            "manifest_updates": {}
         }
-        final_state = chunking_app.invoke(inputs)
+        # Waits for a run of the API or the watcher to finish (see run_lock.py)
+        with RunLock():
+            final_state = chunking_app.invoke(inputs)
 
         if final_state and final_state.get('chunks'):
             final_chunks = final_state['chunks']
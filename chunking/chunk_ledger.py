@@ -0,0 +1,141 @@
+"""
+Stable chunk IDs and the ledger of chunks already in Graphiti.
+穩定的切片 ID 與已匯入切片的帳本：切片 ID 由來源路徑、位置區間與內容雜湊決定，
+重跑流程時內容不變的切片直接略過，內容改變的切片以新 episode 取代舊的，
+已刪除文件的 episode 則從 Graphiti 撤回。
+
+Graphiti assigns each episode's uuid when it is added (add_episode_bulk only accepts
+uuids of episodes that already exist), so the ledger stores the uuid it returned next to
+the chunk ID; removals use that uuid. Chunks sent again without a ledger entry (e.g.
+after the ledger was lost) become new episodes next to the old ones.
+"""
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from manifest import STATE_DIR, manifest_path, relative_key
+
+# One ledger per corpus root, like the manifests (see manifest.manifest_path)
+LEDGER_DIR = os.environ.get("CHUNKING_CHUNK_LEDGER_DIR", os.path.join(STATE_DIR, "ledgers"))
+# CHUNKING_CHUNK_LEDGER=0 sends every chunk again; the recorded episodes are removed afterwards
+LEDGER_ENABLED = os.environ.get("CHUNKING_CHUNK_LEDGER", "1") == "1"
+# Older ledgers (no episode uuids, or keyed by the path as spelled) are not read
+LEDGER_VERSION = 3
+
+
+def chunk_id(chunk: Document, source: Optional[str] = None) -> str:
+    """sha256 over source path (metadata['source'] unless given), character span and content hash."""
+    metadata = chunk.metadata
+    if source is None:
+        source = metadata.get('source', '')
+    content_hash = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+    key = f"{source}\0{metadata.get('start_index', '')}:{metadata.get('end_index', '')}\0{content_hash}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def chunk_ids(chunks: List[Document], source: Optional[str] = None) -> List[str]:
+    """IDs of one file's chunks; an exact repeat (same span and content) gets a #n suffix."""
+    ids, seen = [], {}
+    for chunk in chunks:
+        cid = chunk_id(chunk, source)
+        seen[cid] = seen.get(cid, 0) + 1
+        ids.append(cid if seen[cid] == 1 else f"{cid}#{seen[cid]}")
+    return ids
+
+
+@dataclass
+class FilePlan:
+    """What one file needs in Graphiti compared to the ledger."""
+    path: str
+    ids: List[str]
+    # (chunk ID, chunk) pairs not in Graphiti yet
+    new: List[Tuple[str, Document]] = field(default_factory=list)
+    # (chunk ID, episode uuid) of episodes of an older version of the file, removed once the new ones are in
+    stale: List[Tuple[str, str]] = field(default_factory=list)
+    # Chunk ID -> episode uuid of the chunks already in Graphiti
+    known: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def unchanged(self) -> int:
+        return len(self.known)
+
+
+class ChunkLedger:
+    """
+    Chunk ID -> episode uuid per file under root for the chunks known to be in Graphiti,
+    stored as JSON in LEDGER_DIR.
+    以文件記錄 root 底下已確認存在於 Graphiti 的切片 ID 及其 episode uuid。
+
+    Methods take file paths; files is keyed by root-relative POSIX paths, as in
+    IngestManifest, and chunk IDs hash that key instead of the path as spelled. A file
+    ingested without chunks keeps an empty entry, so it still counts as known.
+    """
+    def __init__(self, root: str, path: Optional[str] = None, enabled: bool = LEDGER_ENABLED):
+        self.root = root
+        self.path = path or manifest_path(root, LEDGER_DIR)
+        self._real_root = os.path.realpath(root)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.files: Dict[str, Dict[str, str]] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            if payload.get("version") == LEDGER_VERSION:
+                self.files = payload.get("files", {})
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in self.files.values())
+
+    def plan(self, path: str, chunks: List[Document]) -> FilePlan:
+        """Splits a file's chunks into new and unchanged ones and lists the stale episodes."""
+        ids = chunk_ids(chunks, self.key(path))
+        previous = self.entries(path)
+        plan = FilePlan(path, ids)
+        for cid, chunk in zip(ids, chunks):
+            if self.enabled and cid in previous:
+                plan.known[cid] = previous[cid]
+            else:
+                plan.new.append((cid, chunk))
+        # With the ledger disabled every chunk is sent again, so all recorded episodes are stale
+        plan.stale = [(cid, uuid) for cid, uuid in previous.items() if cid not in plan.known]
+        return plan
+
+    def key(self, file_path: str) -> str:
+        return relative_key(self._real_root, file_path)
+
+    def knows(self, path: str) -> bool:
+        """True when path was ingested with this ledger, even if it produced no chunks."""
+        with self._lock:
+            return self.key(path) in self.files
+
+    def entries(self, path: str) -> Dict[str, str]:
+        """Chunk ID -> episode uuid of path's episodes in Graphiti."""
+        with self._lock:
+            return dict(self.files.get(self.key(path), {}))
+
+    def record(self, path: str, entries: Dict[str, str]):
+        """Sets the episodes in Graphiti for path (the file's current chunks plus stale ones not removed yet)."""
+        with self._lock:
+            self.files[self.key(path)] = dict(entries)
+
+    def forget(self, path: str):
+        """Drops path once all of its episodes were removed from Graphiti."""
+        with self._lock:
+            self.files.pop(self.key(path), None)
+
+    def save(self):
+        """Writes the ledger atomically."""
+        with self._lock:
+            payload = {"version": LEDGER_VERSION, "root": self._real_root, "files": self.files}
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
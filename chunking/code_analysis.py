@@ -0,0 +1,222 @@
+"""
+Python dependency analysis with a process pool and a content-addressed result cache.
+Python 依賴分析：以進程池平行解析，並以 (內容雜湊, Python 版本) 快取結果，
+未變更的文件不會再被解析一次。
+"""
+import ast
+import builtins
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from manifest import STATE_DIR
+
+# Bump when CodeAnalyzer output changes so stale cache entries are ignored
+ANALYZER_VERSION = 2
+ANALYSIS_CACHE_PATH = os.environ.get("CHUNKING_ANALYSIS_CACHE_PATH", os.path.join(STATE_DIR, "analysis_cache.json"))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get("CHUNKING_ANALYSIS_CACHE_MAX_ENTRIES", "50000"))
+# 0 uses every CPU, 1 disables the process pool
+ANALYSIS_WORKERS = int(os.environ.get("CHUNKING_ANALYSIS_WORKERS", "0")) or os.cpu_count() or 1
+
+
+class CodeAnalyzer(ast.NodeVisitor):
+    """
+    Analyzes a Python script using AST to find dependencies for each function and class.
+    使用 AST 分析 Python 腳本，找出每個函數和類的依賴項。
+    """
+    def __init__(self, source_code):
+        self.source_code = source_code
+        self.imports = {}  # alias -> module
+        self.dependencies = {}  # function/class name -> set of used modules
+        # Every class/function with its dotted name inside the file ("Class.method"),
+        # 1-based inclusive line span and dependencies, in source order
+        self.symbols = []
+        self._scopes = []  # symbols enclosing the node being visited
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.imports[alias.asname or alias.name] = alias.name.split('.')[0]
+        self.generic_visit(node)
+
+    def visit_ImportFrom(self, node):
+        module = node.module.split('.')[0] if node.module else ''
+        for alias in node.names:
+            self.imports[alias.asname or alias.name] = module
+        self.generic_visit(node)
+
+    def _track_dependencies(self, node, kind):
+        parent = self._scopes[-1] if self._scopes else None
+        if kind == 'function' and parent is not None and parent['kind'] == 'class':
+            kind = 'method'
+        symbol = {
+            'name': f"{parent['name']}.{node.name}" if parent else node.name,
+            'kind': kind,
+            # Decorators belong to the definition they decorate
+            'start_line': min([node.lineno] + [d.lineno for d in node.decorator_list]),
+            'end_line': node.end_lineno,
+            'dependencies': set(),
+        }
+        self.symbols.append(symbol)
+        self._scopes.append(symbol)
+        self.generic_visit(node)
+        self._scopes.pop()
+
+    def visit_FunctionDef(self, node):
+        self._track_dependencies(node, 'function')
+
+    def visit_AsyncFunctionDef(self, node):
+        self._track_dependencies(node, 'function')
+
+    def visit_ClassDef(self, node):
+        self._track_dependencies(node, 'class')
+
+    def _add_dependency(self, module):
+        # A module used in a method is also a dependency of its class
+        for scope in self._scopes:
+            scope['dependencies'].add(module)
+
+    def visit_Name(self, node):
+        if self._scopes and node.id in self.imports:
+            self._add_dependency(self.imports[node.id])
+
+    def visit_Attribute(self, node):
+        # This handles cases like `pd.DataFrame` or `np.array`
+        if self._scopes and isinstance(node.value, ast.Name) and node.value.id in self.imports:
+            self._add_dependency(self.imports[node.value.id])
+        self.generic_visit(node)
+
+    def analyze(self):
+        tree = ast.parse(self.source_code)
+        self.visit(tree)
+        for symbol in self.symbols:
+            self.dependencies[symbol['name'].rsplit('.', 1)[-1]] = symbol['dependencies']
+        # Convert sets to lists for JSON serialization
+        return {k: sorted(list(v)) for k, v in self.dependencies.items()}
+
+    def symbol_spans(self):
+        """JSON-serializable copy of self.symbols; call after analyze()."""
+        return [{**symbol, 'dependencies': sorted(symbol['dependencies'])} for symbol in self.symbols]
+
+
+def analysis_key(source: str) -> str:
+    """Cache key: the source hash plus the Python version whose grammar parsed it."""
+    digest = hashlib.sha256(source.encode("utf-8", errors="surrogatepass")).hexdigest()
+    return f"py{sys.version_info[0]}.{sys.version_info[1]}-v{ANALYZER_VERSION}-{digest}"
+
+
+def _analyze_in_worker(source: str) -> Dict[str, Any]:
+    """Runs CodeAnalyzer; failures are returned (and cached) instead of raised."""
+    try:
+        analyzer = CodeAnalyzer(source)
+        return {"result": analyzer.analyze(), "symbols": analyzer.symbol_spans()}
+    except Exception as e:
+        return {"error": str(e), "error_type": type(e).__name__}
+
+
+def entry_error(entry: Dict[str, Any]) -> Exception:
+    """Rebuilds the exception of a failed (possibly cached) analysis for metrics.record_error."""
+    exc_type = getattr(builtins, entry.get("error_type", ""), None)
+    if not (isinstance(exc_type, type) and issubclass(exc_type, Exception)):
+        exc_type = Exception
+    return exc_type(entry["error"])
+
+
+class AnalysisCache:
+    """
+    JSON-backed LRU of CodeAnalyzer results keyed by analysis_key().
+    以 analysis_key() 為鍵、保存 CodeAnalyzer 結果的 LRU 快取 (JSON 檔)。執行緒安全。
+    """
+    def __init__(self, path: str = ANALYSIS_CACHE_PATH, max_entries: int = ANALYSIS_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._dirty = False
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = OrderedDict(json.load(f).get("entries", []))
+            except (OSError, ValueError):
+                # A corrupt cache only costs a re-parse
+                self.entries = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self._dirty = True
+            return entry
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        with self._lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self._dirty = True
+
+    def save(self):
+        """Writes the cache atomically (only when something changed)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "entries": list(self.entries.items())}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+
+def analyze_sources(sources: List[str], cache: Optional[AnalysisCache] = None,
+                    processes: int = ANALYSIS_WORKERS, min_parallel: int = 16,
+                    chunksize: int = 8, executor: Optional[Executor] = None
+                    ) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Analyzes every source, parsing only cache misses and spreading them over a process pool.
+    分析所有原始碼，只解析快取未命中的部分，數量夠多時分散到進程池。
+
+    :param sources: Python 原始碼列表
+    :param cache: 結果快取，None 表示不使用快取
+    :param processes: 進程數量，1 表示不使用進程池
+    :param min_parallel: 未命中數量少於此值時直接在當前進程解析，避免進程啟動成本
+    :param chunksize: 每次派發給子進程的文件數量
+    :param executor: 呼叫端持有的進程池；提供時所有未命中都交給它，不另外建立進程池
+    :return: (與 sources 順序一致的 {"result": ...} 或 {"error": ...}, 快取命中統計)
+    """
+    keys = [analysis_key(source) for source in sources]
+    entries: List[Optional[Dict[str, Any]]] = [cache.get(key) if cache else None for key in keys]
+
+    # Identical sources (copied files) are parsed once
+    misses: Dict[str, int] = {}
+    for i, entry in enumerate(entries):
+        if entry is None and keys[i] not in misses:
+            misses[keys[i]] = i
+    to_parse = [sources[i] for i in misses.values()]
+
+    if executor is not None and to_parse:
+        parsed = list(executor.map(_analyze_in_worker, to_parse))
+    elif processes > 1 and len(to_parse) >= min_parallel:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            parsed = list(executor.map(_analyze_in_worker, to_parse, chunksize=chunksize))
+    else:
+        parsed = [_analyze_in_worker(source) for source in to_parse]
+
+    by_key = dict(zip(misses, parsed))
+    for key, entry in by_key.items():
+        if cache is not None:
+            cache.put(key, entry)
+    for i, entry in enumerate(entries):
+        if entry is None:
+            entries[i] = by_key[keys[i]]
+
+    stats = {"hits": len(sources) - sum(1 for e in keys if e in by_key), "parsed": len(to_parse)}
+    return entries, stats
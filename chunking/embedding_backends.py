@@ -0,0 +1,278 @@
+"""
+Pluggable embedding backends.
+可替換的 Embedding 後端，由 CHUNKING_EMBEDDING_BACKEND 選擇：
+
+- huggingface: 原本的 langchain_huggingface (sentence-transformers) 路徑；
+  CHUNKING_EMBEDDING_QUANTIZE=int8 時對 Linear 層做 torch 動態 int8 量化 (僅 CPU)
+- onnx: 以 ONNX Runtime 從本機模型目錄 (CHUNKING_EMBEDDING_MODEL_DIR) 載入 model.onnx 與 tokenizer.json；
+  int8 時使用目錄中已量化的模型，沒有的話第一次載入時以動態量化產生 model_int8.onnx
+- hashing: 決定性的雜湊 Embedding，不需要模型，供測試與離線基準使用
+
+Every backend returns an object with LangChain's embed_documents / embed_query, and
+heavy dependencies (torch, onnxruntime, tokenizers) are only imported by the backend
+that needs them.
+"""
+import json
+import os
+import zlib
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+EMBEDDING_BACKEND = os.environ.get("CHUNKING_EMBEDDING_BACKEND", "huggingface")
+# Local model directory for the onnx backend (exported ONNX model + tokenizer.json)
+EMBEDDING_MODEL_DIR = os.environ.get("CHUNKING_EMBEDDING_MODEL_DIR", "")
+# "" keeps fp32, "int8" uses dynamically quantized weights
+EMBEDDING_QUANTIZE = os.environ.get("CHUNKING_EMBEDDING_QUANTIZE", "")
+EMBEDDING_MAX_LENGTH = int(os.environ.get("CHUNKING_EMBEDDING_MAX_LENGTH", "512"))
+# "mean", "cls" or "last"; empty reads the sentence-transformers pooling config of the model directory
+EMBEDDING_POOLING = os.environ.get("CHUNKING_EMBEDDING_POOLING", "")
+EMBEDDING_HASHING_DIM = int(os.environ.get("CHUNKING_EMBEDDING_HASHING_DIM", "256"))
+
+
+@dataclass
+class BackendConfig:
+    """Everything a backend factory may need; each backend ignores what it does not use."""
+    model_name: str
+    device: str = "cpu"
+    threads: int = 0
+    batch_size: int = 32
+    model_dir: str = EMBEDDING_MODEL_DIR
+    quantize: str = EMBEDDING_QUANTIZE
+    max_length: int = EMBEDDING_MAX_LENGTH
+    pooling: str = EMBEDDING_POOLING
+    hashing_dim: int = EMBEDDING_HASHING_DIM
+
+
+_BACKENDS: Dict[str, Callable[[BackendConfig], Any]] = {}
+
+
+def register_backend(name: str):
+    """Decorator registering factory(config) -> embeddings under name."""
+    def decorator(factory: Callable[[BackendConfig], Any]):
+        _BACKENDS[name] = factory
+        return factory
+    return decorator
+
+
+def available_backends() -> List[str]:
+    return sorted(_BACKENDS)
+
+
+def create_backend(name: str, config: BackendConfig):
+    factory = _BACKENDS.get(name)
+    if factory is None:
+        raise ValueError(f"未知的 Embedding 後端: {name} (可用: {', '.join(available_backends())})")
+    if config.quantize not in ("", "int8"):
+        raise ValueError(f"不支援的量化方式: {config.quantize} (可用: int8)")
+    return factory(config)
+
+
+def backend_id(name: str, config: BackendConfig) -> str:
+    """
+    Identifies the vectors a backend produces, e.g. for the embedding cache. The plain
+    fp32 Hugging Face model keeps its bare model name so existing caches stay valid.
+    """
+    if name == "hashing":
+        return f"hashing-{config.hashing_dim}"
+    if name == "huggingface" and not config.quantize:
+        return config.model_name
+    return f"{config.model_name}@{name}{'-' + config.quantize if config.quantize else ''}"
+
+
+# --- huggingface ---
+@register_backend("huggingface")
+def _huggingface_backend(config: BackendConfig):
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    if config.threads:
+        import torch
+        torch.set_num_threads(config.threads)
+    model = HuggingFaceEmbeddings(
+        model_name=config.model_dir or config.model_name,
+        model_kwargs={"device": config.device},
+        encode_kwargs={"batch_size": config.batch_size},
+    )
+    if config.quantize == "int8":
+        if not config.device.startswith("cpu"):
+            raise ValueError("torch 動態 int8 量化只支援 CPU")
+        import torch
+        # Weights of every Linear layer become int8, activations are quantized on the fly
+        client = getattr(model, "_client", None) or model.client
+        torch.ao.quantization.quantize_dynamic(client, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+
+# --- onnx ---
+_FP32_CANDIDATES = ["model.onnx", os.path.join("onnx", "model.onnx")]
+_INT8_CANDIDATES = ["model_int8.onnx", "model_quantized.onnx",
+                    os.path.join("onnx", "model_int8.onnx"), os.path.join("onnx", "model_quantized.onnx")]
+
+
+def onnx_model_path(model_dir: str, quantize: str = "") -> str:
+    """
+    The ONNX file to load from model_dir; for int8 without a quantized file one is
+    created next to the fp32 model with onnxruntime's dynamic quantization.
+    """
+    def first(candidates: List[str]) -> Optional[str]:
+        for name in candidates:
+            path = os.path.join(model_dir, name)
+            if os.path.exists(path):
+                return path
+        return None
+
+    fp32_path = first(_FP32_CANDIDATES)
+    if quantize != "int8":
+        if fp32_path is None:
+            raise FileNotFoundError(f"在 {model_dir} 找不到 ONNX 模型 ({' / '.join(_FP32_CANDIDATES)})")
+        return fp32_path
+    int8_path = first(_INT8_CANDIDATES)
+    if int8_path is not None:
+        return int8_path
+    if fp32_path is None:
+        raise FileNotFoundError(f"在 {model_dir} 找不到可量化的 ONNX 模型 ({' / '.join(_FP32_CANDIDATES)})")
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as e:
+        raise ImportError("產生 int8 模型需要 onnx 套件: pip install onnx") from e
+    directory = os.path.dirname(fp32_path)
+    int8_path = os.path.join(directory, "model_int8.onnx")
+    # Written in a scratch directory first: the .onnx file refers to its external data file by name
+    tmp_dir = os.path.join(directory, ".model_int8.tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    # External data keeps models over the 2 GB protobuf limit loadable
+    quantize_dynamic(fp32_path, os.path.join(tmp_dir, "model_int8.onnx"),
+                     weight_type=QuantType.QInt8, use_external_data_format=True)
+    for name in sorted(os.listdir(tmp_dir), key=lambda n: n == "model_int8.onnx"):
+        os.replace(os.path.join(tmp_dir, name), os.path.join(directory, name))
+    os.rmdir(tmp_dir)
+    return int8_path
+
+
+def sentence_transformers_layout(model_dir: str) -> Dict[str, Any]:
+    """Pooling mode and normalization from a sentence-transformers model directory."""
+    layout = {"pooling": "mean", "normalize": False}
+    try:
+        with open(os.path.join(model_dir, "modules.json"), "r", encoding="utf-8") as f:
+            modules = json.load(f)
+    except (OSError, ValueError):
+        return layout
+    for module in modules:
+        module_type = module.get("type", "")
+        if module_type.endswith("Normalize"):
+            layout["normalize"] = True
+        elif module_type.endswith("Pooling"):
+            try:
+                with open(os.path.join(model_dir, module.get("path", ""), "config.json"), "r", encoding="utf-8") as f:
+                    pooling = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if pooling.get("pooling_mode_lasttoken"):
+                layout["pooling"] = "last"
+            elif pooling.get("pooling_mode_cls_token"):
+                layout["pooling"] = "cls"
+    return layout
+
+
+class OnnxEmbeddings:
+    """
+    Sentence embeddings from an ONNX transformer on CPU via ONNX Runtime.
+    以 ONNX Runtime 在 CPU 上計算句向量。
+    """
+    def __init__(self, model_dir: str, quantize: str = "", threads: int = 0, batch_size: int = 32,
+                 max_length: int = EMBEDDING_MAX_LENGTH, pooling: str = EMBEDDING_POOLING):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("ONNX 後端需要 onnxruntime 與 tokenizers: pip install onnxruntime tokenizers") from e
+        import numpy as np
+
+        self._np = np
+        self.model_path = onnx_model_path(model_dir, quantize)
+        self.batch_size = batch_size
+        layout = sentence_transformers_layout(model_dir)
+        self.pooling = pooling or layout["pooling"]
+        self.normalize = layout["normalize"]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        if self.tokenizer.padding is None:
+            self.tokenizer.enable_padding()
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode(self, texts: List[str]):
+        np = self._np
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.asarray([e.ids for e in encodings], dtype=np.int64)
+        mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        if "position_ids" in self.input_names:
+            feeds["position_ids"] = np.clip(np.cumsum(mask, axis=1) - 1, 0, None)
+        hidden = self.session.run(None, feeds)[0].astype(np.float32)  # (batch, tokens, dim)
+
+        if self.pooling == "cls":
+            vectors = hidden[:, 0]
+        elif self.pooling == "last":
+            # Last real token, whichever side the tokenizer pads on
+            last = mask.shape[1] - 1 - np.argmax(mask[:, ::-1], axis=1)
+            vectors = hidden[np.arange(len(texts)), last]
+        else:
+            weights = mask[:, :, None].astype(np.float32)
+            vectors = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        if self.normalize:
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            vectors.extend(self._encode(texts[i:i + self.batch_size]).tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+@register_backend("onnx")
+def _onnx_backend(config: BackendConfig):
+    model_dir = config.model_dir or config.model_name
+    if not os.path.isdir(model_dir):
+        raise FileNotFoundError(f"ONNX 後端需要本機模型目錄 (CHUNKING_EMBEDDING_MODEL_DIR): {model_dir}")
+    if not config.device.startswith("cpu"):
+        raise ValueError("ONNX 後端目前只使用 CPUExecutionProvider")
+    return OnnxEmbeddings(model_dir, config.quantize, config.threads, config.batch_size,
+                          config.max_length, config.pooling)
+
+
+# --- hashing ---
+class HashingEmbeddings:
+    """
+    Deterministic bag-of-tokens embeddings; no model, for tests and offline benchmarks.
+    決定性的詞袋雜湊向量，不需要模型。
+    """
+    def __init__(self, dim: int = EMBEDDING_HASHING_DIM, **kwargs):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for token in text.split():
+            vector[zlib.crc32(token.encode("utf-8")) % self.dim] += 1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+@register_backend("hashing")
+def _hashing_backend(config: BackendConfig):
+    return HashingEmbeddings(config.hashing_dim)
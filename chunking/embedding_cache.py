@@ -0,0 +1,265 @@
+"""
+Persistent, content-addressed embedding cache.
+持久化的內容定址 Embedding 快取：以 (模型名稱, 文字雜湊) 為鍵，向量存放在記憶體映射檔中，
+未變更的文件在下一次執行時不必重新計算 Embedding。
+
+Layout of one model directory:
+    vectors.bin   fixed-size slots of dim float32 (or float16) values, memory-mapped
+    keys.bin      per slot, a 16-byte tag of the key whose vector the slot holds
+    index.json    dim, dtype, capacity and the key -> slot map in LRU order
+
+Slots are written immediately but index.json only on flush(), and the API worker, the
+watcher and the CLI share the directory without a lock. A slot may therefore have been
+reused since the index was written (after a crash, or by another process that evicted
+it), so every read checks the slot's tag against the key, before and after copying the
+vector, and treats a mismatch as a miss. Files are only ever grown, never truncated,
+so another process's mapping stays valid.
+槽位立即寫入而索引只在 flush() 時寫入，且多個行程共用同一目錄；因此每個槽位記錄所屬鍵的標記，
+讀取時比對標記，不符 (當機或其他行程重用了槽位) 即視為未命中，而不會回傳錯誤的向量。
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from manifest import STATE_DIR
+
+# CHUNKING_EMBEDDING_CACHE=0 disables the cache
+EMBEDDING_CACHE_ENABLED = os.environ.get("CHUNKING_EMBEDDING_CACHE", "1") == "1"
+EMBEDDING_CACHE_DIR = os.environ.get("CHUNKING_EMBEDDING_CACHE_DIR", os.path.join(STATE_DIR, "embeddings"))
+# "float32" or "float16" (half the disk and page cache, ~3 significant digits)
+EMBEDDING_CACHE_DTYPE = os.environ.get("CHUNKING_EMBEDDING_CACHE_DTYPE", "float32")
+# Least recently used vectors are evicted beyond this many entries
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("CHUNKING_EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+_INITIAL_CAPACITY = 1024
+_TAG_SIZE = 16
+# Index files of version 1 had no keys.bin to check slots against
+_INDEX_VERSION = 2
+
+
+def text_key(text: str, kind: str = "doc") -> str:
+    """Hash of the text; queries and documents may be embedded differently, so they are kept apart."""
+    return hashlib.blake2b(f"{kind}\0{text}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _size(path: str) -> int:
+    return os.path.getsize(path) if os.path.exists(path) else -1
+
+
+def _tag(key: str) -> np.ndarray:
+    return np.frombuffer(hashlib.blake2b(key.encode("utf-8"), digest_size=_TAG_SIZE).digest(), dtype=np.uint8)
+
+
+class EmbeddingCache:
+    """
+    Fixed-slot vector store with an LRU index, one per model.
+    每個模型一份的固定槽位向量儲存，以 LRU 淘汰。
+    """
+    def __init__(self, model_name: str, directory: str = EMBEDDING_CACHE_DIR,
+                 dtype: str = EMBEDDING_CACHE_DTYPE, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"unsupported cache dtype: {dtype}")
+        self.model_name = model_name
+        self.directory = os.path.join(directory, re.sub(r"[^\w.-]+", "_", model_name))
+        self.dtype = np.dtype(dtype)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._vectors_path = os.path.join(self.directory, "vectors.bin")
+        self._keys_path = os.path.join(self.directory, "keys.bin")
+        self._index_path = os.path.join(self.directory, "index.json")
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._free: List[int] = []
+        self._dim: Optional[int] = None
+        self._capacity = 0
+        self._mmap: Optional[np.memmap] = None
+        self._keys: Optional[np.memmap] = None
+        self._dirty = False
+        self.counters: Dict[str, int] = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalid": 0}
+        self._open()
+
+    def _open(self):
+        if not os.path.exists(self._index_path):
+            return
+        with open(self._index_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        capacity, dim = meta.get("capacity", 0), meta.get("dim", 0)
+        if (meta.get("version") != _INDEX_VERSION or meta.get("model") != self.model_name
+                or meta.get("dtype") != self.dtype.name
+                or _size(self._vectors_path) < capacity * dim * self.dtype.itemsize
+                or _size(self._keys_path) < capacity * _TAG_SIZE):
+            # Another configuration, an older layout or missing slots: start over rather than return wrong vectors
+            return
+        self._dim = meta["dim"]
+        self._capacity = meta["capacity"]
+        self._index = OrderedDict((key, slot) for key, slot in meta["entries"])
+        used = set(self._index.values())
+        self._free = [slot for slot in range(self._capacity - 1, -1, -1) if slot not in used]
+        self._map()
+
+    def _map(self):
+        self._mmap = np.memmap(self._vectors_path, dtype=self.dtype, mode="r+", shape=(self._capacity, self._dim))
+        self._keys = np.memmap(self._keys_path, dtype=np.uint8, mode="r+", shape=(self._capacity, _TAG_SIZE))
+
+    def _grow(self, capacity: int):
+        """Extends vectors.bin and keys.bin to capacity slots and remaps them."""
+        os.makedirs(self.directory, exist_ok=True)
+        if self._mmap is not None:
+            self._mmap.flush()
+            self._keys.flush()
+            self._mmap = self._keys = None
+        for path, size in ((self._vectors_path, capacity * self._dim * self.dtype.itemsize),
+                           (self._keys_path, capacity * _TAG_SIZE)):
+            with open(path, "ab") as f:
+                # Another process may already have grown the file further
+                if f.tell() < size:
+                    f.truncate(size)
+        self._free.extend(range(capacity - 1, self._capacity - 1, -1))
+        self._capacity = capacity
+        self._map()
+
+    def _allocate(self) -> int:
+        if len(self._index) >= self.max_entries:
+            _, slot = self._index.popitem(last=False)
+            self.counters["evictions"] += 1
+            return slot
+        if not self._free:
+            self._grow(min(max(self._capacity * 2, _INITIAL_CAPACITY), self.max_entries))
+        return self._free.pop()
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        """Vectors for keys (None for misses); hits become most recently used."""
+        results: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for key in keys:
+                slot = self._index.get(key)
+                vector = None
+                if slot is not None:
+                    tag = _tag(key)
+                    if np.array_equal(self._keys[slot], tag):
+                        vector = np.array(self._mmap[slot], dtype=np.float32)
+                        # A writer clears the tag before it overwrites the vector
+                        if not np.array_equal(self._keys[slot], tag):
+                            vector = None
+                    if vector is None:
+                        # The slot now holds another key's vector; it is left to its new owner
+                        del self._index[key]
+                        self.counters["invalid"] += 1
+                        self._dirty = True
+                if vector is None:
+                    self.counters["misses"] += 1
+                    results.append(None)
+                    continue
+                self._index.move_to_end(key)
+                self.counters["hits"] += 1
+                results.append(vector)
+        return results
+
+    def put_many(self, keys: List[str], vectors: List[List[float]]):
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                vector = np.asarray(vector, dtype=np.float32)
+                if self._dim is None:
+                    self._dim = vector.shape[0]
+                elif vector.shape[0] != self._dim:
+                    raise ValueError(f"embedding dim {vector.shape[0]} does not match cache dim {self._dim}")
+                slot = self._index.get(key)
+                if slot is None:
+                    slot = self._allocate()
+                    self._index[key] = slot
+                else:
+                    self._index.move_to_end(key)
+                self._keys[slot] = 0
+                self._mmap[slot] = vector
+                self._keys[slot] = _tag(key)
+                self.counters["stores"] += 1
+            self._dirty = True
+
+    def flush(self):
+        """Writes the vectors and the index (atomically) to disk."""
+        with self._lock:
+            if not self._dirty or self._mmap is None:
+                return
+            self._mmap.flush()
+            self._keys.flush()
+            # Per process, so concurrent flushes do not write into the same temporary file
+            tmp_path = f"{self._index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": _INDEX_VERSION, "model": self.model_name, "dim": self._dim,
+                           "dtype": self.dtype.name, "capacity": self._capacity,
+                           "entries": list(self._index.items())}, f)
+            os.replace(tmp_path, self._index_path)
+            self._dirty = False
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {**self.counters, "entries": len(self._index),
+                    "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+                    "bytes": self._capacity * (self._dim or 0) * self.dtype.itemsize}
+
+    def __len__(self):
+        return len(self._index)
+
+
+class CachedEmbeddings:
+    """
+    Embeddings wrapper that only sends cache misses to the underlying model.
+    只把快取未命中的文字交給底層模型的 Embeddings 包裝器。
+    """
+    def __init__(self, embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def _embed(self, texts: List[str], kind: str) -> List[List[float]]:
+        keys = [text_key(t, kind) for t in texts]
+        cached = self.cache.get_many(keys)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if missing:
+            # Identical texts in one call are embedded once
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            if kind == "query":
+                computed = [self.embeddings.embed_query(unique[0])]
+            else:
+                computed = self.embeddings.embed_documents(unique)
+            by_text = dict(zip(unique, computed))
+            self.cache.put_many([text_key(t, kind) for t in unique], computed)
+            for i in missing:
+                cached[i] = by_text[texts[i]]
+        return [vector.tolist() if isinstance(vector, np.ndarray) else list(vector) for vector in cached]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._embed(texts, "doc")
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], "query")[0]
+
+
+_caches: Dict[str, CachedEmbeddings] = {}
+_caches_lock = threading.Lock()
+
+
+def cached_embeddings(embeddings, model_name: Optional[str] = None):
+    """
+    Returns the process-wide cached wrapper for embeddings (or embeddings itself when disabled).
+    回傳整個行程共用的快取包裝 (停用快取時直接回傳原本的 embeddings)。
+    """
+    if not EMBEDDING_CACHE_ENABLED:
+        return embeddings
+    model_name = (model_name or getattr(embeddings, "cache_name", None)
+                  or getattr(embeddings, "model_name", type(embeddings).__name__))
+    with _caches_lock:
+        wrapper = _caches.get(model_name)
+        if wrapper is None or wrapper.embeddings is not embeddings:
+            if wrapper is not None:
+                wrapper.cache.flush()
+            wrapper = CachedEmbeddings(embeddings, EmbeddingCache(model_name))
+            _caches[model_name] = wrapper
+        return wrapper
@@ -0,0 +1,204 @@
+"""
+Process-wide embedding model pool.
+整個行程共用的 Embedding 模型池：模型在第一次使用 (或明確預熱) 時才載入，
+之後每次切片流程與每個 API 請求都重用同一個已載入的模型。
+
+All encode calls go through one queue served by a single worker thread, so callers
+on different threads never run the model concurrently and their requests are
+coalesced into larger batches.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from embedding_backends import BackendConfig, EMBEDDING_BACKEND, backend_id, create_backend
+
+EMBEDDING_MODEL = os.environ.get("CHUNKING_EMBEDDING_MODEL", "Qwen/Qwen3-Embedding-0.6B")
+# "cpu", "cuda", "cuda:1", "mps" ...
+EMBEDDING_DEVICE = os.environ.get("CHUNKING_EMBEDDING_DEVICE", "cpu")
+# torch intra-op threads; 0 keeps the torch default
+EMBEDDING_THREADS = int(os.environ.get("CHUNKING_EMBEDDING_THREADS", "0"))
+EMBEDDING_BATCH_SIZE = int(os.environ.get("CHUNKING_EMBEDDING_BATCH_SIZE", "32"))
+
+_STOP = object()
+
+
+class _EncodeRequest:
+    __slots__ = ("texts", "is_query", "future")
+
+    def __init__(self, texts: List[str], is_query: bool):
+        self.texts = texts
+        self.is_query = is_query
+        self.future: Future = Future()
+
+
+class SharedEmbeddings:
+    """
+    A lazily loaded model behind a thread-safe encode queue; usable wherever LangChain expects Embeddings.
+    延遲載入的模型與執行緒安全的編碼佇列，可直接當作 LangChain 的 Embeddings 使用。
+    """
+    def __init__(self, model_name: str = EMBEDDING_MODEL, device: str = EMBEDDING_DEVICE,
+                 threads: int = EMBEDDING_THREADS, batch_size: int = EMBEDDING_BATCH_SIZE,
+                 backend: str = EMBEDDING_BACKEND):
+        self.model_name = model_name
+        self.device = device
+        self.threads = threads
+        self.batch_size = batch_size
+        self.backend = backend
+        self.config = BackendConfig(model_name=model_name, device=device, threads=threads, batch_size=batch_size)
+        self._model: Optional[Any] = None
+        self._load_lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, float] = {"load_seconds": 0.0, "requests": 0, "texts": 0,
+                                         "batches": 0, "encode_seconds": 0.0}
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def cache_name(self) -> str:
+        """Names the vectors this backend produces; quantized or ONNX vectors get their own cache."""
+        return backend_id(self.backend, self.config)
+
+    def _load(self):
+        with self._load_lock:
+            if self._model is None:
+                start = time.perf_counter()
+                # The backend (see embedding_backends.py) only imports its own dependencies
+                self._model = create_backend(self.backend, self.config)
+                self._stats["load_seconds"] = round(time.perf_counter() - start, 4)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._serve, name=f"embed-{self.model_name}", daemon=True)
+                self._worker.start()
+            return self._model
+
+    def warm_up(self) -> "SharedEmbeddings":
+        """Loads the model and runs one encode so the first real request pays nothing."""
+        self._load()
+        self.embed_documents(["warm up"])
+        return self
+
+    def _serve(self):
+        while True:
+            request = self._queue.get()
+            if request is _STOP:
+                return
+            if request.is_query:
+                self._run([request], lambda texts: [self._model.embed_query(texts[0])])
+                continue
+            # Coalesce whatever document requests are already waiting into one batch
+            batch = [request]
+            size = len(request.texts)
+            held = None
+            while size < self.batch_size:
+                try:
+                    nxt = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is _STOP or nxt.is_query:
+                    held = nxt
+                    break
+                batch.append(nxt)
+                size += len(nxt.texts)
+            self._run(batch, self._model.embed_documents)
+            if held is _STOP:
+                return
+            if held is not None:
+                self._run([held], lambda texts: [self._model.embed_query(texts[0])])
+
+    def _run(self, batch: List[_EncodeRequest], encode):
+        texts = [t for request in batch for t in request.texts]
+        start = time.perf_counter()
+        try:
+            vectors = encode(texts)
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["encode_seconds"] += time.perf_counter() - start
+        offset = 0
+        for request in batch:
+            request.future.set_result(vectors[offset:offset + len(request.texts)])
+            offset += len(request.texts)
+
+    def _submit(self, texts: List[str], is_query: bool) -> List[List[float]]:
+        if self._model is None or self._worker is None:
+            self._load()
+        request = _EncodeRequest(list(texts), is_query)
+        with self._stats_lock:
+            self._stats["requests"] += 1
+            self._stats["texts"] += len(request.texts)
+        self._queue.put(request)
+        return request.future.result()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._submit(texts, is_query=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit([text], is_query=True)[0]
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["encode_seconds"] = round(stats["encode_seconds"], 4)
+        stats["backend"] = self.cache_name
+        return stats
+
+    def close(self):
+        """Stops the worker thread; the model is released with the object."""
+        if self._worker is not None:
+            self._queue.put(_STOP)
+            self._worker.join()
+            self._worker = None
+
+
+class EmbeddingModelRegistry:
+    """
+    One SharedEmbeddings per (backend, model, device) for the whole process.
+    每個 (後端, 模型, 裝置) 組合在整個行程中只有一個 SharedEmbeddings。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models: Dict[Tuple[str, str, str], SharedEmbeddings] = {}
+
+    def get(self, model_name: str = EMBEDDING_MODEL, device: str = EMBEDDING_DEVICE,
+            threads: int = EMBEDDING_THREADS, batch_size: int = EMBEDDING_BATCH_SIZE,
+            backend: str = EMBEDDING_BACKEND) -> SharedEmbeddings:
+        key = (backend, model_name, device)
+        with self._lock:
+            embeddings = self._models.get(key)
+            if embeddings is None:
+                embeddings = SharedEmbeddings(model_name, device, threads, batch_size, backend)
+                self._models[key] = embeddings
+            return embeddings
+
+    def close_all(self):
+        with self._lock:
+            models, self._models = list(self._models.values()), {}
+        for embeddings in models:
+            embeddings.close()
+
+
+registry = EmbeddingModelRegistry()
+
+
+def get_embeddings(model_name: str = EMBEDDING_MODEL, device: str = EMBEDDING_DEVICE,
+                   backend: str = EMBEDDING_BACKEND) -> SharedEmbeddings:
+    """Returns the shared (not yet necessarily loaded) embeddings for model_name on device."""
+    return registry.get(model_name, device, backend=backend)
+
+
+def warm_up(model_name: str = EMBEDDING_MODEL, device: str = EMBEDDING_DEVICE,
+            backend: str = EMBEDDING_BACKEND) -> SharedEmbeddings:
+    """Loads the shared model now instead of on the first semantic split."""
+    return registry.get(model_name, device, backend=backend).warm_up()
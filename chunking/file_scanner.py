@@ -0,0 +1,294 @@
+"""
+Shared source-file scanner used by DocumentCollector and the chunking graph.
+DocumentCollector 與切片流程共用的文件掃描器：基於 os.scandir，
+支援 .gitignore 風格的排除規則、提前剪枝目錄、O(1) 副檔名查找與大小/深度限制。
+"""
+import os
+import re
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+# Directories that never contain source we want to ingest: VCS metadata, dependency
+# and tool caches, virtualenvs and this project's own state
+# 永遠不需要掃描的目錄：版本控制、相依套件與工具快取、虛擬環境，以及本專案的狀態目錄
+VCS_AND_CACHE_EXCLUDES = (
+    ".git/", ".hg/", ".svn/", "node_modules/", "__pycache__/", ".venv/", "venv/",
+    ".tox/", ".mypy_cache/", ".pytest_cache/", ".idea/", ".vscode/", ".gradle/",
+    ".chunking_state/",
+)
+# Usual build-output directory names; projects also use them for real source (a Go
+# package named build, an out/ module), so they are only pruned on request
+# 常見的建置輸出目錄；也可能是真正的原始碼目錄，因此只在 CHUNKING_EXCLUDE_BUILD_DIRS=1 時排除
+BUILD_OUTPUT_EXCLUDES = ("build/", "dist/", "target/", "out/")
+EXCLUDE_BUILD_DIRS = os.environ.get("CHUNKING_EXCLUDE_BUILD_DIRS", "0") == "1"
+DEFAULT_EXCLUDES = VCS_AND_CACHE_EXCLUDES + (BUILD_OUTPUT_EXCLUDES if EXCLUDE_BUILD_DIRS else ())
+# CHUNKING_EXTENSION_IGNORE_CASE=1 also matches e.g. "Main.PY" for ".py"; suffixes are case-sensitive by default
+# CHUNKING_EXTENSION_IGNORE_CASE=1 時副檔名比對不分大小寫；預設區分大小寫
+EXTENSION_IGNORE_CASE = os.environ.get("CHUNKING_EXTENSION_IGNORE_CASE", "0") == "1"
+
+
+class ScannedFile(NamedTuple):
+    """A matching file; size and mtime are only filled in when stat was requested."""
+    path: str
+    size: Optional[int] = None
+    mtime: Optional[float] = None
+
+
+def _translate_glob(pattern: str) -> str:
+    """Translates a gitignore glob (with ** support) into a regex body."""
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "*":
+            if pattern[i:i + 3] == "**/":
+                out.append("(?:.*/)?")
+                i += 3
+                continue
+            if pattern[i:i + 2] == "**":
+                out.append(".*")
+                i += 2
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = end
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+class IgnoreRules:
+    """
+    A set of .gitignore-style patterns relative to a base directory.
+    一組相對於某個目錄的 .gitignore 風格規則，後面的規則優先，支援 "!" 反向規則。
+    """
+    def __init__(self, patterns: Iterable[str], base: str = ""):
+        self.base = base
+        # Plain basenames ("node_modules/", "*.min.js" is not plain) use a set lookup
+        self._plain = {}  # name -> (negate, dir_only, order)
+        self._rules: List[Tuple[re.Pattern, bool, bool, int]] = []
+        for order, raw in enumerate(patterns):
+            line = raw.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.strip("/") if dir_only else line
+            anchored = line.startswith("/") or "/" in line
+            line = line.lstrip("/")
+            if not line:
+                continue
+            if not anchored and not any(ch in line for ch in "*?["):
+                self._plain[line] = (negate, dir_only, order)
+                continue
+            prefix = "" if anchored else "(?:.*/)?"
+            regex = re.compile(f"^{prefix}{_translate_glob(line)}$")
+            self._rules.append((regex, negate, dir_only, order))
+
+    @classmethod
+    def from_file(cls, path: str, base: str = "") -> "IgnoreRules":
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return cls(f.readlines(), base)
+
+    def match(self, rel_path: str, name: str, is_dir: bool) -> Optional[bool]:
+        """
+        Returns True (ignored), False (re-included by "!") or None (no rule matched).
+        rel_path is relative to the scan root and uses "/" separators.
+        """
+        if self.base:
+            if not rel_path.startswith(self.base + "/"):
+                return None
+            rel_path = rel_path[len(self.base) + 1:]
+
+        best_order = -1
+        result = None
+        plain = self._plain.get(name)
+        if plain is not None and (is_dir or not plain[1]):
+            best_order, result = plain[2], not plain[0]
+        for regex, negate, dir_only, order in self._rules:
+            if order > best_order and (is_dir or not dir_only) and regex.match(rel_path):
+                best_order, result = order, not negate
+        return result
+
+
+def _normalize_extensions(extensions: Iterable[str], ignore_case: bool) -> Tuple[frozenset, bool]:
+    normalized = set()
+    compound = False
+    for ext in extensions:
+        ext = ext if ext.startswith(".") else f".{ext}"
+        normalized.add(ext.lower() if ignore_case else ext)
+        compound = compound or ext.count(".") > 1
+    return frozenset(normalized), compound
+
+
+def _has_extension(name: str, extensions: frozenset, compound: bool, ignore_case: bool) -> bool:
+    if ignore_case:
+        name = name.lower()
+    dot = name.rfind(".")
+    if dot == -1:
+        return False
+    if name[dot:] in extensions:
+        return True
+    if compound:
+        # e.g. ".d.ts": try every dotted suffix
+        dot = name.find(".")
+        while dot != -1:
+            if name[dot:] in extensions:
+                return True
+            dot = name.find(".", dot + 1)
+    return False
+
+
+def _walk(root: str, extensions: Optional[Iterable[str]], excludes: Sequence[str],
+          use_gitignore: bool, max_depth: Optional[int], include_dirs: bool,
+          ignore_case: bool = EXTENSION_IGNORE_CASE) -> Iterator[Tuple[os.DirEntry, bool]]:
+    """Shared pruning walk; yields (entry, is_dir) for kept files and, optionally, directories."""
+    if not os.path.isdir(root):
+        raise FileNotFoundError(f"找不到目錄: {os.path.abspath(root)}")
+
+    if extensions is not None:
+        ext_set, compound = _normalize_extensions(extensions, ignore_case)
+    base_rules = [IgnoreRules(excludes)] if excludes else []
+
+    # (directory path, path relative to root, depth, rule sets in effect)
+    stack = [(root, "", 0, base_rules)]
+    while stack:
+        dir_path, rel_dir, depth, rules = stack.pop()
+        try:
+            with os.scandir(dir_path) as it:
+                entries = list(it)
+        except OSError:
+            continue
+
+        if use_gitignore and any(e.name == ".gitignore" for e in entries):
+            try:
+                rules = rules + [IgnoreRules.from_file(os.path.join(dir_path, ".gitignore"), rel_dir)]
+            except OSError:
+                pass
+
+        subdirs = []
+        for entry in entries:
+            name = entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if not is_dir and (extensions is None or not _has_extension(name, ext_set, compound, ignore_case)):
+                continue
+
+            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+            ignored = None
+            for rule_set in rules:
+                verdict = rule_set.match(rel_path, name, is_dir)
+                if verdict is not None:
+                    ignored = verdict
+            if ignored:
+                continue
+
+            if is_dir:
+                if max_depth is None or depth < max_depth:
+                    subdirs.append((entry.path, rel_path, depth + 1, rules))
+                    if include_dirs:
+                        yield entry, True
+                continue
+            yield entry, False
+
+        # Reverse so directories are visited in scandir order
+        stack.extend(reversed(subdirs))
+
+
+def scan_files(root: str, extensions: Iterable[str],
+               excludes: Sequence[str] = DEFAULT_EXCLUDES,
+               use_gitignore: bool = True,
+               max_depth: Optional[int] = None,
+               max_size: Optional[int] = None,
+               with_stat: bool = False,
+               ignore_case: bool = EXTENSION_IGNORE_CASE) -> Iterator[ScannedFile]:
+    """
+    Recursively yields files under root whose suffix is in extensions.
+    遞歸產出 root 底下副檔名符合的文件。
+
+    :param root: 掃描的根目錄
+    :param extensions: 副檔名 (".py" 或 "py" 皆可)
+    :param excludes: .gitignore 風格的排除規則，套用在 root 之下
+    :param use_gitignore: 是否讀取各層目錄中的 .gitignore
+    :param max_depth: 最大深度，0 表示只掃描 root 本身
+    :param max_size: 超過此大小 (bytes) 的文件會被略過
+    :param with_stat: 是否回傳 size 與 mtime，讓後續階段不必再 stat
+    :param ignore_case: 副檔名比對是否不分大小寫
+    """
+    need_stat = with_stat or max_size is not None
+    for entry, _ in _walk(root, extensions, excludes, use_gitignore, max_depth, include_dirs=False,
+                          ignore_case=ignore_case):
+        if not need_stat:
+            yield ScannedFile(entry.path)
+            continue
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        if max_size is not None and st.st_size > max_size:
+            continue
+        yield ScannedFile(entry.path, st.st_size, st.st_mtime)
+
+
+def scan_dirs(root: str, excludes: Sequence[str] = DEFAULT_EXCLUDES,
+              use_gitignore: bool = True, max_depth: Optional[int] = None) -> Iterator[str]:
+    """
+    Yields every directory under root (not root itself) that survives the exclude rules.
+    產出 root 底下所有未被排除的目錄 (不含 root 本身)，供監看模式註冊使用。
+    """
+    for entry, is_dir in _walk(root, None, excludes, use_gitignore, max_depth, include_dirs=True):
+        if is_dir:
+            yield entry.path
+
+
+def has_extension(name: str, extensions: Iterable[str], ignore_case: bool = EXTENSION_IGNORE_CASE) -> bool:
+    """Single-name version of the suffix check used by scan_files."""
+    ext_set, compound = _normalize_extensions(extensions, ignore_case)
+    return _has_extension(name, ext_set, compound, ignore_case)
+
+
+def is_excluded(root: str, path: str, excludes: Sequence[str] = DEFAULT_EXCLUDES,
+                use_gitignore: bool = True) -> bool:
+    """
+    Applies the same rules as scan_files to a single path under root.
+    對 root 底下的單一路徑套用與 scan_files 相同的排除規則 (用於監看事件)。
+    """
+    rel = os.path.relpath(path, root).replace(os.sep, "/")
+    if rel.startswith("../"):
+        return True
+    parts = rel.split("/")
+    rules = [IgnoreRules(excludes)] if excludes else []
+    dir_path, rel_dir = root, ""
+    for i, name in enumerate(parts):
+        if use_gitignore:
+            gitignore = os.path.join(dir_path, ".gitignore")
+            if os.path.isfile(gitignore):
+                try:
+                    rules.append(IgnoreRules.from_file(gitignore, rel_dir))
+                except OSError:
+                    pass
+        rel_path = f"{rel_dir}/{name}" if rel_dir else name
+        is_dir = i < len(parts) - 1
+        ignored = None
+        for rule_set in rules:
+            verdict = rule_set.match(rel_path, name, is_dir)
+            if verdict is not None:
+                ignored = verdict
+        if ignored:
+            return True
+        dir_path, rel_dir = os.path.join(dir_path, name), rel_path
+    return False
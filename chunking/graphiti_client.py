@@ -0,0 +1,261 @@
+"""
+Process-wide Graphiti / Neo4j client manager.
+整個行程共用的 Graphiti / Neo4j 客戶端：連線池只建立一次，匯入 (同步的切片流程) 與檢索 (FastAPI 的 async 端點)
+都重用同一個客戶端，不必每次請求都重新連線與握手。
+
+The Neo4j async driver is bound to the event loop it runs on, while ingestion runs in
+asyncio.run() calls and worker threads. The manager therefore owns one background
+event loop; sync code submits coroutines with run(), async code awaits arun(), and
+both end up on the same loop, client and Bolt connection pool.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from graphiti_core import Graphiti
+from graphiti_core.driver.neo4j_driver import Neo4jDriver
+from neo4j import AsyncGraphDatabase
+
+T = TypeVar("T")
+
+NEO4J_URI = os.environ.get("NEO4J_URI", "bolt://localhost:7687")
+NEO4J_USER = os.environ.get("NEO4J_USER", "neo4j")
+NEO4J_PASSWORD = os.environ.get("NEO4J_PASSWORD", "password")
+NEO4J_DATABASE = os.environ.get("NEO4J_DATABASE", "neo4j")
+# Bolt connection pool (see the neo4j driver configuration of the same names)
+NEO4J_MAX_CONNECTION_POOL_SIZE = int(os.environ.get("NEO4J_MAX_CONNECTION_POOL_SIZE", "50"))
+NEO4J_CONNECTION_ACQUISITION_TIMEOUT = float(os.environ.get("NEO4J_CONNECTION_ACQUISITION_TIMEOUT", "60"))
+NEO4J_CONNECTION_TIMEOUT = float(os.environ.get("NEO4J_CONNECTION_TIMEOUT", "30"))
+NEO4J_MAX_CONNECTION_LIFETIME = float(os.environ.get("NEO4J_MAX_CONNECTION_LIFETIME", "3600"))
+# Idle connections older than this are pinged before reuse; empty disables the check
+NEO4J_LIVENESS_CHECK_TIMEOUT = os.environ.get("NEO4J_LIVENESS_CHECK_TIMEOUT", "30")
+# "neo4j" (Graphiti on Neo4j) or "memory" (in-process stand-in for offline tests and benchmarks, see memory_graph.py)
+GRAPH_BACKEND = os.environ.get("CHUNKING_GRAPH_BACKEND", "neo4j")
+# Seconds between background connectivity checks; 0 disables them
+GRAPHITI_HEALTH_INTERVAL = float(os.environ.get("CHUNKING_GRAPHITI_HEALTH_INTERVAL", "30"))
+GRAPHITI_HEALTH_TIMEOUT = float(os.environ.get("CHUNKING_GRAPHITI_HEALTH_TIMEOUT", "5"))
+
+
+@dataclass
+class Neo4jConfig:
+    """Connection and pool settings of the shared client."""
+    uri: str = NEO4J_URI
+    user: str = NEO4J_USER
+    password: str = NEO4J_PASSWORD
+    database: str = NEO4J_DATABASE
+    max_connection_pool_size: int = NEO4J_MAX_CONNECTION_POOL_SIZE
+    connection_acquisition_timeout: float = NEO4J_CONNECTION_ACQUISITION_TIMEOUT
+    connection_timeout: float = NEO4J_CONNECTION_TIMEOUT
+    max_connection_lifetime: float = NEO4J_MAX_CONNECTION_LIFETIME
+    liveness_check_timeout: Optional[float] = field(
+        default_factory=lambda: float(NEO4J_LIVENESS_CHECK_TIMEOUT) if NEO4J_LIVENESS_CHECK_TIMEOUT else None)
+
+    def driver_kwargs(self) -> Dict[str, Any]:
+        return {
+            "max_connection_pool_size": self.max_connection_pool_size,
+            "connection_acquisition_timeout": self.connection_acquisition_timeout,
+            "connection_timeout": self.connection_timeout,
+            "max_connection_lifetime": self.max_connection_lifetime,
+            "liveness_check_timeout": self.liveness_check_timeout,
+        }
+
+
+async def connect_graphiti(config: Neo4jConfig) -> Graphiti:
+    """
+    Builds the Graphiti client on a Neo4jDriver whose Bolt driver uses config's pool settings.
+    Runs on the manager's loop, where Neo4jDriver also schedules its index creation.
+    """
+    driver = Neo4jDriver(uri=config.uri, user=config.user, password=config.password, database=config.database)
+    # Neo4jDriver does not expose the pool options, so its (still unused) Bolt driver is replaced
+    default_client = driver.client
+    driver.client = AsyncGraphDatabase.driver(config.uri, auth=(config.user, config.password),
+                                              **config.driver_kwargs())
+    await default_client.close()
+    return Graphiti(graph_driver=driver)
+
+
+async def _connect_memory_graph(config: Neo4jConfig) -> Any:
+    # Imported on demand so the Neo4j backend never loads the in-memory indexes
+    from memory_graph import connect_memory_graph
+    return await connect_memory_graph(config)
+
+
+GRAPH_BACKENDS: Dict[str, Callable[[Neo4jConfig], Awaitable[Any]]] = {
+    "neo4j": connect_graphiti,
+    "memory": _connect_memory_graph,
+}
+
+
+def backend_factory(name: str = GRAPH_BACKEND) -> Callable[[Neo4jConfig], Awaitable[Any]]:
+    try:
+        return GRAPH_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"未知的圖後端 '{name}'，可用: {', '.join(sorted(GRAPH_BACKENDS))}") from None
+
+
+class GraphitiClientManager:
+    """
+    Owns one Graphiti client and the event loop thread it runs on.
+    持有唯一的 Graphiti 客戶端與其執行所在的事件迴圈執行緒。
+    """
+    def __init__(self, config: Optional[Neo4jConfig] = None,
+                 client_factory: Optional[Callable[[Neo4jConfig], Awaitable[Any]]] = None,
+                 health_interval: float = GRAPHITI_HEALTH_INTERVAL,
+                 health_timeout: float = GRAPHITI_HEALTH_TIMEOUT):
+        self.config = config or Neo4jConfig()
+        # Defaults to the backend selected by CHUNKING_GRAPH_BACKEND
+        self.client_factory = client_factory or backend_factory()
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[Any] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, Any] = {"connect_seconds": 0.0, "calls": 0, "failed_calls": 0,
+                                       "health_checks": 0, "health_failures": 0}
+        self._health: Dict[str, Any] = {"status": "unknown"}
+
+    @property
+    def started(self) -> bool:
+        return self._client is not None
+
+    def start(self) -> "GraphitiClientManager":
+        """Starts the loop thread and creates the client; safe to call repeatedly and from any thread."""
+        with self._lock:
+            if self._client is not None:
+                return self
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="graphiti-io", daemon=True)
+                thread.start()
+                self._loop, self._thread = loop, thread
+            start = time.perf_counter()
+            self._client = asyncio.run_coroutine_threadsafe(self.client_factory(self.config), self._loop).result()
+            self._stats["connect_seconds"] = round(time.perf_counter() - start, 4)
+            if self.health_interval > 0:
+                self._loop.call_soon_threadsafe(self._start_health_checks)
+        return self
+
+    async def astart(self) -> "GraphitiClientManager":
+        return await asyncio.to_thread(self.start)
+
+    @property
+    def client(self) -> Any:
+        """The shared client; only use it inside coroutines passed to run() / arun() / submit()."""
+        return self.start()._client
+
+    def submit(self, call: Callable[[Any], Awaitable[T]]) -> "Future[T]":
+        """Schedules call(client) on the manager's loop without waiting for it."""
+        client = self.client
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("不可在 Graphiti 事件迴圈執行緒內同步等待 (請直接 await)")
+        future = asyncio.run_coroutine_threadsafe(call(client), self._loop)
+        future.add_done_callback(self._count_call)
+        return future
+
+    def run(self, call: Callable[[Any], Awaitable[T]], timeout: Optional[float] = None) -> T:
+        """Runs call(client) on the manager's loop and blocks for its result (for sync code)."""
+        return self.submit(call).result(timeout)
+
+    async def arun(self, call: Callable[[Any], Awaitable[T]]) -> T:
+        """Awaits call(client) on the manager's loop from any other event loop."""
+        return await asyncio.wrap_future(self.submit(call))
+
+    def _count_call(self, future: Future):
+        with self._stats_lock:
+            self._stats["calls"] += 1
+            if future.cancelled() or future.exception() is not None:
+                self._stats["failed_calls"] += 1
+
+    # --- health ---
+    async def _check(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            driver = getattr(self._client, "driver", None)
+            if driver is not None:
+                await asyncio.wait_for(driver.health_check(), self.health_timeout)
+            health = {"status": "ok"}
+        except Exception as e:
+            health = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+        health["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        health["checked_at"] = time.time()
+        with self._stats_lock:
+            self._stats["health_checks"] += 1
+            if health["status"] != "ok":
+                self._stats["health_failures"] += 1
+            self._health = health
+        return health
+
+    def _start_health_checks(self):
+        async def loop():
+            while True:
+                await self._check()
+                await asyncio.sleep(self.health_interval)
+        self._health_task = asyncio.ensure_future(loop())
+
+    def health(self) -> Dict[str, Any]:
+        """Checks connectivity now and returns {"status": "ok"|"error", "latency_ms", ...}."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self._check(), self._loop).result()
+
+    async def ahealth(self) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.health)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = {**self._stats, "started": self.started, "health": dict(self._health),
+                     "max_connection_pool_size": self.config.max_connection_pool_size}
+        client_stats = getattr(self._client, "stats", None)
+        if callable(client_stats):
+            # e.g. the index sizes of the in-memory backend
+            stats["client"] = client_stats()
+        return stats
+
+    def close(self):
+        """Closes the client (and its connection pool) and stops the loop thread."""
+        with self._lock:
+            loop, thread, client = self._loop, self._thread, self._client
+            self._loop = self._thread = self._client = None
+            if loop is None:
+                return
+
+            async def shutdown():
+                if self._health_task is not None:
+                    self._health_task.cancel()
+                    self._health_task = None
+                if client is not None and hasattr(client, "close"):
+                    await client.close()
+
+            try:
+                asyncio.run_coroutine_threadsafe(shutdown(), loop).result(self.health_timeout + 10)
+            finally:
+                loop.call_soon_threadsafe(loop.stop)
+                thread.join()
+                loop.close()
+
+
+_manager: Optional[GraphitiClientManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_manager() -> GraphitiClientManager:
+    """The process-wide manager used by ingestion and retrieval (not started until first use)."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = GraphitiClientManager()
+        return _manager
+
+
+def set_manager(manager: GraphitiClientManager) -> Optional[GraphitiClientManager]:
+    """Replaces the process-wide manager (e.g. with an offline client) and returns the previous one."""
+    global _manager
+    with _manager_lock:
+        previous, _manager = _manager, manager
+        return previous
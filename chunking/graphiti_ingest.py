@@ -0,0 +1,240 @@
+"""
+Batched, concurrent Graphiti ingestion.
+批次並行匯入 Graphiti：episodes 依 batch_size 分批送出，同時在途的批次數量有上限，
+每個批次失敗時以指數退避重試；重試用盡的批次會列在失敗報告中，不影響其他批次。
+
+A source file counts as ingested only when every batch holding one of its episodes
+succeeded, so callers record exactly those files in the manifest and checkpoint and a
+later run retries the rest. All batches run on the shared Graphiti client's event loop
+(see graphiti_client.py); the concurrency limit applies across every caller of one
+BatchIngestor, e.g. all ingest workers of the streaming pipeline.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, TypeVar
+
+from graphiti_core.errors import NodeNotFoundError
+from graphiti_core.utils.bulk_utils import RawEpisode
+
+from graphiti_client import GraphitiClientManager, get_manager
+from retrieval_cache import invalidate_retrieval_cache
+from run_metrics import RunMetrics
+
+T = TypeVar("T")
+
+# Episodes per add_episode_bulk call
+INGEST_BATCH_SIZE = int(os.environ.get("CHUNKING_INGEST_BATCH_SIZE", "64"))
+# Batches in flight at once
+INGEST_CONCURRENCY = int(os.environ.get("CHUNKING_INGEST_CONCURRENCY", "2"))
+# Retries per batch after the first attempt; delays are backoff * 2**retry (capped, with jitter)
+INGEST_RETRIES = int(os.environ.get("CHUNKING_INGEST_RETRIES", "3"))
+INGEST_BACKOFF = float(os.environ.get("CHUNKING_INGEST_BACKOFF", "1.0"))
+INGEST_BACKOFF_MAX = float(os.environ.get("CHUNKING_INGEST_BACKOFF_MAX", "30"))
+# Seconds one add_episode_bulk call may take before it counts as a failed attempt; 0 disables
+INGEST_TIMEOUT = float(os.environ.get("CHUNKING_INGEST_TIMEOUT", "0"))
+
+
+@dataclass
+class IngestConfig:
+    """Batch size, concurrency and retry policy of Graphiti ingestion."""
+    batch_size: int = INGEST_BATCH_SIZE
+    concurrency: int = INGEST_CONCURRENCY
+    retries: int = INGEST_RETRIES
+    backoff: float = INGEST_BACKOFF
+    backoff_max: float = INGEST_BACKOFF_MAX
+    timeout: float = INGEST_TIMEOUT
+
+
+@dataclass
+class IngestReport:
+    """Outcome of one ingest() call."""
+    episodes: int = 0
+    batches: int = 0
+    # One entry per batch that still failed after its retries
+    failures: List[Dict[str, Any]] = field(default_factory=list)
+    # Sources with at least one episode in a failed batch
+    failed_sources: Set[str] = field(default_factory=set)
+    # Episode name -> uuid Graphiti assigned, for every episode of a successful batch
+    uuids: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return not self.failures
+
+
+class IngestError(RuntimeError):
+    """Raised by the graph nodes after ingesting everything else when some batches or removals failed."""
+    def __init__(self, failures: List[Dict[str, Any]]):
+        self.failures = failures
+        sources = sorted({source for failure in failures for source in failure["sources"]})
+        super().__init__(f"{len(failures)} 個 Graphiti 匯入或撤回操作重試後仍失敗，涉及 {len(sources)} 個文件")
+
+
+def _percentile(values: Sequence[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class BatchIngestor:
+    """
+    Sends (source, episode) pairs to Graphiti in bounded, retried, concurrent batches.
+    以有上限的並行批次 (含重試) 將 (來源, episode) 送入 Graphiti。
+    """
+    def __init__(self, metrics: RunMetrics, config: Optional[IngestConfig] = None,
+                 manager: Optional[GraphitiClientManager] = None):
+        self.metrics = metrics
+        self.config = config or IngestConfig()
+        self.manager = manager or get_manager()
+        self._lock = threading.Lock()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._latencies: List[float] = []
+        self._episodes = 0
+        self._batches = 0
+        self._failures: List[Dict[str, Any]] = []
+        self._first_start: Optional[float] = None
+        self._last_end: Optional[float] = None
+
+    def ingest(self, items: Sequence[Tuple[str, RawEpisode]]) -> IngestReport:
+        """Ingests the episodes and blocks until every batch succeeded or ran out of retries."""
+        if not items:
+            return IngestReport()
+        size = max(1, self.config.batch_size)
+        batches = [list(items[i:i + size]) for i in range(0, len(items), size)]
+        with self._lock:
+            first_batch = self._batches
+            self._batches += len(batches)
+        uuids: Dict[str, str] = {}
+        results = self.manager.run(lambda client: self._gather(
+            self._ingest_batch(client, batch, first_batch + i, uuids) for i, batch in enumerate(batches)))
+        report = self._report(len(items), batches, results)
+        report.uuids = uuids
+        return report
+
+    def remove(self, items: Sequence[Tuple[str, str]]) -> IngestReport:
+        """
+        Removes the (source, episode uuid) episodes, one remove_episode call each, under the
+        same concurrency limit and retry policy. Episodes that no longer exist count as removed.
+        """
+        if not items:
+            return IngestReport()
+        results = self.manager.run(lambda client: self._gather(
+            self._remove_episode(client, source, uuid) for source, uuid in items))
+        return self._report(len(items), [[item] for item in items], results)
+
+    def _report(self, episodes: int, batches: List[List[Tuple[str, Any]]],
+                results: List[Optional[Dict[str, Any]]]) -> IngestReport:
+        report = IngestReport(episodes=episodes, batches=len(batches))
+        for batch, failure in zip(batches, results):
+            if failure is not None:
+                report.failures.append(failure)
+                report.failed_sources.update(source for source, _ in batch)
+        if report.failures:
+            with self._lock:
+                self._failures.extend(report.failures)
+            self.metrics.set("ingest_failures", list(self._failures))
+        self.metrics.set("ingest", self.stats())
+        return report
+
+    async def _gather(self, calls: Iterable[Awaitable[T]]) -> List[T]:
+        if self._semaphore is None:
+            # Created on the manager's loop, shared by every call of this ingestor
+            self._semaphore = asyncio.Semaphore(max(1, self.config.concurrency))
+        return await asyncio.gather(*calls)
+
+    async def _retrying(self, call: Callable[[], Awaitable[Any]], label: str,
+                        done: Tuple[type, ...] = ()) -> Tuple[Optional[Exception], int]:
+        """
+        Runs call() under the concurrency limit until it succeeds, raises one of done, or
+        runs out of retries; returns (last error or None, attempts).
+        """
+        config = self.config
+        async with self._semaphore:
+            for attempt in range(config.retries + 1):
+                try:
+                    await (asyncio.wait_for(call(), config.timeout) if config.timeout > 0 else call())
+                    return None, attempt + 1
+                except done:
+                    return None, attempt + 1
+                except Exception as e:
+                    self.metrics.record_error("send_to_graphiti", e, f"{label} attempt {attempt + 1}")
+                    if attempt == config.retries:
+                        return e, attempt + 1
+                    self.metrics.incr("ingest_retries")
+                    delay = min(config.backoff_max, config.backoff * 2 ** attempt)
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+    async def _ingest_batch(self, client: Any, batch: List[Tuple[str, RawEpisode]],
+                            index: int, uuids: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """
+        Returns None on success, otherwise the batch's failure report entry. On success the
+        uuids Graphiti assigned (its results keep the input order) are added to uuids by name.
+        """
+        episodes = [episode for _, episode in batch]
+        timing: Dict[str, float] = {}
+
+        async def call():
+            timing["start"] = start = time.perf_counter()
+            with self._lock:
+                if self._first_start is None:
+                    self._first_start = start
+            result = await client.add_episode_bulk(episodes)
+            uuids.update((episode.name, node.uuid) for episode, node in zip(episodes, result.episodes))
+
+        error, attempts = await self._retrying(call, f"batch {index}")
+        if error is not None:
+            self.metrics.incr("ingest_batches_failed")
+            return {
+                "batch": index,
+                "episodes": len(episodes),
+                "first_episode": episodes[0].name,
+                "last_episode": episodes[-1].name,
+                "sources": sorted({source for source, _ in batch}),
+                "attempts": attempts,
+                "error": f"{type(error).__name__}: {error}",
+            }
+        end = time.perf_counter()
+        with self._lock:
+            self._latencies.append(end - timing["start"])
+            self._episodes += len(episodes)
+            self._last_end = end if self._last_end is None else max(self._last_end, end)
+        # Cached chatbot searches may be missing these episodes now
+        invalidate_retrieval_cache()
+        self.metrics.incr("episodes_ingested", len(episodes))
+        self.metrics.incr("ingest_batches")
+        self.metrics.add_bytes("send_to_graphiti", sum(len(e.content.encode("utf-8")) for e in episodes))
+        return None
+
+    async def _remove_episode(self, client: Any, source: str, uuid: str) -> Optional[Dict[str, Any]]:
+        error, attempts = await self._retrying(lambda: client.remove_episode(uuid), f"remove {uuid}",
+                                               done=(NodeNotFoundError,))
+        if error is not None:
+            self.metrics.incr("episodes_remove_failed")
+            return {"remove": uuid, "sources": [source], "attempts": attempts,
+                    "error": f"{type(error).__name__}: {error}"}
+        invalidate_retrieval_cache()
+        self.metrics.incr("episodes_removed")
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Throughput over the span from the first batch start to the last batch end, and batch latencies."""
+        with self._lock:
+            latencies = list(self._latencies)
+            span = (self._last_end - self._first_start) if self._last_end is not None else 0.0
+            episodes, failed = self._episodes, len(self._failures)
+        p50, p95 = _percentile(latencies, 0.5), _percentile(latencies, 0.95)
+        return {
+            "batch_size": self.config.batch_size,
+            "concurrency": self.config.concurrency,
+            "batches_ok": len(latencies),
+            "batches_failed": failed,
+            "episodes_per_second": round(episodes / span, 1) if span > 0 else None,
+            "batch_latency_p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+            "batch_latency_p95_ms": round(p95 * 1000, 2) if p95 is not None else None,
+            "batch_latency_max_ms": round(max(latencies) * 1000, 2) if latencies else None,
+        }
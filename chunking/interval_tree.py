@@ -0,0 +1,65 @@
+"""
+Static interval tree for overlap queries.
+靜態區間樹：建立一次後以 O(log n + k) 查詢與某個區間重疊的所有項目，
+用來把切片的行號範圍對應到 AST 符號的行號範圍。
+"""
+from typing import Generic, Iterable, List, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class IntervalTree(Generic[T]):
+    """
+    Closed intervals [start, end] stored as an implicit balanced BST over the start-sorted
+    array, each subtree annotated with its largest end.
+    以起點排序的陣列隱式表示平衡二元樹，每個子樹記錄其最大終點。
+    """
+    def __init__(self, intervals: Iterable[Tuple[int, int, T]]):
+        items = sorted(intervals, key=lambda item: (item[0], item[1]))
+        self._starts = [item[0] for item in items]
+        self._ends = [item[1] for item in items]
+        self._values = [item[2] for item in items]
+        self._max_end = [0] * len(items)
+        if items:
+            self._annotate(0, len(items))
+
+    def _annotate(self, lo: int, hi: int) -> int:
+        mid = (lo + hi) // 2
+        max_end = self._ends[mid]
+        if lo < mid:
+            max_end = max(max_end, self._annotate(lo, mid))
+        if mid + 1 < hi:
+            max_end = max(max_end, self._annotate(mid + 1, hi))
+        self._max_end[mid] = max_end
+        return max_end
+
+    def overlapping(self, start: int, end: int) -> List[T]:
+        """Values whose interval shares at least one point with [start, end], in start order."""
+        found: List[T] = []
+        # Iterative in-order walk; (lo, hi, expanded) frames keep results sorted by start
+        stack: List[Tuple[int, int, bool]] = [(0, len(self._starts), False)]
+        while stack:
+            lo, hi, expanded = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if expanded:
+                if self._ends[mid] >= start:
+                    found.append(self._values[mid])
+                continue
+            # Nothing in this subtree ends late enough to reach the query
+            if self._max_end[mid] < start:
+                continue
+            # Only the left subtree can hold intervals starting at or before end
+            if self._starts[mid] <= end:
+                stack.append((mid + 1, hi, False))
+                stack.append((lo, hi, True))
+            stack.append((lo, mid, False))
+        return found
+
+    def __len__(self):
+        return len(self._starts)
+
+    @property
+    def values(self) -> Sequence[T]:
+        return self._values
@@ -0,0 +1,167 @@
+"""
+Persistent ingestion manifest for incremental chunking runs.
+增量切片用的持久化匯入清單：記錄每個文件的大小、修改時間與內容雜湊，
+只把新增或修改過的文件交給後續階段，刪除的文件則留下墓碑 (tombstone)。
+
+Each corpus root has its own manifest, keyed by paths relative to the root, so the same
+tree gives the same keys however its path is written (relative, absolute, via a symlink).
+"""
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Persistent state lives next to the project configuration (this directory) rather than in
+# the working directory, so runs started from anywhere share it; CHUNKING_STATE_DIR overrides it
+STATE_DIR = os.environ.get("CHUNKING_STATE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                               ".chunking_state")
+MANIFEST_DIR = os.path.join(STATE_DIR, "manifests")
+
+_HASH_BLOCK_SIZE = 1 << 20
+
+
+def hash_file(file_path: str) -> str:
+    """Returns the sha256 hex digest of a file, read in fixed-size blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_path(root: str, directory: str = MANIFEST_DIR) -> str:
+    """The state file of one corpus root in directory, named after the root's resolved path."""
+    real_root = os.path.realpath(root)
+    digest = hashlib.sha256(real_root.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(directory, f"{os.path.basename(real_root) or 'root'}-{digest}.json")
+
+
+def relative_key(real_root: str, file_path: str) -> str:
+    """The root-relative, '/'-separated key of file_path; real_root must already be resolved."""
+    return os.path.relpath(os.path.realpath(file_path), real_root).replace(os.sep, "/")
+
+
+@dataclass
+class ManifestDiff:
+    """
+    Result of comparing the files on disk with the manifest.
+    磁碟上的文件與清單比對後的結果。
+    """
+    changed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    # path -> new manifest entry, applied only after the run succeeds
+    updates: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+
+class IngestManifest:
+    """
+    Tracks which files under root have already been ingested.
+    追蹤 root 底下哪些文件已經匯入過。
+
+    Methods take and return file paths; entries is keyed by root-relative POSIX paths
+    (see key()), and returned paths of files no longer on disk are joined to root as given.
+    """
+    def __init__(self, root: str, path: Optional[str] = None):
+        self.root = root
+        self.path = path or manifest_path(root)
+        self._real_root = os.path.realpath(root)
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f).get("files", {})
+
+    def key(self, file_path: str) -> str:
+        """The root-relative, '/'-separated manifest key of file_path."""
+        return relative_key(self._real_root, file_path)
+
+    def file_path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def diff(self, file_paths: Iterable[str], force: bool = False,
+             stats: Optional[Dict[str, Tuple[int, float]]] = None,
+             removed: Optional[Iterable[str]] = None, retract_pending: bool = False) -> ManifestDiff:
+        """
+        Splits file_paths into changed and unchanged files and finds deletions.
+        Size and mtime are checked first; the content hash is only computed when
+        they differ, so an untouched tree costs one stat per file.
+
+        :param file_paths: 目前在磁碟上的文件
+        :param force: 為 True 時視所有文件為已修改 (完整重建)，但仍更新清單
+        :param stats: 掃描時已取得的 path -> (size, mtime)，避免重複 stat
+        :param removed: 只比對部分路徑時 (例如監看模式)，明確指定已刪除的路徑；
+                        為 None 時，清單中不在 file_paths 內的文件都視為已刪除
+        :param retract_pending: 呼叫端會撤回墓碑 (並呼叫 mark_retracted) 時為 True：尚未撤回的墓碑
+                                會再次列入 deleted，直到撤回成功；否則每個刪除只回報一次
+        """
+        result = ManifestDiff()
+        seen = set()
+        for file_path in file_paths:
+            key = self.key(file_path)
+            seen.add(key)
+            known = stats.get(file_path) if stats else None
+            if known is None:
+                st = os.stat(file_path)
+                known = (st.st_size, st.st_mtime)
+            size, mtime = known
+            entry = self.entries.get(key)
+            live = entry is not None and not entry.get("deleted")
+
+            if live and not force and entry["size"] == size and entry["mtime"] == mtime:
+                result.unchanged.append(file_path)
+                continue
+
+            content_hash = hash_file(file_path)
+            new_entry = {"size": size, "mtime": mtime, "sha256": content_hash}
+            if live and not force and entry["sha256"] == content_hash:
+                # Touched but not modified: refresh the stat fields only.
+                result.unchanged.append(file_path)
+            else:
+                result.changed.append(file_path)
+            result.updates[file_path] = new_entry
+
+        if removed is not None:
+            removed_keys = dict.fromkeys(self.key(p) for p in removed)
+            candidates = ((k, self.entries[k]) for k in removed_keys if k in self.entries and k not in seen)
+        else:
+            candidates = ((k, e) for k, e in self.entries.items() if k not in seen)
+        for key, entry in candidates:
+            if not entry.get("deleted") or (retract_pending and not entry.get("retracted")):
+                result.deleted.append(self.file_path(key))
+        return result
+
+    def apply(self, diff_updates: Dict[str, Dict[str, Any]], deleted: Iterable[str] = ()):
+        """
+        Records a successful run: stores new entries and turns deletions into tombstones.
+        記錄成功的執行：寫入新條目並把刪除的文件標記為墓碑。
+        """
+        self.entries.update((self.key(p), update) for p, update in diff_updates.items())
+        now = datetime.now(timezone.utc).isoformat()
+        for file_path in deleted:
+            key = self.key(file_path)
+            entry = self.entries.get(key, {})
+            if not entry.get("deleted"):
+                self.entries[key] = {**entry, "deleted": True, "deleted_at": now, "retracted": False}
+
+    def pending_tombstones(self) -> List[str]:
+        """Deleted files whose chunks have not been retracted downstream yet."""
+        return [self.file_path(k) for k, e in self.entries.items() if e.get("deleted") and not e.get("retracted")]
+
+    def mark_retracted(self, file_paths: Iterable[str]):
+        """Marks tombstones as handled so they are not reported again."""
+        for file_path in file_paths:
+            entry = self.entries.get(self.key(file_path))
+            if entry and entry.get("deleted"):
+                entry["retracted"] = True
+
+    def save(self):
+        """Writes the manifest atomically."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 2, "root": self._real_root, "files": self.entries}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,328 @@
+"""
+In-process graph store with the subset of the Graphiti interface this project uses.
+行程內的圖儲存，實作本專案用到的 Graphiti 介面子集 (add_episode、add_episode_bulk、
+remove_episode、search)，不需要 Neo4j，供離線測試、CI 與基準測試使用。
+以 CHUNKING_GRAPH_BACKEND=memory 啟用 (見 graphiti_client.py)。
+
+There is no LLM entity extraction: every episode becomes one fact (an EntityEdge from
+its source node to the episode) whose text is the episode content. search() fuses a
+NumPy cosine index and a BM25 index with reciprocal rank fusion, like Graphiti's hybrid
+search, and with center_node_uuid reranks the hits by graph distance from that node.
+The store lives in memory only; it is empty again after a restart.
+"""
+import asyncio
+import math
+import os
+import re
+import uuid as uuid_lib
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from graphiti_core.edges import EntityEdge
+from graphiti_core.errors import NodeNotFoundError
+from graphiti_core.graphiti import AddBulkEpisodeResults, AddEpisodeResults
+from graphiti_core.nodes import EpisodeType, EpisodicNode
+from graphiti_core.utils.bulk_utils import RawEpisode
+
+# Embedding backend of the vector index (see embedding_backends.py); empty uses CHUNKING_EMBEDDING_BACKEND
+MEMORY_GRAPH_EMBEDDING_BACKEND = os.environ.get("CHUNKING_MEMORY_GRAPH_EMBEDDING_BACKEND", "")
+# Candidates taken from each index per requested result before fusion
+MEMORY_GRAPH_CANDIDATES = int(os.environ.get("CHUNKING_MEMORY_GRAPH_CANDIDATES", "4"))
+
+_NAMESPACE = uuid_lib.uuid5(uuid_lib.NAMESPACE_URL, "chunking/memory-graph")
+_TOKEN_REGEX = re.compile(r"[^\W\u3400-\u9fff]+|[\u3400-\u9fff]")
+# Reciprocal rank fusion constant, as in graphiti_core.search.search_utils.rrf
+_RRF_K = 60
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased words, with every CJK character as a term of its own."""
+    return _TOKEN_REGEX.findall(text.lower())
+
+
+class VectorIndex:
+    """
+    Normalized float32 vectors in one growing matrix; deletions are masked and compacted lazily.
+    以單一矩陣保存正規化向量；刪除只做標記，累積過多時才壓縮。
+    """
+    def __init__(self):
+        self._matrix: Optional[np.ndarray] = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._keys: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, keys: Sequence[str], vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        for key in keys:
+            self.remove(key)
+        needed = self._size + len(keys)
+        if self._matrix is None:
+            self._matrix = np.zeros((max(needed, 1024), vectors.shape[1]), dtype=np.float32)
+            self._alive = np.zeros(len(self._matrix), dtype=bool)
+        elif needed > len(self._matrix):
+            capacity = max(needed, 2 * len(self._matrix))
+            grown = np.zeros((capacity, self._matrix.shape[1]), dtype=np.float32)
+            grown[:self._size] = self._matrix[:self._size]
+            alive = np.zeros(capacity, dtype=bool)
+            alive[:self._size] = self._alive[:self._size]
+            self._matrix, self._alive = grown, alive
+        self._matrix[self._size:needed] = vectors
+        self._alive[self._size:needed] = True
+        for offset, key in enumerate(keys):
+            self._rows[key] = self._size + offset
+            self._keys.append(key)
+        self._size = needed
+
+    def remove(self, key: str):
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        self._keys[row] = None
+        self._alive[row] = False
+        if self._size > 1024 and len(self._rows) < self._size // 2:
+            self._compact()
+
+    def _compact(self):
+        live = [row for row, key in enumerate(self._keys) if key is not None]
+        self._matrix[:len(live)] = self._matrix[live]
+        self._alive[:] = False
+        self._alive[:len(live)] = True
+        self._keys = [self._keys[row] for row in live]
+        self._rows = {key: row for row, key in enumerate(self._keys)}
+        self._size = len(live)
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        """The k most similar keys by cosine similarity, best first."""
+        if not self._rows or k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = self._matrix[:self._size] @ query
+        if len(self._rows) < self._size:
+            scores[~self._alive[:self._size]] = -np.inf
+        k = min(k, len(self._rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._keys[row], float(scores[row])) for row in top]
+
+
+class LexicalIndex:
+    """
+    BM25 over an inverted index of tokenize() terms.
+    以倒排索引計算 BM25 分數。
+    """
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._terms: Dict[str, Counter] = {}
+        self._lengths: Dict[str, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def add(self, key: str, text: str):
+        self.remove(key)
+        terms = Counter(tokenize(text))
+        self._terms[key] = terms
+        self._lengths[key] = sum(terms.values())
+        self._total_length += self._lengths[key]
+        for term, count in terms.items():
+            self._postings.setdefault(term, {})[key] = count
+
+    def remove(self, key: str):
+        terms = self._terms.pop(key, None)
+        if terms is None:
+            return
+        self._total_length -= self._lengths.pop(key)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """The k best BM25 matches, best first."""
+        if not self._terms or k <= 0:
+            return []
+        docs = len(self._terms)
+        average_length = self._total_length / docs
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, count in postings.items():
+                norm = count + self.k1 * (1 - self.b + self.b * self._lengths[key] / average_length)
+                scores[key] = scores.get(key, 0.0) + idf * count * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: -item[1])[:k]
+
+
+def _node_uuid(name: str) -> str:
+    return str(uuid_lib.uuid5(_NAMESPACE, f"node:{name}"))
+
+
+class InMemoryGraphiti:
+    """
+    Drop-in for the Graphiti client methods used by ingestion and the chatbot.
+    取代攝取流程與聊天機器人所用到的 Graphiti 客戶端方法。
+
+    All methods run on the GraphitiClientManager's event loop, so the indexes are only
+    ever touched by that thread; embeddings are computed in a worker thread meanwhile.
+    """
+    def __init__(self, embeddings: Any = None, candidates: int = MEMORY_GRAPH_CANDIDATES):
+        self._embeddings = embeddings
+        self.candidates = candidates
+        self.vectors = VectorIndex()
+        self.lexical = LexicalIndex()
+        # episode uuid -> the stored episode
+        self.episodes: Dict[str, EpisodicNode] = {}
+        # episode uuid -> the episode's fact edge
+        self.edges: Dict[str, EntityEdge] = {}
+        # node uuid -> episode uuids whose fact touches the node
+        self._adjacency: Dict[str, set] = {}
+
+    @property
+    def embeddings(self) -> Any:
+        if self._embeddings is None:
+            from embedding_pool import get_embeddings
+            from embedding_backends import EMBEDDING_BACKEND
+            self._embeddings = get_embeddings(backend=MEMORY_GRAPH_EMBEDDING_BACKEND or EMBEDDING_BACKEND)
+        return self._embeddings
+
+    # --- writes ---
+    async def add_episode(self, name: str, episode_body: str, source_description: str,
+                          reference_time: datetime, source: EpisodeType = EpisodeType.message,
+                          group_id: Optional[str] = None, uuid: Optional[str] = None, **kwargs) -> AddEpisodeResults:
+        episode = RawEpisode(name=name, uuid=uuid, content=episode_body, source_description=source_description,
+                             source=source, reference_time=reference_time)
+        results = await self._add([episode], group_id)
+        return AddEpisodeResults(episode=results.episodes[0], episodic_edges=[], nodes=[], edges=results.edges,
+                                 communities=[], community_edges=[])
+
+    async def add_episode_bulk(self, bulk_episodes: List[RawEpisode], group_id: Optional[str] = None,
+                               **kwargs) -> AddBulkEpisodeResults:
+        return await self._add(bulk_episodes, group_id)
+
+    async def _add(self, episodes: List[RawEpisode], group_id: Optional[str]) -> AddBulkEpisodeResults:
+        now = datetime.now(timezone.utc)
+        # Like Graphiti: a supplied uuid must name a stored episode, which is processed again as
+        # stored; episodes without one are created with a new uuid. Nothing changes if one is missing.
+        nodes = []
+        for episode in episodes:
+            if episode.uuid is None:
+                nodes.append(EpisodicNode(name=episode.name, group_id=group_id or "", labels=[], source=episode.source,
+                                          content=episode.content, source_description=episode.source_description,
+                                          created_at=now, valid_at=episode.reference_time))
+            elif episode.uuid in self.episodes:
+                nodes.append(self.episodes[episode.uuid])
+            else:
+                raise NodeNotFoundError(episode.uuid)
+        by_uuid = {node.uuid: node for node in nodes}
+        vectors = (await asyncio.to_thread(self.embeddings.embed_documents, [n.content for n in by_uuid.values()])
+                   if by_uuid else [])
+        edges = []
+        for episode_uuid, episode in by_uuid.items():
+            self._unlink(episode_uuid)
+            edge = EntityEdge(
+                uuid=str(uuid_lib.uuid5(_NAMESPACE, f"fact:{episode_uuid}")),
+                group_id=episode.group_id,
+                source_node_uuid=_node_uuid(episode.source_description),
+                target_node_uuid=episode_uuid,
+                created_at=now,
+                name=episode.name,
+                fact=episode.content,
+                episodes=[episode_uuid],
+                valid_at=episode.valid_at,
+                reference_time=episode.valid_at,
+            )
+            self.episodes[episode_uuid] = episode
+            self.edges[episode_uuid] = edge
+            for node in (edge.source_node_uuid, edge.target_node_uuid):
+                self._adjacency.setdefault(node, set()).add(episode_uuid)
+            self.lexical.add(episode_uuid, episode.content)
+            edges.append(edge)
+        if edges:
+            self.vectors.add([edge.target_node_uuid for edge in edges], np.asarray(vectors, dtype=np.float32))
+        return AddBulkEpisodeResults(episodes=nodes, episodic_edges=[], nodes=[], edges=edges,
+                                     communities=[], community_edges=[])
+
+    def _unlink(self, episode_uuid: str) -> bool:
+        edge = self.edges.pop(episode_uuid, None)
+        if edge is None:
+            return False
+        for node in (edge.source_node_uuid, edge.target_node_uuid):
+            linked = self._adjacency.get(node)
+            if linked is not None:
+                linked.discard(episode_uuid)
+                if not linked:
+                    del self._adjacency[node]
+        self.vectors.remove(episode_uuid)
+        self.lexical.remove(episode_uuid)
+        return True
+
+    async def remove_episode(self, episode_uuid: str):
+        if not self._unlink(episode_uuid):
+            raise NodeNotFoundError(episode_uuid)
+        del self.episodes[episode_uuid]
+
+    # --- reads ---
+    async def search(self, query: str, center_node_uuid: Optional[str] = None,
+                     group_ids: Optional[List[str]] = None, num_results: int = 10, **kwargs) -> List[EntityEdge]:
+        """Hybrid (cosine + BM25, RRF) search over the facts, reranked by distance to center_node_uuid."""
+        if not self.edges:
+            return []
+        vector = await asyncio.to_thread(self.embeddings.embed_query, query)
+        k = max(num_results * self.candidates, num_results)
+        scores: Dict[str, float] = {}
+        for ranking in (self.vectors.search(np.asarray(vector), k), self.lexical.search(query, k)):
+            for rank, (key, _) in enumerate(ranking):
+                scores[key] = scores.get(key, 0.0) + 1.0 / (_RRF_K + rank + 1)
+        ranked = sorted(scores, key=lambda key: -scores[key])
+        if group_ids is not None:
+            groups = set(group_ids)
+            ranked = [key for key in ranked if self.edges[key].group_id in groups]
+        if center_node_uuid is not None:
+            distance = self._distances(center_node_uuid)
+            # Stable sort: equally distant facts keep their fused order
+            ranked.sort(key=lambda key: distance.get(key, math.inf))
+        return [self.edges[key] for key in ranked[:num_results]]
+
+    def _distances(self, center: str, max_hops: int = 2) -> Dict[str, int]:
+        """Hops from center to each fact within max_hops (a fact touching center is at 0)."""
+        distance: Dict[str, int] = {}
+        frontier, seen = {center}, {center}
+        for hop in range(max_hops + 1):
+            next_frontier = set()
+            for node in frontier:
+                for episode_uuid in self._adjacency.get(node, ()):
+                    if episode_uuid in distance:
+                        continue
+                    distance[episode_uuid] = hop
+                    edge = self.edges[episode_uuid]
+                    next_frontier.update({edge.source_node_uuid, edge.target_node_uuid} - seen)
+            seen |= next_frontier
+            frontier = next_frontier
+        return distance
+
+    def stats(self) -> Dict[str, Any]:
+        return {"episodes": len(self.edges), "vector_rows": len(self.vectors),
+                "lexical_docs": len(self.lexical), "nodes": len(self._adjacency)}
+
+    async def close(self):
+        pass
+
+
+async def connect_memory_graph(config: Any = None) -> InMemoryGraphiti:
+    """client_factory for GraphitiClientManager (the Neo4j config is ignored)."""
+    return InMemoryGraphiti()
@@ -0,0 +1,129 @@
+"""
+MinHash + LSH near-duplicate detection for source files.
+以 MinHash 與 LSH 偵測近似重複的原始碼文件 (例如 postRecv.groovy 的各種副本)，
+讓下游只處理代表文件與精簡的差異。
+"""
+import difflib
+import re
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+# Prime just above 2**32 so (a * x + b) stays inside uint64 for 32-bit x, a, b
+_MERSENNE_PRIME = np.uint64(4294967311)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+
+class MinHasher:
+    """
+    Computes MinHash signatures over token shingles.
+    以 token 的 shingle 計算 MinHash 簽章。
+    """
+    def __init__(self, num_perm: int = 64, shingle_size: int = 5, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.randint(1, 2 ** 32 - 1, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 2 ** 32 - 1, size=num_perm, dtype=np.uint64)
+
+    def shingle_hashes(self, text: str) -> np.ndarray:
+        tokens = _TOKEN_PATTERN.findall(text)
+        k = self.shingle_size
+        if len(tokens) < k:
+            shingles = {" ".join(tokens)}
+        else:
+            shingles = {" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)}
+        return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles),
+                           dtype=np.uint64, count=len(shingles))
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = self.shingle_hashes(text)
+        if hashes.size == 0:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % _MERSENNE_PRIME
+        return permuted.min(axis=1)
+
+
+def estimate_jaccard(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    return float(np.count_nonzero(sig_a == sig_b)) / sig_a.size
+
+
+class NearDuplicateIndex:
+    """
+    Streaming LSH index: the first file of each cluster becomes its representative.
+    串流式 LSH 索引：每個群組中最先加入的文件成為代表文件。
+    """
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, bands: int = 16, shingle_size: int = 5):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+        self._buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+        # representative key -> member keys (representative excluded)
+        self.clusters: Dict[str, List[str]] = {}
+        self.representative_of: Dict[str, str] = {}
+
+    def add(self, key: str, text: str) -> Tuple[Optional[str], float]:
+        """
+        Adds a file; returns (representative key, estimated similarity) when it is a
+        near-duplicate of an earlier representative, otherwise (None, 0.0).
+        """
+        signature = self.hasher.signature(text)
+        band_keys = [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+        best_key, best_score = None, 0.0
+        seen = set()
+        for band, band_key in zip(self._buckets, band_keys):
+            for candidate in band.get(band_key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                score = estimate_jaccard(signature, self._signatures[candidate])
+                if score > best_score:
+                    best_key, best_score = candidate, score
+
+        if best_key is not None and best_score >= self.threshold:
+            self.clusters[best_key].append(key)
+            self.representative_of[key] = best_key
+            return best_key, best_score
+
+        self._index(key, signature, band_keys)
+        return None, 0.0
+
+    def _index(self, key: str, signature: np.ndarray, band_keys: List[bytes]):
+        # Only representatives are indexed, so lookups stay proportional to distinct files
+        self._signatures[key] = signature
+        self.clusters[key] = []
+        for band, band_key in zip(self._buckets, band_keys):
+            band.setdefault(band_key, []).append(key)
+
+    def promote(self, key: str, text: str):
+        """
+        Moves a member out of its cluster and makes it the representative of a new one,
+        e.g. when it is sent in full after all; later files are compared against it too.
+        將成員移出所屬群組並成為新群組的代表文件 (例如它最後仍以完整內容送出)。
+        """
+        representative = self.representative_of.pop(key, None)
+        if representative is None:
+            return
+        self.clusters[representative].remove(key)
+        signature = self.hasher.signature(text)
+        self._index(key, signature, [signature[i * self.rows:(i + 1) * self.rows].tobytes()
+                                     for i in range(self.bands)])
+
+    def duplicate_clusters(self) -> Dict[str, List[str]]:
+        """Representative -> members, for clusters with at least one member."""
+        return {rep: members for rep, members in self.clusters.items() if members}
+
+
+def compact_diff(base_text: str, text: str, base_name: str, name: str, context: int = 1) -> str:
+    """Unified diff of text against base_text with minimal context."""
+    return "".join(difflib.unified_diff(
+        base_text.splitlines(keepends=True), text.splitlines(keepends=True),
+        fromfile=base_name, tofile=name, n=context
+    ))
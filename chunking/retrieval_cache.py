@@ -0,0 +1,180 @@
+"""
+TTL + LRU cache for Graphiti search results of the RAG chatbot.
+RAG 聊天機器人的 Graphiti 檢索結果快取：以正規化後的查詢、中心節點與 num_results 為鍵，
+有存活時間 (TTL) 與筆數上限 (LRU 淘汰)；有新的 episode 匯入時整個快取失效。
+同時在途的相同查詢只會送出一次 search，其餘請求等待同一個結果。
+
+Invalidation is driven by the ingestion path (graphiti_ingest.BatchIngestor), which
+calls invalidate() after every batch it adds or removes. The chatbot's own
+conversation episodes only invalidate when CHUNKING_RETRIEVAL_CACHE_INVALIDATE_ON_CHAT=1,
+since every answered turn would otherwise empty the cache; the TTL bounds how long
+facts extracted from them can be missing from cached results. A pipeline running in
+another process cannot invalidate this cache either; there too the TTL is the bound.
+"""
+import asyncio
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+# Entries kept; 0 disables the cache
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("CHUNKING_RETRIEVAL_CACHE_SIZE", "1024"))
+# Seconds an entry stays valid; 0 disables the cache
+RETRIEVAL_CACHE_TTL = float(os.environ.get("CHUNKING_RETRIEVAL_CACHE_TTL", "300"))
+# Also invalidate when the chatbot stores a conversation turn as an episode
+RETRIEVAL_CACHE_INVALIDATE_ON_CHAT = os.environ.get("CHUNKING_RETRIEVAL_CACHE_INVALIDATE_ON_CHAT", "0") == "1"
+
+_WHITESPACE = re.compile(r"\s+")
+
+CacheKey = Tuple[str, Optional[str], int]
+
+
+def normalize_query(query: str) -> str:
+    """NFKC, case-folded, whitespace collapsed (full-width and half-width forms map together)."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", query).casefold()).strip()
+
+
+@dataclass
+class _Entry:
+    value: List[Any]
+    expires_at: float
+    # How long the search that produced the value took; saved again on every hit
+    latency: float
+
+
+class RetrievalCache:
+    """
+    Thread-safe; callers on any event loop share it (searches run on the Graphiti manager's loop).
+    執行緒安全，不同事件迴圈的呼叫者共用同一個快取。
+    """
+    def __init__(self, max_entries: int = RETRIEVAL_CACHE_SIZE, ttl: float = RETRIEVAL_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        self._pending: Dict[CacheKey, Future] = {}
+        # Bumped by invalidate(); a search started before it is not stored afterwards
+        self._generation = 0
+        self._stats: Dict[str, float] = {"hits": 0, "misses": 0, "coalesced": 0, "expired": 0, "evicted": 0,
+                                         "invalidations": 0, "saved_seconds": 0.0, "miss_seconds": 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    @staticmethod
+    def key(query: str, center_node_uuid: Optional[str], num_results: int) -> CacheKey:
+        return normalize_query(query), center_node_uuid, num_results
+
+    def get(self, key: CacheKey) -> Optional[List[Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                self._stats["expired"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            self._stats["saved_seconds"] += entry.latency
+            return list(entry.value)
+
+    def _put(self, key: CacheKey, value: List[Any], latency: float, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = _Entry(list(value), time.monotonic() + self.ttl, latency)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evicted"] += 1
+
+    def invalidate(self):
+        """Drops every entry; searches still in flight are not stored."""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._stats["invalidations"] += 1
+
+    async def search(self, graphiti: Any, query: str, center_node_uuid: Optional[str] = None,
+                     num_results: int = 10) -> List[Any]:
+        """
+        client.search(query, center_node_uuid, num_results) through the cache; graphiti is
+        the GraphitiClientManager. Identical searches in flight share one call.
+        """
+        def call(client):
+            return client.search(query, center_node_uuid=center_node_uuid, num_results=num_results)
+
+        if not self.enabled:
+            return await graphiti.arun(call)
+        key = self.key(query, center_node_uuid, num_results)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        if not graphiti.started:
+            # Connect outside the lock so lookups on other threads are not held up
+            await graphiti.astart()
+        with self._lock:
+            future = self._pending.get(key)
+            leader = future is None
+            if leader:
+                self._stats["misses"] += 1
+                generation, start = self._generation, time.perf_counter()
+                future = graphiti.submit(call)
+                self._pending[key] = future
+            else:
+                self._stats["coalesced"] += 1
+        if leader:
+            # Outside the lock: the callback runs inline if the search has already finished
+            future.add_done_callback(lambda f: self._settle(key, f, generation, start))
+        return list(await asyncio.wrap_future(future))
+
+    def _settle(self, key: CacheKey, future: Future, generation: int, start: float):
+        latency = time.perf_counter() - start
+        with self._lock:
+            self._pending.pop(key, None)
+            self._stats["miss_seconds"] += latency
+        if not future.cancelled() and future.exception() is None:
+            self._put(key, future.result(), latency, generation)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            size = len(self._entries)
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        misses = stats["misses"]
+        return {
+            "enabled": self.enabled,
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            **{k: int(v) for k, v in stats.items() if not k.endswith("_seconds")},
+            "hit_rate": round(stats["hits"] / lookups, 4) if lookups else None,
+            "saved_latency_seconds": round(stats["saved_seconds"], 4),
+            "mean_miss_latency_ms": round(stats["miss_seconds"] / misses * 1000, 2) if misses else None,
+        }
+
+
+_cache: Optional[RetrievalCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_retrieval_cache() -> RetrievalCache:
+    """The process-wide cache shared by every chatbot turn."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = RetrievalCache()
+        return _cache
+
+
+def invalidate_retrieval_cache():
+    """Called whenever episodes were added to or removed from the graph."""
+    if _cache is not None:
+        _cache.invalidate()
@@ -0,0 +1,78 @@
+"""
+Lock that serializes chunking graph runs across threads and processes.
+切片流程的執行鎖：API、watcher 與命令列共用 STATE_DIR 中的清單、帳本與符號表，
+同時執行會互相覆寫 (後寫入者勝出)，並重複匯入相同的 episode，因此同一時間只允許一個執行。
+
+The lock is an flock on a file in STATE_DIR, so it is released by the kernel when the
+holding process dies; there is no stale lock to clean up. Where fcntl is unavailable
+only runs within the same process are serialized.
+"""
+import os
+import threading
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on POSIX
+    fcntl = None
+
+from manifest import STATE_DIR
+
+RUN_LOCK_PATH = os.environ.get("CHUNKING_RUN_LOCK_PATH", os.path.join(STATE_DIR, "run.lock"))
+
+# flock also conflicts between descriptors of one process, but a thread lock keeps the
+# check-and-take atomic for threads sharing a RunLock path
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock(path: str) -> threading.Lock:
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(os.path.realpath(path), threading.Lock())
+
+
+class RunLock:
+    """
+    Exclusive lock held for the duration of one graph run.
+    單次流程執行期間持有的獨占鎖；blocking=False 時若已有執行中的流程則立即回傳 False。
+    """
+    def __init__(self, path: str = RUN_LOCK_PATH):
+        self.path = path
+        self._thread_lock = _thread_lock(path)
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if fcntl is None:
+            return True
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            self._thread_lock.release()
+            return False
+        except BaseException:
+            os.close(fd)
+            self._thread_lock.release()
+            raise
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            # Closing the descriptor drops the flock
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
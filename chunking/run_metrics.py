@@ -0,0 +1,144 @@
+"""
+Structured progress and metrics for collector and chunking runs.
+收集與切片流程的結構化進度與指標：計數器、位元組總量、各階段耗時與依類型統計的錯誤數。
+預設安靜，進度輸出有節流，執行結束時輸出一行 JSON 摘要。
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+# CHUNKING_VERBOSE=1 prints per-file detail, CHUNKING_PROGRESS=1 prints throttled progress
+# CHUNKING_VERBOSE=1 顯示每個文件的細節，CHUNKING_PROGRESS=1 顯示節流後的進度
+VERBOSE = os.environ.get("CHUNKING_VERBOSE", "0") == "1"
+PROGRESS = os.environ.get("CHUNKING_PROGRESS", "0") == "1"
+PROGRESS_INTERVAL = float(os.environ.get("CHUNKING_PROGRESS_INTERVAL", "2.0"))
+# Optional JSONL file that every run summary is appended to
+METRICS_PATH = os.environ.get("CHUNKING_METRICS_PATH")
+
+
+class RunMetrics:
+    """
+    Thread-safe counters and timings for one run.
+    單次執行的執行緒安全計數器與計時。
+    """
+    def __init__(self, run_name: str, verbose: bool = VERBOSE, progress: bool = PROGRESS,
+                 progress_interval: float = PROGRESS_INTERVAL, stream=sys.stderr):
+        self.run_name = run_name
+        self.verbose = verbose
+        self.show_progress = progress
+        self.progress_interval = progress_interval
+        self.stream = stream
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._last_progress: Dict[str, float] = {}
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.bytes: Dict[str, int] = defaultdict(int)
+        self.stage_seconds: Dict[str, float] = defaultdict(float)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.extra: Dict[str, Any] = {}
+
+    def incr(self, counter: str, n: int = 1):
+        with self._lock:
+            self.counters[counter] += n
+
+    def add_bytes(self, stage: str, n: int):
+        with self._lock:
+            self.bytes[stage] += n
+
+    def add_time(self, stage: str, seconds: float):
+        with self._lock:
+            self.stage_seconds[stage] += seconds
+
+    def record_error(self, stage: str, exc: BaseException, detail: Optional[str] = None):
+        """Counts an error by stage and exception type; details only shown when verbose."""
+        with self._lock:
+            self.errors[f"{stage}:{type(exc).__name__}"] += 1
+        if self.verbose:
+            self.log(f"❌ [{stage}] {detail + ' - ' if detail else ''}{type(exc).__name__}: {exc}")
+
+    def set(self, key: str, value: Any):
+        """Stores an arbitrary JSON-serializable value in the summary."""
+        with self._lock:
+            self.extra[key] = value
+
+    def log(self, message: str):
+        """Per-item detail, printed only in verbose mode."""
+        if self.verbose:
+            print(message, file=self.stream)
+
+    def progress(self, stage: str, done: int, total: Optional[int] = None):
+        """Prints at most one progress line per stage every progress_interval seconds."""
+        if not (self.show_progress or self.verbose):
+            return
+        now = time.perf_counter()
+        with self._lock:
+            last = self._last_progress.get(stage)
+            final = total is not None and done >= total
+            if last is not None and now - last < self.progress_interval and not final:
+                return
+            self._last_progress[stage] = now
+        elapsed = now - self._start
+        rate = done / elapsed if elapsed > 0 else 0.0
+        of_total = f"/{total}" if total is not None else ""
+        print(f"[{self.run_name}] {stage}: {done}{of_total} ({rate:,.1f}/s)", file=self.stream)
+
+    @contextmanager
+    def stage(self, stage: str):
+        """Times a stage and tallies an uncaught exception before re-raising it."""
+        start = time.perf_counter()
+        try:
+            yield self
+        except BaseException as e:
+            self.record_error(stage, e)
+            raise
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "run": self.run_name,
+                "started_at": self.started_at.isoformat(),
+                "elapsed_seconds": round(time.perf_counter() - self._start, 4),
+                "counters": dict(self.counters),
+                "bytes": dict(self.bytes),
+                "stage_seconds": {k: round(v, 4) for k, v in self.stage_seconds.items()},
+                "errors": dict(self.errors),
+                **self.extra,
+            }
+
+    def emit_summary(self, path: Optional[str] = METRICS_PATH) -> Dict[str, Any]:
+        """Prints the summary as one JSON line and optionally appends it to a JSONL file."""
+        summary = self.summary()
+        line = json.dumps(summary, ensure_ascii=False, default=str)
+        print(line)
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        return summary
+
+
+def instrument_node(stage: str, node: Callable[[Dict[str, Any]], Dict[str, Any]],
+                    run_name: str = "chunking") -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Wraps a LangGraph node so its wall time and failures land in state['metrics'].
+    包裝 LangGraph 節點，把耗時與失敗記錄到 state['metrics']。
+    """
+    def wrapped(state: Dict[str, Any]) -> Dict[str, Any]:
+        if state.get("metrics") is None:
+            state["metrics"] = RunMetrics(run_name)
+        with state["metrics"].stage(stage):
+            return node(state)
+    wrapped.__name__ = getattr(node, "__name__", stage)
+    wrapped.__doc__ = node.__doc__
+    return wrapped
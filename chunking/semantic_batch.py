@@ -0,0 +1,137 @@
+"""
+Corpus-wide batched semantic splitting.
+整批語義切割：先收集所有超大區塊的句子，以固定大小的批次一起計算 Embedding，
+再用 NumPy 向量化計算相鄰句子的餘弦距離與各區塊的百分位數斷點。
+
+The split rule is the one SemanticChunker uses with breakpoint_threshold_type="percentile":
+each sentence is embedded together with its neighbours, and a chunk ends wherever the
+cosine distance to the next sentence is above the given percentile of that parent's
+distances. Only the batching differs, so the output is the same.
+"""
+import os
+import re
+from bisect import bisect_left
+from typing import List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from splitters import newline_offsets
+
+# CHUNKING_SEMANTIC_BATCH=0 falls back to one SemanticChunker call per oversized chunk
+SEMANTIC_BATCH = os.environ.get("CHUNKING_SEMANTIC_BATCH", "1") == "1"
+SEMANTIC_BATCH_SIZE = int(os.environ.get("CHUNKING_SEMANTIC_BATCH_SIZE", "256"))
+
+SENTENCE_SPLIT_REGEX = r"(?<=[.?!])\s+"
+
+
+def combine_sentences(sentences: List[str], buffer_size: int = 1) -> List[str]:
+    """Each sentence joined with buffer_size neighbours on both sides, as SemanticChunker does."""
+    return [" ".join(sentences[max(0, i - buffer_size):i + buffer_size + 1]) for i in range(len(sentences))]
+
+
+def locate_sub_chunks(parent: Document, texts: List[str]) -> List[Document]:
+    """
+    Sub-chunk Documents of parent, each with its own start/end_index and start/end_line.
+    在父區塊中依序定位每個子區塊，計算各自的字元位置與行號。
+
+    The sub-chunks are found in order from a running cursor. Their sentences were re-joined
+    with single spaces, so any whitespace run matches. A sub-chunk that cannot be found keeps
+    its parent's span.
+    """
+    text = parent.page_content
+    base_index = parent.metadata.get("start_index", 0)
+    base_line = parent.metadata.get("start_line", 0)
+    newlines = newline_offsets(text)
+    cursor = 0
+    documents = []
+    for piece in texts:
+        metadata = parent.metadata.copy()
+        words = piece.split()
+        match = re.compile(r"\s+".join(map(re.escape, words))).search(text, cursor) if words else None
+        if match is not None:
+            start, end = match.span()
+            cursor = end
+            metadata.update({
+                "start_index": base_index + start,
+                "end_index": base_index + end,
+                "start_line": base_line + bisect_left(newlines, start),
+                "end_line": base_line + bisect_left(newlines, max(start, end - 1)),
+            })
+        documents.append(Document(page_content=piece, metadata=metadata))
+    return documents
+
+
+class BatchedSemanticSplitter:
+    """
+    Splits many texts with a few large embedding calls instead of one call per text.
+    以少數幾次大批次的 Embedding 呼叫切割大量文字，而不是每段文字呼叫一次。
+    """
+    def __init__(self, embeddings, batch_size: int = SEMANTIC_BATCH_SIZE,
+                 breakpoint_percentile: float = 95.0, buffer_size: int = 1,
+                 sentence_split_regex: str = SENTENCE_SPLIT_REGEX):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.breakpoint_percentile = breakpoint_percentile
+        self.buffer_size = buffer_size
+        self._sentence_pattern = re.compile(sentence_split_regex)
+        self.embedding_calls = 0
+        self.sentences_embedded = 0
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        """Embeds texts in fixed-size batches and returns L2-normalized rows."""
+        rows = []
+        for start in range(0, len(texts), self.batch_size):
+            rows.extend(self.embeddings.embed_documents(texts[start:start + self.batch_size]))
+            self.embedding_calls += 1
+        self.sentences_embedded += len(texts)
+        vectors = np.asarray(rows, dtype=np.float64)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def split_texts(self, texts: List[str]) -> List[List[str]]:
+        """Returns the semantic chunks of every text, in order."""
+        sentences_per_text = [self._sentence_pattern.split(text) for text in texts]
+
+        # Texts with a single sentence are returned as-is and never embedded
+        combined: List[str] = []
+        spans: List[Optional[Tuple[int, int]]] = []
+        for sentences in sentences_per_text:
+            if len(sentences) == 1:
+                spans.append(None)
+                continue
+            start = len(combined)
+            combined.extend(combine_sentences(sentences, self.buffer_size))
+            spans.append((start, len(combined)))
+
+        distances = np.empty(0)
+        if combined:
+            vectors = self._embed(combined)
+            # Cosine distance from every combined sentence to the next one, for the whole batch at once;
+            # the pairs that straddle two parents are simply never read below
+            distances = 1.0 - np.einsum("ij,ij->i", vectors[:-1], vectors[1:])
+
+        results = []
+        for sentences, span in zip(sentences_per_text, spans):
+            if span is None:
+                results.append(sentences)
+                continue
+            start, end = span
+            parent_distances = distances[start:end - 1]
+            threshold = np.percentile(parent_distances, self.breakpoint_percentile)
+            breakpoints = np.flatnonzero(parent_distances > threshold)
+            chunks = []
+            chunk_start = 0
+            for index in breakpoints:
+                chunks.append(" ".join(sentences[chunk_start:index + 1]))
+                chunk_start = index + 1
+            if chunk_start < len(sentences):
+                chunks.append(" ".join(sentences[chunk_start:]))
+            results.append(chunks)
+        return results
+
+    def split_documents(self, documents: List[Document]) -> List[List[Document]]:
+        """Semantic sub-chunks of each document, with their parent's metadata and their own offsets."""
+        return [locate_sub_chunks(doc, chunks)
+                for doc, chunks in zip(documents, self.split_texts([doc.page_content for doc in documents]))]
@@ -0,0 +1,139 @@
+"""
+Per-extension code splitter registry.
+依副檔名選擇程式碼切割器的註冊表：每種語言使用自己的分隔符號，切割器只建立一次並重複使用。
+Groovy 沒有內建的 LangChain 語言設定，因此在這裡定義 def、閉包與 class 區塊的分隔符號。
+"""
+import os
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+from langchain_text_splitters.base import Language
+from langchain_text_splitters.character import RecursiveCharacterTextSplitter
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+
+LANGUAGE_BY_EXTENSION: Dict[str, Language] = {
+    ".py": Language.PYTHON,
+    ".java": Language.JAVA,
+    ".kt": Language.KOTLIN,
+    ".js": Language.JS,
+    ".ts": Language.TS,
+}
+
+# Jira ScriptRunner style Groovy, as regexes that cut just before the matching line
+GROOVY_SEPARATORS = [
+    # Class-like blocks
+    r"\n(?=(?:abstract\s+|final\s+)?(?:class|interface|enum|trait)\s)",
+    # Script-level functions and closures assigned with def
+    r"\n(?=(?:def|static|public|private|protected)\s)",
+    # Methods inside classes
+    r"\n(?=[ \t]+(?:def|static|public|private|protected)\s)",
+    # Closure blocks passed to collection methods, e.g. issues.each { ... }
+    r"\n(?=[ \t]*[\w.?]+\.(?:each|eachWithIndex|collect|findAll|find|with|any|every)\s*\{)",
+    # Control flow
+    r"\n(?=[ \t]*(?:if|for|while|switch|try)\b)",
+    r"\n\n",
+    r"\n",
+    r" ",
+    r"",
+]
+
+
+class SplitterRegistry:
+    """
+    Maps a file extension to a cached RecursiveCharacterTextSplitter.
+    副檔名對應到快取的 RecursiveCharacterTextSplitter。
+    """
+    def __init__(self, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self._lock = threading.Lock()
+        self._splitters: Dict[str, RecursiveCharacterTextSplitter] = {}
+
+    def _build(self, extension: str) -> RecursiveCharacterTextSplitter:
+        if extension == ".groovy":
+            return RecursiveCharacterTextSplitter(
+                separators=GROOVY_SEPARATORS, is_separator_regex=True, keep_separator=True,
+                chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
+            )
+        language = LANGUAGE_BY_EXTENSION.get(extension)
+        if language is None:
+            # Unknown languages use the generic paragraph/line/word separators
+            return RecursiveCharacterTextSplitter(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+        return RecursiveCharacterTextSplitter.from_language(
+            language=language, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
+        )
+
+    def get(self, extension: str) -> RecursiveCharacterTextSplitter:
+        extension = extension.lower()
+        splitter = self._splitters.get(extension)
+        if splitter is None:
+            with self._lock:
+                splitter = self._splitters.get(extension)
+                if splitter is None:
+                    splitter = self._build(extension)
+                    self._splitters[extension] = splitter
+        return splitter
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """
+        Splits each document with the splitter of its source extension, keeping document order.
+
+        Every chunk gets start_index/end_index (character offsets, end exclusive) and
+        start_line/end_line (0-based, inclusive) in the source file. For streamed windows
+        the window's own start_index/start_line are added, so offsets stay file-absolute.
+        """
+        chunks = []
+        for doc in documents:
+            text = doc.page_content
+            splitter = self.get(extension_of(doc))
+            base_index = doc.metadata.get("start_index", 0)
+            base_line = doc.metadata.get("start_line", 0)
+            newlines = newline_offsets(text)
+            index = 0
+            previous_len = 0
+            for piece in splitter.split_text(text):
+                # Same search as TextSplitter.create_documents(add_start_index=True)
+                offset = index + previous_len - splitter._chunk_overlap
+                found = text.find(piece, max(0, offset))
+                index = found if found != -1 else text.find(piece)
+                previous_len = len(piece)
+                end = index + len(piece)
+                metadata = doc.metadata.copy()
+                metadata.update({
+                    "start_index": base_index + index,
+                    "end_index": base_index + end,
+                    "start_line": base_line + bisect_left(newlines, index),
+                    "end_line": base_line + bisect_left(newlines, max(index, end - 1)),
+                })
+                chunks.append(Document(page_content=piece, metadata=metadata))
+        return chunks
+
+
+def newline_offsets(text: str) -> List[int]:
+    """Character offsets of every newline in text, ascending."""
+    offsets = []
+    position = text.find("\n")
+    while position != -1:
+        offsets.append(position)
+        position = text.find("\n", position + 1)
+    return offsets
+
+
+def extension_of(doc: Document) -> str:
+    """Lower-cased extension of the document's source path ('' when unknown)."""
+    return os.path.splitext(doc.metadata.get("source", ""))[1].lower()
+
+
+_registry: Optional[SplitterRegistry] = None
+
+
+def get_registry() -> SplitterRegistry:
+    """The process-wide registry used by chunk_code_node."""
+    global _registry
+    if _registry is None:
+        _registry = SplitterRegistry()
+    return _registry
@@ -0,0 +1,359 @@
+"""
+Streaming execution mode for the chunking graph.
+串流執行模式：每個文件依序流過 load → analyze → chunk → enrich → ingest 各階段，
+階段之間以有界佇列連接並同時運作。同時在途的文件數量受佇列大小與執行緒數量限制，
+因此峰值記憶體不隨專案大小成長；每個階段的執行緒數量可分別調整。
+
+A file is recorded in the ingestion manifest as soon as all of its chunks are in
+Graphiti, so a failed run keeps the progress of every file ingested before the failure.
+Enriched chunks are also written to the run's checkpoint store, so files that were
+enriched but not yet ingested skip straight to ingest when the run is resumed.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from checkpoints import CheckpointStore
+from chuncking import (GraphState, plan_load, open_run_checkpoint, load_file_documents, analyze_documents,
+                       split_into_chunks, chunk_streamed_file, record_embedding_stats, enrich_chunk,
+                       upsert_files, retract_files)
+from chunk_ledger import ChunkLedger
+from code_analysis import AnalysisCache
+from graphiti_ingest import BatchIngestor, IngestConfig, IngestError, INGEST_BATCH_SIZE
+from manifest import IngestManifest, ManifestDiff
+from run_metrics import RunMetrics
+from streaming_reader import should_stream
+from symbol_table import SymbolTable
+
+# Worker threads per stage; every stage can be tuned on its own
+STREAM_LOAD_WORKERS = int(os.environ.get("CHUNKING_STREAM_LOAD_WORKERS", "2"))
+STREAM_ANALYZE_WORKERS = int(os.environ.get("CHUNKING_STREAM_ANALYZE_WORKERS", "2"))
+# Processes shared by the analyze threads for AST parsing; 0 or 1 parses in the threads themselves
+STREAM_ANALYZE_PROCESSES = int(os.environ.get("CHUNKING_STREAM_ANALYZE_PROCESSES", "0"))
+STREAM_CHUNK_WORKERS = int(os.environ.get("CHUNKING_STREAM_CHUNK_WORKERS", "2"))
+STREAM_ENRICH_WORKERS = int(os.environ.get("CHUNKING_STREAM_ENRICH_WORKERS", "1"))
+# Ingest workers share the process-wide Graphiti client and one BatchIngestor, whose
+# CHUNKING_INGEST_CONCURRENCY bounds the batches in flight across all of them
+STREAM_INGEST_WORKERS = int(os.environ.get("CHUNKING_STREAM_INGEST_WORKERS", "1"))
+# Files waiting between two stages
+STREAM_QUEUE_SIZE = int(os.environ.get("CHUNKING_STREAM_QUEUE_SIZE", "8"))
+# Chunks sent per add_episode_bulk call (defaults to CHUNKING_INGEST_BATCH_SIZE)
+STREAM_INGEST_BATCH_SIZE = int(os.environ.get("CHUNKING_STREAM_INGEST_BATCH_SIZE", str(INGEST_BATCH_SIZE)))
+
+_DONE = object()
+_POLL_SECONDS = 0.1
+
+
+@dataclass
+class StageConfig:
+    """Concurrency of each stage and the size of the queues between them."""
+    load_workers: int = STREAM_LOAD_WORKERS
+    analyze_workers: int = STREAM_ANALYZE_WORKERS
+    analyze_processes: int = STREAM_ANALYZE_PROCESSES
+    chunk_workers: int = STREAM_CHUNK_WORKERS
+    enrich_workers: int = STREAM_ENRICH_WORKERS
+    ingest_workers: int = STREAM_INGEST_WORKERS
+    queue_size: int = STREAM_QUEUE_SIZE
+    ingest_batch_size: int = STREAM_INGEST_BATCH_SIZE
+
+
+@dataclass
+class FileWork:
+    """One changed file on its way through the stages."""
+    path: str
+    update: Dict[str, Any]
+    documents: List[Document] = field(default_factory=list)
+    chunks: List[Document] = field(default_factory=list)
+    # Enriched chunks read back from a checkpoint; only ingest is left to do
+    restored: bool = False
+    # Above the stream threshold: read window by window in the chunk stage
+    streamed: bool = False
+
+
+class _Stopped(Exception):
+    """Raised in a worker once another stage has failed."""
+
+
+class StreamingPipeline:
+    """
+    Runs the changed files of a ManifestDiff through all stages concurrently.
+    以多執行緒同時執行各階段，處理 ManifestDiff 中的變更文件。
+    """
+    def __init__(self, metrics: RunMetrics, root: str, config: Optional[StageConfig] = None,
+                 manifest_path: Optional[str] = None, checkpoint: Optional[CheckpointStore] = None):
+        self.metrics = metrics
+        self.config = config or StageConfig()
+        self.checkpoint = checkpoint
+        self.ingestor = BatchIngestor(metrics, IngestConfig(batch_size=max(1, self.config.ingest_batch_size)))
+        self._ingest_failures: List[Dict[str, Any]] = []
+        self.ledger = ChunkLedger(root)
+        self.manifest = IngestManifest(root, manifest_path)
+        self.symbol_table = SymbolTable.load(root)
+        self.analysis_cache = AnalysisCache()
+        self.analysis_results: Dict[str, List[str]] = {}
+        self._stop = threading.Event()
+        self._failure: Optional[BaseException] = None
+        self._lock = threading.Lock()
+        self._files_done = 0
+        self._files_total = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    # --- queue helpers ---
+    def _put(self, q: "queue.Queue", item):
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: "queue.Queue"):
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                return q.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+
+    def _fail(self, exc: BaseException):
+        with self._lock:
+            if self._failure is None:
+                self._failure = exc
+        self._stop.set()
+
+    def _start_stage(self, name: str, workers: int, inbox: "queue.Queue", outbox: Optional["queue.Queue"],
+                     handle: Callable[[Any], Any]) -> List[threading.Thread]:
+        """
+        Starts workers threads applying handle to every item of inbox. None results are dropped;
+        the last worker to see the end marker passes it on to outbox.
+        """
+        remaining = [max(1, workers)]
+        remaining_lock = threading.Lock()
+
+        def run():
+            try:
+                while True:
+                    item = self._get(inbox)
+                    if item is _DONE:
+                        # Leave the marker for the other workers of this stage
+                        self._put(inbox, _DONE)
+                        break
+                    start = time.perf_counter()
+                    result = handle(item)
+                    self.metrics.add_time(f"stream.{name}", time.perf_counter() - start)
+                    if result is not None and outbox is not None:
+                        self._put(outbox, result)
+                with remaining_lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last and outbox is not None:
+                    self._put(outbox, _DONE)
+            except _Stopped:
+                pass
+            except BaseException as e:
+                self.metrics.record_error(f"stream.{name}", e)
+                self._fail(e)
+
+        threads = [threading.Thread(target=run, name=f"stream-{name}-{i}", daemon=True)
+                   for i in range(remaining[0])]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    # --- stages ---
+    def _load(self, work: FileWork) -> Optional[FileWork]:
+        if self.checkpoint is not None:
+            restored = self.checkpoint.get_file("enrich_chunks", work.path)
+            if restored is not None:
+                work.chunks, work.restored = restored, True
+                self.metrics.incr("checkpoint_restored:enrich_chunks")
+                return work
+        if should_stream(work.path, work.update["size"]):
+            work.streamed = True
+            return work
+        try:
+            work.documents = list(load_file_documents(work.path, work.update["size"], self.metrics))
+        except Exception as e:
+            # Never reaches ingest, so it stays out of the manifest and the next run retries it
+            self.metrics.record_error("load_code", e, work.path)
+            return None
+        return work
+
+    def _analyze(self, work: FileWork) -> FileWork:
+        if work.restored:
+            return work
+        results = analyze_documents(work.documents, self.metrics, self.analysis_cache, self.symbol_table,
+                                    processes=1, executor=self._executor)
+        if results:
+            with self._lock:
+                self.analysis_results.update(results)
+        return work
+
+    def _chunk(self, work: FileWork) -> Optional[FileWork]:
+        if work.restored:
+            return work
+        if work.streamed:
+            try:
+                work.chunks = chunk_streamed_file(work.path, work.update["size"], self.metrics)
+            except Exception as e:
+                self.metrics.record_error("load_code", e, work.path)
+                return None
+            return work
+        work.chunks = split_into_chunks(work.documents, self.metrics)
+        # The file text is no longer needed once it is chunked
+        work.documents = []
+        return work
+
+    def _enrich(self, work: FileWork) -> FileWork:
+        if work.restored:
+            return work
+        work.chunks = [enrich_chunk(chunk, self.symbol_table, self.metrics) for chunk in work.chunks]
+        if self.checkpoint is not None:
+            self.checkpoint.put_file("enrich_chunks", work.path, work.chunks)
+        return work
+
+    def _start_ingest(self, inbox: "queue.Queue") -> List[threading.Thread]:
+        """Ingest workers collect whole files into batches of about ingest_batch_size chunks."""
+        batch_size = max(1, self.config.ingest_batch_size)
+
+        def run():
+            try:
+                pending: List[FileWork] = []
+                pending_chunks = 0
+                while True:
+                    item = self._get(inbox)
+                    if item is _DONE:
+                        self._put(inbox, _DONE)
+                        break
+                    pending.append(item)
+                    pending_chunks += len(item.chunks)
+                    if pending_chunks >= batch_size:
+                        self._ingest(pending)
+                        pending, pending_chunks = [], 0
+                if pending:
+                    self._ingest(pending)
+            except _Stopped:
+                pass
+            except BaseException as e:
+                self.metrics.record_error("stream.ingest", e)
+                self._fail(e)
+
+        threads = [threading.Thread(target=run, name=f"stream-ingest-{i}", daemon=True)
+                   for i in range(max(1, self.config.ingest_workers))]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def _ingest(self, files: List[FileWork]):
+        start = time.perf_counter()
+        checkpoint = self.checkpoint
+        pending = [work for work in files if checkpoint is None or not checkpoint.is_ingested(work.path)]
+        report = upsert_files(self.ingestor, self.ledger, [(work.path, work.chunks) for work in pending],
+                              {work.path: work.update for work in pending})
+        ingested = [work for work in files if work.path not in report.failed_sources]
+
+        # Only record the files as ingested once Graphiti accepted all of their chunks
+        # 只有在 Graphiti 接收了文件的所有切片後才把文件記錄到清單中
+        with self._lock:
+            self._ingest_failures.extend(report.failures)
+            self.manifest.apply({work.path: work.update for work in ingested})
+            self.manifest.save()
+            if checkpoint is not None:
+                checkpoint.mark_ingested(work.path for work in ingested)
+            self._files_done += len(files)
+            done = self._files_done
+        self.metrics.add_time("stream.ingest", time.perf_counter() - start)
+        self.metrics.progress("stream_pipeline", done, self._files_total)
+
+    # --- driver ---
+    def run(self, diff: ManifestDiff):
+        """
+        Processes diff.changed, then applies the remaining manifest updates and deletions.
+        Re-raises the first stage failure after every worker has stopped.
+        """
+        config = self.config
+        for file_path in diff.deleted:
+            self.symbol_table.remove_file(file_path)
+        self._files_total = len(diff.changed)
+        if config.analyze_processes > 1:
+            self._executor = ProcessPoolExecutor(max_workers=config.analyze_processes)
+
+        queues = [queue.Queue(maxsize=max(1, config.queue_size)) for _ in range(5)]
+        source, loaded, analyzed, chunked, enriched = queues
+        threads = []
+        threads += self._start_stage("load", config.load_workers, source, loaded, self._load)
+        threads += self._start_stage("analyze", config.analyze_workers, loaded, analyzed, self._analyze)
+        threads += self._start_stage("chunk", config.chunk_workers, analyzed, chunked, self._chunk)
+        threads += self._start_stage("enrich", config.enrich_workers, chunked, enriched, self._enrich)
+        threads += self._start_ingest(enriched)
+
+        try:
+            for file_path in diff.changed:
+                self._put(source, FileWork(file_path, diff.updates[file_path]))
+            self._put(source, _DONE)
+        except _Stopped:
+            pass
+        for thread in threads:
+            thread.join()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+        self.analysis_cache.save()
+        record_embedding_stats(self.metrics)
+        # Symbols of ingested files match the manifest even when a later file failed
+        self.symbol_table.save()
+        if self._failure is not None:
+            raise self._failure
+        if self._ingest_failures:
+            # Files of failed batches stay out of the manifest, so the next run retries them
+            raise IngestError(self._ingest_failures)
+
+        # Touched-but-unchanged files and deletions are applied once everything else succeeded
+        changed = set(diff.changed)
+        self.manifest.apply({p: u for p, u in diff.updates.items() if p not in changed}, diff.deleted)
+        tombstones = self.manifest.pending_tombstones()
+        retracted = retract_files(self.ingestor, self.ledger, tombstones)
+        self.manifest.mark_retracted(p for p in tombstones if p not in retracted.failed_sources)
+        self.manifest.save()
+        self.metrics.set("pending_tombstones", len(self.manifest.pending_tombstones()))
+        self.metrics.set("ledger_chunks", len(self.ledger))
+        if retracted.failures:
+            raise IngestError(retracted.failures)
+        self.metrics.incr("symbols_analyzed", len(self.analysis_results))
+        self.metrics.set("symbol_table_size", len(self.symbol_table))
+        if self.checkpoint is not None:
+            self.checkpoint.finish()
+
+
+def stream_pipeline_node(state: GraphState) -> GraphState:
+    """
+    Loads, analyzes, chunks, enriches and ingests the changed files as one streaming node.
+    以單一串流節點完成載入、分析、切片、補充與匯入。
+    """
+    metrics = state['metrics']
+    diff = plan_load(state)
+    state['documents'] = []
+    state['streamed_files'] = []
+    state['chunks'] = []
+    state['deleted_files'] = diff.deleted
+    state['manifest_updates'] = diff.updates
+    if not diff.changed and not diff.deleted and not diff.updates:
+        metrics.log("沒有任何文件變更，略過後續階段。")
+        state['analysis_results'] = {}
+        return state
+
+    pipeline = StreamingPipeline(metrics, state['file_path'], checkpoint=open_run_checkpoint(state, diff))
+    pipeline.run(diff)
+    state['analysis_results'] = pipeline.analysis_results
+    state['symbol_table'] = pipeline.symbol_table
+    return state
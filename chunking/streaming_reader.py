@@ -0,0 +1,75 @@
+"""
+Bounded-memory reading of very large source files.
+以固定大小的視窗串流讀取超大原始碼文件 (例如自動產生的 Groovy 或壓縮過的 JS)，
+每次只在記憶體中保留一個視窗，視窗之間保留重疊區以免切斷上下文。
+"""
+import os
+from typing import Iterator, NamedTuple
+
+# Files above this size (bytes) are streamed instead of read whole
+# 超過此大小 (bytes) 的文件改以串流視窗讀取
+STREAM_THRESHOLD_BYTES = int(os.environ.get("CHUNKING_STREAM_THRESHOLD", str(8 * 1024 * 1024)))
+WINDOW_CHARS = int(os.environ.get("CHUNKING_WINDOW_CHARS", "1000000"))
+WINDOW_OVERLAP_CHARS = int(os.environ.get("CHUNKING_WINDOW_OVERLAP_CHARS", "2000"))
+
+
+class TextWindow(NamedTuple):
+    """One window of a file; start_index is a character offset, start_line is 0-based."""
+    index: int
+    text: str
+    start_index: int
+    start_line: int
+
+
+def should_stream(file_path: str, size: int = None) -> bool:
+    """True when the file is large enough to go through iter_text_windows."""
+    if size is None:
+        size = os.path.getsize(file_path)
+    return size > STREAM_THRESHOLD_BYTES
+
+
+def iter_text_windows(file_path: str, window_chars: int = WINDOW_CHARS,
+                      overlap_chars: int = WINDOW_OVERLAP_CHARS,
+                      encoding: str = "utf-8", errors: str = "strict") -> Iterator[TextWindow]:
+    """
+    Yields overlapping windows of at most window_chars characters.
+    產出最多 window_chars 個字元的重疊視窗。
+
+    Windows end at the last newline inside the window when there is one, otherwise
+    (e.g. a minified single-line file) they are cut at window_chars. The next window
+    starts overlap_chars before the cut, aligned to a line start when possible.
+    """
+    if overlap_chars >= window_chars // 2:
+        raise ValueError("overlap_chars must be smaller than half of window_chars")
+
+    with open(file_path, "r", encoding=encoding, errors=errors, newline="") as f:
+        buf = ""
+        buf_start = 0      # character offset of buf[0] in the file
+        buf_line = 0       # line number of buf[0]
+        emitted_end = 0    # character offset up to which text has been yielded
+        index = 0
+        while True:
+            data = f.read(window_chars - len(buf))
+            buf += data
+            if not data:
+                # EOF: whatever is left (if it is not just the overlap) is the last window
+                if buf and buf_start + len(buf) > emitted_end:
+                    yield TextWindow(index, buf, buf_start, buf_line)
+                return
+            if len(buf) < window_chars:
+                continue
+
+            cut = buf.rfind("\n", 0, window_chars) + 1
+            if cut <= overlap_chars:
+                cut = len(buf)
+            yield TextWindow(index, buf[:cut], buf_start, buf_line)
+            index += 1
+            emitted_end = buf_start + cut
+
+            next_start = cut - overlap_chars
+            newline = buf.find("\n", next_start, cut)
+            if newline != -1 and newline + 1 < cut:
+                next_start = newline + 1
+            buf_line += buf.count("\n", 0, next_start)
+            buf_start += next_start
+            buf = buf[next_start:]
@@ -0,0 +1,194 @@
+"""
+Project-wide symbol table keyed by qualified name.
+專案層級的符號表：以完整限定名稱 (path::Class.method) 為鍵，記錄每個符號的行號範圍與依賴，
+並支援以名稱或文件 O(1) 查找。每次執行結束後持久化，供下一次增量執行與檢索使用。
+
+Like the manifests, there is one table per corpus root, and paths are stored relative to
+the root ('/'-separated, see manifest.relative_key), so docs, ./docs and /abs/docs share
+one table and qualified names do not depend on how the root was spelled. Methods accept
+any spelling of a file path under the root.
+"""
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from interval_tree import IntervalTree
+from manifest import STATE_DIR, manifest_path, relative_key
+
+SYMBOL_TABLE_DIR = os.environ.get("CHUNKING_SYMBOL_TABLE_DIR", os.path.join(STATE_DIR, "symbols"))
+# Older tables keyed files by the path as spelled and are not read
+SYMBOL_TABLE_VERSION = 2
+
+
+def symbol_table_path(root: str) -> str:
+    """The symbol table file of one corpus root."""
+    return manifest_path(root, SYMBOL_TABLE_DIR)
+
+
+@dataclass
+class Symbol:
+    """One class, function or method; lines are 1-based and inclusive."""
+    path: str  # relative to the corpus root, '/'-separated
+    name: str  # dotted name inside the file, e.g. "Class.method"
+    kind: str  # "class", "function" or "method"
+    start_line: int
+    end_line: int
+    dependencies: List[str] = field(default_factory=list)
+
+    @property
+    def qualified_name(self) -> str:
+        return f"{self.path}::{self.name}"
+
+    @property
+    def short_name(self) -> str:
+        return self.name.rsplit(".", 1)[-1]
+
+
+class SymbolTable:
+    """
+    Symbols of one corpus root indexed by qualified name, by file and by short name.
+    以完整名稱、文件與簡短名稱索引的符號。更新與區間查詢是執行緒安全的。
+    Without a root, paths are used as given.
+    """
+    def __init__(self, symbols: Iterable[Symbol] = (), root: Optional[str] = None):
+        self.root = root
+        self._real_root = os.path.realpath(root) if root is not None else None
+        self._by_qualified: Dict[str, Symbol] = {}
+        self._by_file: Dict[str, List[Symbol]] = {}
+        self._by_name: Dict[str, List[Symbol]] = {}
+        self._by_file_name: Dict[Tuple[str, str], List[Symbol]] = {}
+        # Per-file line interval trees, built on first use
+        self._trees: Dict[str, IntervalTree] = {}
+        self._lock = threading.RLock()
+        for symbol in symbols:
+            self._add(symbol)
+
+    def key(self, path: str) -> str:
+        """The path stored in Symbol.path for a file path under the root."""
+        return relative_key(self._real_root, path) if self._real_root is not None else path
+
+    def _add(self, symbol: Symbol):
+        self._trees.pop(symbol.path, None)
+        previous = self._by_qualified.get(symbol.qualified_name)
+        if previous is not None:
+            # Same dotted name twice in one file (e.g. a redefinition): the later one wins
+            self._by_file[symbol.path].remove(previous)
+            self._by_name[previous.short_name].remove(previous)
+            self._by_file_name[(previous.path, previous.short_name)].remove(previous)
+        self._by_qualified[symbol.qualified_name] = symbol
+        self._by_file.setdefault(symbol.path, []).append(symbol)
+        self._by_name.setdefault(symbol.short_name, []).append(symbol)
+        self._by_file_name.setdefault((symbol.path, symbol.short_name), []).append(symbol)
+
+    def set_file(self, path: str, symbols: Iterable[Dict]):
+        """Replaces everything known about path with CodeAnalyzer.symbol_spans() output."""
+        key = self.key(path)
+        with self._lock:
+            self._remove(key)
+            for entry in symbols:
+                self._add(Symbol(path=key, **entry))
+
+    def remove_file(self, path: str):
+        with self._lock:
+            self._remove(self.key(path))
+
+    def _remove(self, key: str):
+        self._trees.pop(key, None)
+        for symbol in self._by_file.pop(key, []):
+            del self._by_qualified[symbol.qualified_name]
+            same_name = self._by_name[symbol.short_name]
+            same_name.remove(symbol)
+            if not same_name:
+                del self._by_name[symbol.short_name]
+            self._by_file_name.pop((key, symbol.short_name), None)
+
+    def get(self, qualified_name: str) -> Optional[Symbol]:
+        return self._by_qualified.get(qualified_name)
+
+    def in_file(self, path: str) -> List[Symbol]:
+        """Symbols of one file in source order."""
+        return self._by_file.get(self.key(path), [])
+
+    def lookup(self, name: str) -> List[Symbol]:
+        """All symbols whose short name ("method") or dotted name ("Class.method") is name."""
+        matches = self._by_name.get(name.rsplit(".", 1)[-1], [])
+        if "." in name:
+            matches = [s for s in matches if s.name == name or s.name.endswith(f".{name}")]
+        return list(matches)
+
+    def find_in_file(self, path: str, name: str) -> Optional[Symbol]:
+        """The symbol called name in path; the outermost one when several match."""
+        for symbol in self._by_file_name.get((self.key(path), name.rsplit(".", 1)[-1]), []):
+            if symbol.name == name or symbol.name.endswith(f".{name}"):
+                return symbol
+        return None
+
+    def overlapping(self, path: str, start_line: int, end_line: int) -> List[Symbol]:
+        """Symbols of path overlapping the 1-based inclusive line range, outermost first."""
+        key = self.key(path)
+        with self._lock:
+            tree = self._trees.get(key)
+            if tree is None:
+                tree = IntervalTree((s.start_line, s.end_line, s) for s in self._by_file.get(key, []))
+                self._trees[key] = tree
+        return tree.overlapping(start_line, end_line)
+    def resolve_span(self, path: str, start_line: int, end_line: int) -> Tuple[Optional[Symbol], List[str]]:
+        """
+        The main symbol of a code span and the dependencies used inside it.
+        找出一段程式碼 (1-based 行號) 的主要符號與其中用到的依賴。
+
+        The main symbol is the one covering most of the span (the innermost on ties, so a
+        chunk inside a method resolves to the method, not its class). Dependencies come from
+        the innermost overlapping symbols only, because a class also carries the
+        dependencies of methods that may lie outside the span.
+        """
+        symbols = self.overlapping(path, start_line, end_line)
+        if not symbols:
+            return None, []
+
+        def overlap(symbol: Symbol) -> int:
+            return min(end_line, symbol.end_line) - max(start_line, symbol.start_line) + 1
+
+        main = max(symbols, key=lambda s: (overlap(s), s.start_line - s.end_line))
+        innermost = [s for s in symbols
+                     if not any(other.name.startswith(f"{s.name}.") for other in symbols)]
+        dependencies = sorted({dep for s in innermost for dep in s.dependencies})
+        return main, dependencies
+
+    def files(self) -> List[str]:
+        """Root-relative paths of the files with symbols."""
+        return list(self._by_file)
+
+    def __len__(self):
+        return len(self._by_qualified)
+
+    def __contains__(self, qualified_name: str):
+        return qualified_name in self._by_qualified
+
+    @classmethod
+    def load(cls, root: str, path: Optional[str] = None) -> "SymbolTable":
+        """The saved table of root, read from path (default: symbol_table_path(root))."""
+        path = path or symbol_table_path(root)
+        if not os.path.exists(path):
+            return cls(root=root)
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("version") != SYMBOL_TABLE_VERSION:
+            return cls(root=root)
+        return cls((Symbol(**entry) for entry in payload.get("symbols", [])), root=root)
+
+    def save(self, path: Optional[str] = None):
+        """Writes the table atomically (default: symbol_table_path(root))."""
+        path = path or symbol_table_path(self.root)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with self._lock:
+            symbols = [asdict(s) for s in self._by_qualified.values()]
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": SYMBOL_TABLE_VERSION, "root": self._real_root, "symbols": symbols},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, path)
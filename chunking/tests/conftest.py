@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# Module-level state paths (manifest.STATE_DIR and everything derived from it) are read at
+# import time, so point them at a scratch directory before any test imports the pipeline
+os.environ.setdefault("CHUNKING_STATE_DIR", tempfile.mkdtemp(prefix="chunking-tests-"))
@@ -0,0 +1,119 @@
+import pytest
+from langchain_core.documents import Document
+
+import chuncking
+import streaming_pipeline
+from checkpoints import CheckpointStore, list_runs, open_checkpoint
+from embedding_backends import HashingEmbeddings
+from graphiti_client import GraphitiClientManager, set_manager
+from graphiti_ingest import BatchIngestor, IngestConfig, IngestError
+from manifest import IngestManifest
+from memory_graph import InMemoryGraphiti
+from run_metrics import RunMetrics
+
+
+def test_per_file_outputs_survive_a_reload_and_follow_the_content(tmp_path):
+    store = CheckpointStore.create("/corpus", "run-1", directory=str(tmp_path))
+    store.set_plan({"/corpus/a.py": "sha-a", "/corpus/b.py": "sha-b"}, ["/corpus/gone.py"])
+    store.put_file("chunk_code", "/corpus/a.py", [Document(page_content="x = 1", metadata={"start_line": 0})])
+    store.complete_stage("analyze_code", {"f": ["g"]})
+    store.mark_ingested(["/corpus/b.py"])
+
+    resumed = CheckpointStore("run-1", directory=str(tmp_path))
+    assert resumed.stage_done("analyze_code") and resumed.stage_output("analyze_code") == {"f": ["g"]}
+    assert [d.page_content for d in resumed.get_file("chunk_code", "/corpus/a.py")] == ["x = 1"]
+    assert resumed.is_ingested("/corpus/b.py") and not resumed.is_ingested("/corpus/a.py")
+
+    # a.py changed before the resume: its chunks and the completed stages no longer apply
+    resumed.set_plan({"/corpus/a.py": "sha-a2", "/corpus/b.py": "sha-b"}, ["/corpus/gone.py"])
+    assert resumed.get_file("chunk_code", "/corpus/a.py") is None
+    assert not resumed.stage_done("analyze_code")
+    assert resumed.is_ingested("/corpus/b.py")
+
+
+def test_latest_unfinished_run_is_resumed_and_finished_runs_are_removed(tmp_path):
+    directory = str(tmp_path)
+    first = CheckpointStore.create("/corpus", "run-1", directory=directory)
+    first.set_plan({}, [])
+    CheckpointStore.create("/other", "run-2", directory=directory).set_plan({}, [])
+    assert CheckpointStore.latest("/corpus", directory=directory).run_id == "run-1"
+    # Any spelling of the same directory resumes the run
+    assert CheckpointStore.latest("/corpus/./sub/..", directory=directory).run_id == "run-1"
+    first.finish(keep=False)
+    assert CheckpointStore.latest("/corpus", directory=directory) is None
+    assert [meta["run_id"] for meta in list_runs(directory)] == ["run-2"]
+
+
+def test_checkpoints_are_opt_in(monkeypatch):
+    assert open_checkpoint("/corpus") is None
+    assert open_checkpoint("/corpus", enabled=False) is None
+    monkeypatch.setattr("checkpoints.CHECKPOINTS_ENABLED", True)
+    store = open_checkpoint("/corpus")
+    assert store is not None
+    store.finish(keep=False)
+
+
+class NoRetryIngestor(BatchIngestor):
+    def __init__(self, metrics, config=None, manager=None):
+        config = config or IngestConfig()
+        config.retries, config.batch_size = 0, 4
+        super().__init__(metrics, config, manager)
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    graph = InMemoryGraphiti(embeddings=HashingEmbeddings(32))
+
+    async def factory(config):
+        return graph
+
+    manager = GraphitiClientManager(client_factory=factory, health_interval=0)
+    previous = set_manager(manager)
+    monkeypatch.setattr("checkpoints.CHECKPOINTS_ENABLED", True)
+    monkeypatch.setattr(chuncking, "BatchIngestor", NoRetryIngestor)
+    monkeypatch.setattr(streaming_pipeline, "BatchIngestor", NoRetryIngestor)
+    yield graph
+    set_manager(previous)
+    manager.close()
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_failed_run_resumes_without_redoing_finished_work(graph, tmp_path, streaming):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    for i in range(6):
+        (corpus / f"m{i}.py").write_text("".join(f"def f{i}_{j}(x):\n    return x + {j}\n\n\n" for j in range(3)),
+                                          encoding="utf-8")
+    original = graph.add_episode_bulk
+
+    async def m3_fails(episodes, **kwargs):
+        if any(episode.source_description.endswith("m3.py") for episode in episodes):
+            raise ConnectionError("neo4j down")
+        return await original(episodes, **kwargs)
+
+    def state(**kwargs):
+        return {"file_path": str(corpus), "documents": [], "analysis_results": {}, "chunks": [],
+                "incremental": True, "deleted_files": [], "manifest_updates": {},
+                "metrics": RunMetrics("test", verbose=False, progress=False), **kwargs}
+
+    app = chuncking.create_chunking_graph(streaming=streaming)
+    graph.add_episode_bulk = m3_fails
+    with pytest.raises(IngestError):
+        app.invoke(state())
+    run, = [meta for meta in list_runs() if meta.get("file_path") == str(corpus)]
+    assert run["status"] == "running" and str(corpus / "m3.py") not in run["ingested"]
+    ingested_before = len(graph.episodes)
+
+    graph.add_episode_bulk = original
+    result = app.invoke(state(resume=True))
+    counters = result["metrics"].counters
+    # Chunks come back from the checkpoint instead of being recomputed
+    assert counters.get("chunks_initial", 0) == 0
+    restored = counters.get("checkpoint_restored:enrich_chunks", 0) + counters.get("checkpoint_restored:chunk_code", 0)
+    assert restored > 0
+    # Only the files that were not ingested are sent again, every chunk exactly once
+    assert len(graph.episodes) - ingested_before == counters["episodes_ingested"]
+    facts = [edge.fact for edge in graph.edges.values()]
+    assert len(facts) == len(set(facts)) == 6
+    assert not [meta for meta in list_runs() if meta.get("file_path") == str(corpus)]
+    assert len(IngestManifest(str(corpus)).entries) == 6
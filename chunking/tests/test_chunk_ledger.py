@@ -0,0 +1,170 @@
+import json
+import os
+
+import pytest
+from langchain_core.documents import Document
+
+from chuncking import build_episodes, retract_files, upsert_files
+from chunk_ledger import ChunkLedger, chunk_ids
+from embedding_backends import HashingEmbeddings
+from graphiti_client import GraphitiClientManager
+from graphiti_ingest import BatchIngestor, IngestConfig
+from memory_graph import InMemoryGraphiti
+from run_metrics import RunMetrics
+
+ROOT = "/src"
+PATH = "/src/app.py"
+
+
+def chunks(*texts, path=PATH):
+    documents, offset = [], 0
+    for text in texts:
+        documents.append(Document(page_content=text, metadata={
+            "source": path, "start_index": offset, "end_index": offset + len(text)}))
+        offset += len(text)
+    return documents
+
+
+@pytest.fixture
+def graph():
+    return InMemoryGraphiti(embeddings=HashingEmbeddings(32))
+
+
+@pytest.fixture
+def ingestor(graph):
+    async def factory(config):
+        return graph
+
+    manager = GraphitiClientManager(client_factory=factory, health_interval=0)
+    yield BatchIngestor(RunMetrics("test", verbose=False, progress=False),
+                        IngestConfig(batch_size=2, retries=0, backoff=0), manager)
+    manager.close()
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return ChunkLedger(ROOT, str(tmp_path / "ledger.json"))
+
+
+def stored(graph):
+    return sorted(edge.fact for edge in graph.edges.values())
+
+
+def test_episodes_leave_the_uuid_to_graphiti():
+    assert all(episode.uuid is None for episode in build_episodes(chunks("a = 1\n", "b = 2\n")))
+
+
+def test_ledger_records_the_uuids_graphiti_assigned(graph, ingestor, ledger):
+    report = upsert_files(ingestor, ledger, [(PATH, chunks("a = 1\n", "b = 2\n", "c = 3\n"))], {})
+    assert report.ok
+    entries = ledger.entries(PATH)
+    assert list(entries) == chunk_ids(chunks("a = 1\n", "b = 2\n", "c = 3\n"), "app.py")
+    assert set(entries.values()) == set(graph.episodes)
+
+    # Reloaded from disk, an unchanged file sends nothing
+    ledger = ChunkLedger(ROOT, ledger.path)
+    upsert_files(ingestor, ledger, [(PATH, chunks("a = 1\n", "b = 2\n", "c = 3\n"))], {})
+    assert ingestor.metrics.counters["chunks_unchanged"] == 3
+    assert len(graph.episodes) == 3
+
+
+def test_changed_chunks_replace_their_old_episodes(graph, ingestor, ledger):
+    upsert_files(ingestor, ledger, [(PATH, chunks("a = 1\n", "b = 2\n"))], {})
+    old = ledger.entries(PATH)
+    report = upsert_files(ingestor, ledger, [(PATH, chunks("a = 1\n", "b = 20\n"))], {})
+    assert report.ok
+    assert stored(graph) == ["a = 1\n", "b = 20\n"]
+    entries = ledger.entries(PATH)
+    assert set(entries.values()) == set(graph.episodes)
+    # The unchanged chunk kept its episode
+    assert len(set(entries.values()) & set(old.values())) == 1
+
+
+def test_retract_removes_every_episode_of_a_deleted_file(graph, ingestor, ledger):
+    upsert_files(ingestor, ledger, [(PATH, chunks("a = 1\n", "b = 2\n")),
+                                    ("/src/other.py", chunks("x = 1\n", path="/src/other.py"))], {})
+    report = retract_files(ingestor, ledger, [PATH])
+    assert report.ok
+    assert stored(graph) == ["x = 1\n"]
+    assert ledger.entries(PATH) == {}
+
+
+def test_partly_failed_file_keeps_old_and_added_episodes_in_the_ledger(graph, ingestor, ledger):
+    upsert_files(ingestor, ledger, [(PATH, chunks("a = 1\n"))], {})
+    original = graph.add_episode_bulk
+
+    async def second_batch_fails(episodes, **kwargs):
+        if any(episode.content == "d = 4\n" for episode in episodes):
+            raise ConnectionError("neo4j down")
+        return await original(episodes, **kwargs)
+
+    graph.add_episode_bulk = second_batch_fails
+    report = upsert_files(ingestor, ledger, [(PATH, chunks("b = 2\n", "c = 3\n", "d = 4\n"))], {})
+    assert report.failed_sources == {PATH}
+    # The old version stays until the whole file is in; the first batch is not orphaned
+    assert stored(graph) == ["a = 1\n", "b = 2\n", "c = 3\n"]
+    assert set(ledger.entries(PATH).values()) == set(graph.episodes)
+
+    graph.add_episode_bulk = original
+    report = upsert_files(ingestor, ledger, [(PATH, chunks("b = 2\n", "c = 3\n", "d = 4\n"))], {})
+    assert report.ok
+    assert ingestor.metrics.counters["chunks_unchanged"] == 2
+    assert stored(graph) == ["b = 2\n", "c = 3\n", "d = 4\n"]
+
+
+def test_failed_removals_stay_in_the_ledger(graph, ingestor, ledger):
+    upsert_files(ingestor, ledger, [(PATH, chunks("a = 1\n"))], {})
+
+    async def unavailable(uuid):
+        raise ConnectionError("neo4j down")
+
+    original, graph.remove_episode = graph.remove_episode, unavailable
+    report = upsert_files(ingestor, ledger, [(PATH, chunks("a = 2\n"))], {})
+    assert not report.ok
+    assert set(ledger.entries(PATH).values()) == set(graph.episodes)
+
+    graph.remove_episode = original
+    assert upsert_files(ingestor, ledger, [(PATH, chunks("a = 2\n"))], {}).ok
+    assert stored(graph) == ["a = 2\n"]
+
+
+def test_disabled_ledger_replaces_the_recorded_episodes(graph, ingestor, tmp_path):
+    ledger = ChunkLedger(ROOT, str(tmp_path / "ledger.json"), enabled=False)
+    upsert_files(ingestor, ledger, [(PATH, chunks("a = 1\n", "b = 2\n"))], {})
+    upsert_files(ingestor, ledger, [(PATH, chunks("a = 1\n", "b = 2\n"))], {})
+    assert stored(graph) == ["a = 1\n", "b = 2\n"]
+    assert set(ledger.entries(PATH).values()) == set(graph.episodes)
+
+
+def test_ledgers_without_uuids_are_not_read(tmp_path):
+    path = tmp_path / "ledger.json"
+    path.write_text(json.dumps({"version": 1, "files": {PATH: ["abc"]}}), encoding="utf-8")
+    assert len(ChunkLedger(ROOT, str(path))) == 0
+
+
+def test_ledger_keys_do_not_depend_on_how_the_root_is_spelled(graph, ingestor, tmp_path, monkeypatch):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    monkeypatch.chdir(tmp_path)
+    ledger_path = str(tmp_path / "ledger.json")
+    absolute, relative = str(docs / "A.java"), os.path.join("docs", "A.java")
+
+    upsert_files(ingestor, ChunkLedger(str(docs), ledger_path), [(absolute, chunks("a;\n", "b;\n", path=absolute))], {})
+    ledger = ChunkLedger("./docs", ledger_path)
+    assert list(ledger.files) == ["A.java"]
+    report = upsert_files(ingestor, ledger, [(relative, chunks("a;\n", "c;\n", path=relative))], {})
+    assert report.ok
+    assert ingestor.metrics.counters["chunks_unchanged"] == 1
+    assert stored(graph) == ["a;\n", "c;\n"]
+
+    assert retract_files(ingestor, ChunkLedger(f"{docs}/", ledger_path), [f"{docs}/./A.java"]).ok
+    assert stored(graph) == []
+
+
+def test_unknown_tombstones_are_not_reported_as_retracted(graph, ingestor, ledger):
+    upsert_files(ingestor, ledger, [(PATH, [])], {})
+    report = retract_files(ingestor, ledger, [PATH, "/src/never_ingested.py"])
+    assert report.failed_sources == {"/src/never_ingested.py"}
+    assert ingestor.metrics.counters["tombstones_unknown"] == 1
+    # A file ingested without chunks was known, so its tombstone is done
+    assert not ledger.knows(PATH)
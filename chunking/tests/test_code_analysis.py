@@ -0,0 +1,64 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from code_analysis import AnalysisCache, analysis_key, analyze_sources, entry_error
+
+SOURCES = [
+    f"import os\n\n\nclass C{i}:\n    def run(self):\n        return os.path.join('a', '{i}')\n\n\n"
+    f"def helper{i}(x):\n    return len(x) + {i}\n"
+    for i in range(20)
+]
+
+
+def test_second_run_is_served_from_the_cache(tmp_path):
+    path = str(tmp_path / "analysis.json")
+    cache = AnalysisCache(path)
+    first, stats = analyze_sources(SOURCES, cache, processes=1)
+    assert stats == {"hits": 0, "parsed": 20}
+    cache.save()
+
+    cached, stats = analyze_sources(SOURCES, AnalysisCache(path), processes=1)
+    assert stats == {"hits": 20, "parsed": 0}
+    assert cached == first
+    assert [s["name"] for s in cached[3]["symbols"]] == ["C3", "C3.run", "helper3"]
+
+
+def test_changed_content_is_parsed_again(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "analysis.json"))
+    analyze_sources(SOURCES[:3], cache, processes=1)
+    changed = "import json\n" + SOURCES[1].replace("len(x)", "len(json.dumps(x))")
+    assert analysis_key(changed) != analysis_key(SOURCES[1])
+
+    entries, stats = analyze_sources([SOURCES[0], changed, SOURCES[2]], cache, processes=1)
+    assert stats == {"hits": 2, "parsed": 1}
+    assert entries[1]["result"]["helper1"] == ["json"]
+
+
+def test_identical_sources_are_parsed_once():
+    entries, stats = analyze_sources([SOURCES[0], SOURCES[0], SOURCES[1]], processes=1)
+    assert stats["parsed"] == 2
+    assert entries[0] == entries[1]
+
+
+def test_pool_results_match_the_serial_path():
+    serial, _ = analyze_sources(SOURCES, processes=1)
+    pooled, stats = analyze_sources(SOURCES, processes=2, min_parallel=1, chunksize=3)
+    assert stats["parsed"] == 20
+    assert pooled == serial
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        assert analyze_sources(SOURCES, executor=executor)[0] == serial
+
+
+def test_failures_are_cached_and_rebuilt(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "analysis.json"))
+    broken = "def broken(:\n"
+    (entry,), _ = analyze_sources([broken], cache, processes=1)
+    assert isinstance(entry_error(entry), SyntaxError)
+    assert analyze_sources([broken], cache, processes=1)[1] == {"hits": 1, "parsed": 0}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "analysis.json"), max_entries=2)
+    analyze_sources(SOURCES[:2], cache, processes=1)
+    analyze_sources(SOURCES[:1], cache, processes=1)
+    analyze_sources(SOURCES[2:3], cache, processes=1)
+    assert list(cache.entries) == [analysis_key(SOURCES[0]), analysis_key(SOURCES[2])]
@@ -0,0 +1,86 @@
+import json
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+MODEL = "test-model"
+
+
+def vector(value, dim=4):
+    return [float(value)] * dim
+
+
+def open_cache(tmp_path, **kwargs):
+    return EmbeddingCache(MODEL, directory=str(tmp_path), **kwargs)
+
+
+def test_vectors_survive_a_reopen(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.put_many(["a", "b"], [vector(1), vector(2)])
+    cache.flush()
+    cache = open_cache(tmp_path)
+    a, b, c = cache.get_many(["a", "b", "c"])
+    assert a.tolist() == vector(1) and b.tolist() == vector(2) and c is None
+
+
+def test_pure_hits_do_not_rewrite_the_index(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.put_many(["a"], [vector(1)])
+    cache.flush()
+    cache = open_cache(tmp_path)
+    assert cache.get_many(["a"])[0] is not None
+    assert not cache._dirty
+
+
+def test_slot_reused_after_an_unclean_shutdown_is_a_miss(tmp_path):
+    cache = open_cache(tmp_path, max_entries=1)
+    cache.put_many(["a"], [vector(1)])
+    cache.flush()
+    # "b" evicts "a" and takes its slot, but the process dies before the index is written
+    open_cache(tmp_path, max_entries=1).put_many(["b"], [vector(2)])
+    cache = open_cache(tmp_path, max_entries=1)
+    assert cache.get_many(["a"]) == [None]
+    assert cache.counters["invalid"] == 1
+    assert len(cache) == 0
+
+
+def test_concurrent_writers_never_return_each_others_vectors(tmp_path):
+    first, second = open_cache(tmp_path), open_cache(tmp_path)
+    first.put_many(["a"], [vector(1)])
+    first.flush()
+    # The second process does not know "a" and hands its slot to "b"
+    second.put_many(["b"], [vector(2)])
+    second.flush()
+    assert first.get_many(["a"]) == [None]
+    assert second.get_many(["b"])[0].tolist() == vector(2)
+    # The index left on disk is the second writer's and matches the slots
+    cache = open_cache(tmp_path)
+    assert cache.get_many(["a", "b"])[1].tolist() == vector(2)
+
+
+def test_growing_never_shrinks_another_writers_files(tmp_path):
+    small, big = open_cache(tmp_path), open_cache(tmp_path)
+    big.put_many([f"k{i}" for i in range(1500)], [vector(i) for i in range(1500)])
+    size = (tmp_path / MODEL / "vectors.bin").stat().st_size
+    # The other process maps its first 1024 slots
+    small.put_many(["a"], [vector(-1)])
+    assert (tmp_path / MODEL / "vectors.bin").stat().st_size == size
+    assert big.get_many(["k1499"])[0].tolist() == vector(1499)
+
+
+def test_indexes_without_slot_tags_are_not_read(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.put_many(["a"], [vector(1)])
+    cache.flush()
+    index = tmp_path / MODEL / "index.json"
+    meta = json.loads(index.read_text())
+    meta["version"] = 1
+    index.write_text(json.dumps(meta))
+    assert len(open_cache(tmp_path)) == 0
+
+
+def test_float16_round_trip(tmp_path):
+    cache = open_cache(tmp_path, dtype="float16")
+    cache.put_many(["a"], [[0.5, 0.25, 1.0, 2.0]])
+    assert np.allclose(cache.get_many(["a"])[0], [0.5, 0.25, 1.0, 2.0])
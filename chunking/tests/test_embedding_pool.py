@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+import embedding_pool
+from embedding_backends import HashingEmbeddings
+from embedding_pool import EmbeddingModelRegistry, SharedEmbeddings
+
+DIM = 16
+reference = HashingEmbeddings(DIM)
+
+
+class GatedHashing(HashingEmbeddings):
+    """Records each encode call; the first embed_documents waits until release is set."""
+    def __init__(self):
+        super().__init__(DIM)
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(("documents", list(texts)))
+        if len(self.calls) == 1:
+            self.started.set()
+            self.release.wait(5)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls.append(("query", [text]))
+        return super().embed_query(text)
+
+
+@pytest.fixture
+def shared(monkeypatch):
+    loads = []
+
+    def create_backend(backend, config):
+        loads.append(backend)
+        # Widens the window in which concurrent first callers could load twice
+        time.sleep(0.05)
+        return model
+
+    model = GatedHashing()
+    monkeypatch.setattr(embedding_pool, "create_backend", create_backend)
+    embeddings = SharedEmbeddings("test-model", batch_size=8, backend="hashing")
+    embeddings.loads = loads
+    embeddings.model = model
+    yield embeddings
+    model.release.set()
+    embeddings.close()
+
+
+def run_threads(targets):
+    results = [None] * len(targets)
+
+    def call(i, target):
+        results[i] = target()
+
+    threads = [threading.Thread(target=call, args=(i, target)) for i, target in enumerate(targets)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_first_callers_share_one_model_load(shared):
+    shared.model.release.set()
+    texts = [[f"text {i} {j}" for j in range(3)] for i in range(8)]
+    threads, results = run_threads([lambda t=t: shared.embed_documents(t) for t in texts])
+    for thread in threads:
+        thread.join(5)
+    assert shared.loads == ["hashing"]
+    assert results == [reference.embed_documents(t) for t in texts]
+
+
+def test_registry_hands_out_one_instance_per_model():
+    registry = EmbeddingModelRegistry()
+    assert registry.get("m", "cpu", backend="hashing") is registry.get("m", "cpu", backend="hashing")
+    assert registry.get("m", "cpu", backend="hashing") is not registry.get("m", "cuda", backend="hashing")
+    registry.close_all()
+
+
+def test_waiting_requests_are_batched_and_answered_in_order(shared):
+    first = run_threads([lambda: shared.embed_documents(["blocking request"])])
+    assert shared.model.started.wait(5)
+    # Queued while the worker is busy: documents are coalesced up to batch_size, the query waits its turn
+    requests = [["a b", "c"], ["d"], ["e f g", "h", "i"], ["j", "k", "l"]]
+    threads, results = run_threads([lambda r=r: shared.embed_documents(r) for r in requests])
+    deadline = time.monotonic() + 5
+    while shared._queue.qsize() < len(requests) and time.monotonic() < deadline:
+        time.sleep(0.005)
+    query_threads, query = run_threads([lambda: shared.embed_query("what is d")])
+    while shared._queue.qsize() < len(requests) + 1 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    shared.model.release.set()
+    for thread in first[0] + threads + query_threads:
+        thread.join(5)
+
+    assert results == [reference.embed_documents(r) for r in requests]
+    assert query == [reference.embed_query("what is d")]
+    kinds = [(kind, len(texts)) for kind, texts in shared.model.calls]
+    # Threads enqueue in any order, but each batch stops once it holds batch_size texts
+    assert kinds[0] == ("documents", 1)
+    document_batches = [size for kind, size in kinds[1:] if kind == "documents"]
+    assert sum(document_batches) == 9 and len(document_batches) < len(requests)
+    assert kinds.count(("query", 1)) == 1
+    assert shared.stats()["requests"] == len(requests) + 2
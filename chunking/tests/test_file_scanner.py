@@ -0,0 +1,52 @@
+import os
+
+from file_scanner import (BUILD_OUTPUT_EXCLUDES, VCS_AND_CACHE_EXCLUDES, has_extension, is_excluded,
+                          scan_dirs, scan_files)
+
+
+def make_tree(root, paths):
+    for path in paths:
+        full = root / path
+        full.parent.mkdir(parents=True, exist_ok=True)
+        full.write_text("x = 1\n", encoding="utf-8")
+
+
+def relative(root, paths):
+    return sorted(os.path.relpath(p, root).replace(os.sep, "/") for p in paths)
+
+
+def test_build_output_dirs_are_scanned_unless_excluded(tmp_path):
+    make_tree(tmp_path, ["src/a.py", "build/b.py", "out/c.py", ".git/d.py", "node_modules/e.py"])
+    found = relative(tmp_path, (f.path for f in scan_files(str(tmp_path), [".py"], excludes=VCS_AND_CACHE_EXCLUDES)))
+    assert found == ["build/b.py", "out/c.py", "src/a.py"]
+
+    excludes = VCS_AND_CACHE_EXCLUDES + BUILD_OUTPUT_EXCLUDES
+    found = relative(tmp_path, (f.path for f in scan_files(str(tmp_path), [".py"], excludes=excludes)))
+    assert found == ["src/a.py"]
+    assert is_excluded(str(tmp_path), str(tmp_path / "build" / "b.py"), excludes)
+    assert not is_excluded(str(tmp_path), str(tmp_path / "build" / "b.py"), VCS_AND_CACHE_EXCLUDES)
+
+
+def test_extension_case_is_significant_unless_ignored(tmp_path):
+    make_tree(tmp_path, ["a.py", "B.PY", "c.Py", "d.d.ts"])
+    found = relative(tmp_path, (f.path for f in scan_files(str(tmp_path), [".py", "d.ts"], ignore_case=False)))
+    assert found == ["a.py", "d.d.ts"]
+    found = relative(tmp_path, (f.path for f in scan_files(str(tmp_path), [".py"], ignore_case=True)))
+    assert found == ["B.PY", "a.py", "c.Py"]
+    assert not has_extension("Main.PY", [".py"], ignore_case=False)
+    assert has_extension("Main.PY", [".py"], ignore_case=True)
+
+
+def test_gitignore_rules_and_negation(tmp_path):
+    make_tree(tmp_path, ["keep.py", "gen/skip.py", "gen/keep_me.py", "pkg/tmp_x.py"])
+    (tmp_path / ".gitignore").write_text("gen/*\n!gen/keep_me.py\ntmp_*.py\n", encoding="utf-8")
+    found = relative(tmp_path, (f.path for f in scan_files(str(tmp_path), [".py"], excludes=())))
+    assert found == ["gen/keep_me.py", "keep.py"]
+    assert relative(tmp_path, scan_dirs(str(tmp_path), excludes=())) == ["gen", "pkg"]
+
+
+def test_max_depth_and_size(tmp_path):
+    make_tree(tmp_path, ["a.py", "one/b.py", "one/two/c.py"])
+    (tmp_path / "big.py").write_text("x" * 1000, encoding="utf-8")
+    found = relative(tmp_path, (f.path for f in scan_files(str(tmp_path), [".py"], max_depth=1, max_size=100)))
+    assert found == ["a.py", "one/b.py"]
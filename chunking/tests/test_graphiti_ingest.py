@@ -0,0 +1,148 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from graphiti_core.errors import NodeNotFoundError
+from graphiti_core.nodes import EpisodeType
+from graphiti_core.utils.bulk_utils import RawEpisode
+
+import graphiti_ingest
+from graphiti_client import GraphitiClientManager
+from graphiti_ingest import BatchIngestor, IngestConfig, _percentile
+from run_metrics import RunMetrics
+
+real_sleep = asyncio.sleep
+
+
+class FlakyGraphiti:
+    """
+    Stand-in client: a batch fails while failures[first episode name] is positive (-1
+    fails forever), optionally after sleeping delay seconds; tracks calls in flight.
+    """
+    def __init__(self, failures=None, delay=0.0):
+        self.failures = dict(failures or {})
+        self.delay = delay
+        self.calls = []
+        self.in_flight = self.max_in_flight = 0
+        self.episodes = {}
+
+    async def add_episode_bulk(self, episodes):
+        name = episodes[0].name
+        self.calls.append(name)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await real_sleep(self.delay)
+            if self.failures.get(name, 0):
+                self.failures[name] -= 1
+                raise ConnectionError(f"{name} refused")
+        finally:
+            self.in_flight -= 1
+        nodes = [SimpleNamespace(uuid=str(uuid.uuid4())) for _ in episodes]
+        self.episodes.update((node.uuid, episode) for node, episode in zip(nodes, episodes))
+        return SimpleNamespace(episodes=nodes)
+
+    async def remove_episode(self, episode_uuid):
+        if episode_uuid not in self.episodes:
+            raise NodeNotFoundError(episode_uuid)
+        del self.episodes[episode_uuid]
+
+
+def items(count, per_source=2):
+    return [(f"/src/f{i // per_source}.py", RawEpisode(
+        name=f"e{i}", content=f"chunk {i}", source_description="test", source=EpisodeType.text,
+        reference_time=datetime.now(timezone.utc))) for i in range(count)]
+
+
+@pytest.fixture
+def make_ingestor():
+    managers = []
+
+    def make(client, **config):
+        async def factory(graphiti_config):
+            return client
+
+        manager = GraphitiClientManager(client_factory=factory, health_interval=0)
+        managers.append(manager)
+        config = {"batch_size": 2, "concurrency": 2, "retries": 2, "backoff": 0.0, **config}
+        return BatchIngestor(RunMetrics("test", verbose=False, progress=False), IngestConfig(**config), manager)
+
+    yield make
+    for manager in managers:
+        manager.close()
+
+
+def test_batches_succeed_after_retries(make_ingestor):
+    client = FlakyGraphiti(failures={"e2": 2})
+    ingestor = make_ingestor(client)
+    report = ingestor.ingest(items(6))
+    assert report.ok and report.batches == 3
+    assert client.calls.count("e2") == 3
+    assert set(report.uuids) == {f"e{i}" for i in range(6)}
+    assert ingestor.metrics.counters["ingest_retries"] == 2
+    assert ingestor.metrics.counters["episodes_ingested"] == 6
+
+
+def test_exhausted_retries_fail_only_their_batch(make_ingestor):
+    client = FlakyGraphiti(failures={"e2": -1})
+    ingestor = make_ingestor(client)
+    report = ingestor.ingest(items(6))
+    failure, = report.failures
+    assert failure["batch"] == 1 and failure["attempts"] == 3
+    assert failure["sources"] == ["/src/f1.py"] and "ConnectionError" in failure["error"]
+    assert report.failed_sources == {"/src/f1.py"}
+    assert "e2" not in report.uuids and {"e0", "e5"} <= set(report.uuids)
+    assert ingestor.metrics.extra["ingest_failures"] == [failure]
+
+
+def test_missing_episodes_count_as_removed(make_ingestor):
+    client = FlakyGraphiti()
+    ingestor = make_ingestor(client)
+    added = ingestor.ingest(items(2)).uuids
+    report = ingestor.remove([("/src/f0.py", added["e0"]), ("/src/f0.py", "never-added")])
+    assert report.ok
+    assert ingestor.metrics.counters["episodes_removed"] == 2
+    assert list(client.episodes) == [added["e1"]]
+
+
+def test_batches_in_flight_are_bounded(make_ingestor):
+    client = FlakyGraphiti(delay=0.02)
+    report = make_ingestor(client, batch_size=1, concurrency=3).ingest(items(12))
+    assert report.ok and len(client.calls) == 12
+    assert client.max_in_flight == 3
+
+
+def test_a_slow_call_times_out_as_a_failed_attempt(make_ingestor):
+    client = FlakyGraphiti(delay=1.0)
+    report = make_ingestor(client, retries=1, timeout=0.05).ingest(items(2))
+    failure, = report.failures
+    assert failure["attempts"] == 2 and failure["error"].startswith("TimeoutError")
+
+
+def test_backoff_doubles_up_to_its_cap(make_ingestor, monkeypatch):
+    delays = []
+
+    async def record_sleep(delay):
+        delays.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(graphiti_ingest.asyncio, "sleep", record_sleep)
+    monkeypatch.setattr(graphiti_ingest.random, "uniform", lambda low, high: high)
+    client = FlakyGraphiti(failures={"e0": -1})
+    make_ingestor(client, retries=5, backoff=1.0, backoff_max=5.0).ingest(items(2))
+    assert delays == [1.0, 2.0, 4.0, 5.0, 5.0]
+
+
+def test_stats_report_batch_latency_percentiles(make_ingestor):
+    ingestor = make_ingestor(FlakyGraphiti(delay=0.01), batch_size=1)
+    ingestor.ingest(items(5))
+    stats = ingestor.metrics.extra["ingest"]
+    assert stats["batches_ok"] == 5 and stats["batches_failed"] == 0
+    assert 10 <= stats["batch_latency_p50_ms"] <= stats["batch_latency_p95_ms"] <= stats["batch_latency_max_ms"]
+    assert stats["episodes_per_second"] > 0
+
+    assert _percentile([], 0.95) is None
+    assert _percentile(list(range(1, 21)), 0.95) == 19
+    assert _percentile(list(range(1, 21)), 0.5) == 11
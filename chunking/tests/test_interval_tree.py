@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from interval_tree import IntervalTree
+from symbol_table import SymbolTable
+
+
+def brute_force(intervals, start, end):
+    ordered = sorted(intervals, key=lambda item: (item[0], item[1]))
+    return [value for s, e, value in ordered if s <= end and e >= start]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_overlapping_matches_a_linear_scan(seed):
+    rng = random.Random(seed)
+    intervals = []
+    for i in range(rng.randint(0, 60)):
+        start = rng.randint(1, 100)
+        intervals.append((start, start + rng.randint(0, 30), i))
+    tree = IntervalTree(intervals)
+    assert len(tree) == len(intervals)
+    for _ in range(50):
+        start = rng.randint(-5, 135)
+        end = start + rng.randint(0, 20)
+        assert tree.overlapping(start, end) == brute_force(intervals, start, end)
+
+
+def test_closed_interval_boundaries():
+    tree = IntervalTree([(5, 10, "a"), (10, 10, "point"), (11, 15, "b")])
+    assert tree.overlapping(1, 4) == []
+    assert tree.overlapping(1, 5) == ["a"]
+    assert tree.overlapping(10, 10) == ["a", "point"]
+    assert tree.overlapping(15, 20) == ["b"]
+    assert tree.overlapping(16, 20) == []
+    assert IntervalTree([]).overlapping(0, 100) == []
+
+
+SPANS = [
+    {"name": "Service", "kind": "class", "start_line": 1, "end_line": 30, "dependencies": ["logging", "os"]},
+    {"name": "Service.load", "kind": "method", "start_line": 5, "end_line": 15, "dependencies": ["os"]},
+    {"name": "Service.load.parse", "kind": "function", "start_line": 8, "end_line": 10, "dependencies": ["json"]},
+    {"name": "Service.save", "kind": "method", "start_line": 16, "end_line": 30, "dependencies": ["logging"]},
+    {"name": "main", "kind": "function", "start_line": 33, "end_line": 40, "dependencies": []},
+]
+
+
+def brute_force_span(start, end):
+    symbols = [s for s in SPANS if s["start_line"] <= end and s["end_line"] >= start]
+    if not symbols:
+        return None, []
+
+    def rank(s):
+        overlap = min(end, s["end_line"]) - max(start, s["start_line"]) + 1
+        return overlap, s["start_line"] - s["end_line"]
+
+    innermost = [s for s in symbols if not any(o["name"].startswith(s["name"] + ".") for o in symbols)]
+    return max(symbols, key=rank)["name"], sorted({d for s in innermost for d in s["dependencies"]})
+
+
+def test_resolve_span_matches_a_linear_scan():
+    table = SymbolTable()
+    table.set_file("svc.py", SPANS)
+    for start in range(0, 42):
+        for end in range(start, 42):
+            symbol, dependencies = table.resolve_span("svc.py", start, end)
+            assert ((symbol.name if symbol else None), dependencies) == brute_force_span(start, end), (start, end)
+
+
+def test_nested_spans_resolve_to_the_innermost_symbol():
+    table = SymbolTable()
+    table.set_file("svc.py", SPANS)
+    assert table.resolve_span("svc.py", 8, 10)[0].name == "Service.load.parse"
+    # Dependencies come from the innermost symbols only
+    assert table.resolve_span("svc.py", 6, 12) == (table.get("svc.py::Service.load"), ["json"])
+    # Equal coverage goes to the innermost symbol, a span straddling two methods to their class
+    assert table.resolve_span("svc.py", 16, 20)[0].name == "Service.save"
+    assert table.resolve_span("svc.py", 14, 20)[0].name == "Service"
+    assert table.resolve_span("svc.py", 2, 4) == (table.get("svc.py::Service"), ["logging", "os"])
+    assert table.resolve_span("svc.py", 31, 32) == (None, [])
+    assert table.resolve_span("svc.py", 41, 50) == (None, [])
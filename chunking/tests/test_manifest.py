@@ -0,0 +1,152 @@
+import os
+
+from manifest import IngestManifest, manifest_path
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def new_manifest(root, state):
+    return IngestManifest(str(root), str(state / "manifest.json"))
+
+
+def ingest(manifest, diff):
+    manifest.apply(diff.updates, diff.deleted)
+    manifest.save()
+
+
+def test_diff_detects_new_changed_and_touched_files(tmp_path):
+    root = tmp_path / "corpus"
+    a = write(root / "a.py", "a = 1\n")
+    b = write(root / "b.py", "b = 1\n")
+    manifest = new_manifest(root, tmp_path)
+    diff = manifest.diff([a, b])
+    assert diff.changed == [a, b]
+    ingest(manifest, diff)
+
+    write(root / "a.py", "a = 2\n")
+    # Touched: new mtime, same content
+    os.utime(b, (os.stat(b).st_atime, os.stat(b).st_mtime + 10))
+    diff = new_manifest(root, tmp_path).diff([a, b])
+    assert diff.changed == [a]
+    assert diff.unchanged == [b]
+    assert set(diff.updates) == {a, b}
+
+
+def test_force_reports_every_file_as_changed(tmp_path):
+    root = tmp_path / "corpus"
+    a = write(root / "a.py", "a = 1\n")
+    manifest = new_manifest(root, tmp_path)
+    ingest(manifest, manifest.diff([a]))
+    assert manifest.diff([a], force=True).changed == [a]
+
+
+def test_tombstone_is_reported_once_without_a_retractor(tmp_path):
+    root = tmp_path / "corpus"
+    a = write(root / "a.py", "a = 1\n")
+    b = write(root / "b.py", "b = 1\n")
+    manifest = new_manifest(root, tmp_path)
+    ingest(manifest, manifest.diff([a, b]))
+    os.remove(b)
+
+    diff = manifest.diff([a])
+    assert diff.deleted == [b]
+    ingest(manifest, diff)
+    assert manifest.pending_tombstones() == [b]
+
+    # Nothing retracts tombstones here, so the unchanged tree must short-circuit
+    diff = new_manifest(root, tmp_path).diff([a])
+    assert not diff.changed and not diff.deleted and not diff.updates
+
+
+def test_pending_tombstone_is_reported_until_retracted(tmp_path):
+    root = tmp_path / "corpus"
+    a = write(root / "a.py", "a = 1\n")
+    b = write(root / "b.py", "b = 1\n")
+    manifest = new_manifest(root, tmp_path)
+    ingest(manifest, manifest.diff([a, b]))
+    os.remove(b)
+    ingest(manifest, manifest.diff([a], retract_pending=True))
+
+    # The retraction failed: the tombstone stays pending and is reported again
+    manifest = new_manifest(root, tmp_path)
+    assert manifest.diff([a], retract_pending=True).deleted == [b]
+
+    manifest.mark_retracted([b])
+    manifest.save()
+    manifest = new_manifest(root, tmp_path)
+    assert manifest.pending_tombstones() == []
+    diff = manifest.diff([a], retract_pending=True)
+    assert not diff.changed and not diff.deleted and not diff.updates
+
+
+def test_recreated_file_replaces_its_tombstone(tmp_path):
+    root = tmp_path / "corpus"
+    a = write(root / "a.py", "a = 1\n")
+    manifest = new_manifest(root, tmp_path)
+    ingest(manifest, manifest.diff([a]))
+    os.remove(a)
+    ingest(manifest, manifest.diff([]))
+    write(root / "a.py", "a = 1\n")
+    diff = manifest.diff([a])
+    assert diff.changed == [a]
+    ingest(manifest, diff)
+    assert manifest.pending_tombstones() == []
+
+
+def test_keys_do_not_depend_on_how_paths_are_written(tmp_path, monkeypatch):
+    root = tmp_path / "corpus"
+    write(root / "pkg" / "a.py", "a = 1\n")
+    manifest = new_manifest(root, tmp_path)
+    ingest(manifest, manifest.diff([str(root / "pkg" / "a.py")]))
+    assert list(manifest.entries) == ["pkg/a.py"]
+
+    monkeypatch.chdir(tmp_path)
+    relative = IngestManifest("corpus", str(tmp_path / "manifest.json"))
+    diff = relative.diff([os.path.join("corpus", "pkg", "..", "pkg", "a.py")])
+    assert diff.changed == [] and len(diff.unchanged) == 1 and diff.deleted == []
+
+    link = tmp_path / "link"
+    link.symlink_to(root, target_is_directory=True)
+    linked = IngestManifest(str(link), str(tmp_path / "manifest.json"))
+    assert linked.diff([str(link / "pkg" / "a.py")]).unchanged == [str(link / "pkg" / "a.py")]
+
+
+def test_deleted_paths_are_joined_to_the_root_as_given(tmp_path, monkeypatch):
+    root = tmp_path / "corpus"
+    a = write(root / "a.py", "a = 1\n")
+    manifest = new_manifest(root, tmp_path)
+    ingest(manifest, manifest.diff([a]))
+    os.remove(a)
+    monkeypatch.chdir(tmp_path)
+    assert IngestManifest("corpus", str(tmp_path / "manifest.json")).diff([]).deleted == [os.path.join("corpus", "a.py")]
+
+
+def test_watch_mode_only_considers_the_removed_paths(tmp_path):
+    root = tmp_path / "corpus"
+    a = write(root / "a.py", "a = 1\n")
+    b = write(root / "b.py", "b = 1\n")
+    manifest = new_manifest(root, tmp_path)
+    ingest(manifest, manifest.diff([a, b]))
+    os.remove(b)
+    assert manifest.diff([], removed=[]).deleted == []
+    assert manifest.diff([], removed=[b]).deleted == [b]
+
+
+def test_each_root_has_its_own_manifest(tmp_path, monkeypatch):
+    first, second = tmp_path / "first", tmp_path / "second"
+    write(first / "a.py", "a = 1\n")
+    write(second / "a.py", "a = 2\n")
+    assert manifest_path(str(first)) != manifest_path(str(second))
+    monkeypatch.chdir(tmp_path)
+    assert manifest_path("first") == manifest_path(str(first))
+
+    directory = tmp_path / "state"
+    one = IngestManifest(str(first), manifest_path(str(first), str(directory)))
+    ingest(one, one.diff([str(first / "a.py")]))
+    other = IngestManifest(str(second), manifest_path(str(second), str(directory)))
+    diff = other.diff([str(second / "a.py")])
+    assert diff.changed == [str(second / "a.py")] and diff.deleted == []
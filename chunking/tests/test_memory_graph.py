@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from graphiti_core.errors import NodeNotFoundError
+from graphiti_core.nodes import EpisodeType
+from graphiti_core.utils.bulk_utils import RawEpisode
+
+from embedding_backends import HashingEmbeddings
+from memory_graph import InMemoryGraphiti
+
+NOW = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def episode(name, content, uuid=None):
+    return RawEpisode(name=name, uuid=uuid, content=content, source_description="src.py",
+                      source=EpisodeType.text, reference_time=NOW)
+
+
+@pytest.fixture
+def graph():
+    return InMemoryGraphiti(embeddings=HashingEmbeddings(64))
+
+
+def test_bulk_add_assigns_fresh_uuids_in_input_order(graph):
+    results = asyncio.run(graph.add_episode_bulk([episode("a", "alpha beta"), episode("b", "gamma delta")]))
+    assert [node.name for node in results.episodes] == ["a", "b"]
+    uuids = [node.uuid for node in results.episodes]
+    assert len(set(uuids)) == 2 and set(graph.edges) == set(uuids)
+    # Sending the same episode again creates a second one, as in Graphiti
+    again = asyncio.run(graph.add_episode_bulk([episode("a", "alpha beta")]))
+    assert again.episodes[0].uuid not in uuids
+    assert len(graph.episodes) == 3
+
+
+def test_unknown_uuid_raises_and_adds_nothing(graph):
+    with pytest.raises(NodeNotFoundError):
+        asyncio.run(graph.add_episode_bulk([episode("a", "alpha"), episode("b", "beta", uuid="missing")]))
+    assert graph.episodes == {} and graph.edges == {}
+
+
+def test_known_uuid_reprocesses_the_stored_episode(graph):
+    stored = asyncio.run(graph.add_episode_bulk([episode("a", "alpha")])).episodes[0]
+    results = asyncio.run(graph.add_episode_bulk([episode("a", "changed text", uuid=stored.uuid)]))
+    assert results.episodes[0].uuid == stored.uuid
+    assert graph.edges[stored.uuid].fact == "alpha"
+    assert len(graph.episodes) == 1
+
+
+def test_add_episode_and_remove_episode(graph):
+    results = asyncio.run(graph.add_episode(name="chat", episode_body="hello world", source_description="bot",
+                                            reference_time=NOW))
+    uuid = results.episode.uuid
+    assert [edge.fact for edge in results.edges] == ["hello world"]
+    assert [edge.fact for edge in asyncio.run(graph.search("hello"))] == ["hello world"]
+    asyncio.run(graph.remove_episode(uuid))
+    assert graph.episodes == {} and asyncio.run(graph.search("hello")) == []
+    with pytest.raises(NodeNotFoundError):
+        asyncio.run(graph.remove_episode(uuid))
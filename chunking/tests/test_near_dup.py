@@ -0,0 +1,33 @@
+from near_dup import NearDuplicateIndex
+
+BASE = "".join(f"line {i}: the quick brown fox jumps over the lazy dog\n" for i in range(40))
+
+
+def test_near_duplicate_joins_the_first_file_as_representative():
+    index = NearDuplicateIndex()
+    assert index.add("a", BASE) == (None, 0.0)
+    representative, score = index.add("b", BASE.replace("line 3:", "line three:"))
+    assert representative == "a" and score >= index.threshold
+    assert index.duplicate_clusters() == {"a": ["b"]}
+    assert index.add("c", "something entirely different " * 20) == (None, 0.0)
+
+
+def test_promote_moves_a_member_into_its_own_cluster():
+    index = NearDuplicateIndex()
+    index.add("a", BASE)
+    edited = BASE.replace("line 3:", "line three:")
+    index.add("b", edited)
+    index.promote("b", edited)
+    assert index.duplicate_clusters() == {}
+    assert "b" not in index.representative_of
+    # Later files are compared against the promoted file as well
+    assert index.add("c", edited)[0] in {"a", "b"}
+    assert sum(len(members) for members in index.clusters.values()) == 1
+
+
+def test_promote_ignores_representatives_and_unknown_keys():
+    index = NearDuplicateIndex()
+    index.add("a", BASE)
+    index.promote("a", BASE)
+    index.promote("missing", BASE)
+    assert index.clusters == {"a": []}
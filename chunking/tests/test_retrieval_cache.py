@@ -0,0 +1,139 @@
+import asyncio
+import time
+
+import pytest
+
+import retrieval_cache
+from graphiti_client import GraphitiClientManager
+from retrieval_cache import RetrievalCache, normalize_query
+
+
+class SlowSearch:
+    """Graphiti stand-in whose search takes delay seconds and records every call."""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    async def search(self, query, center_node_uuid=None, num_results=10):
+        self.calls.append(query)
+        await asyncio.sleep(self.delay)
+        return [f"{query}:{len(self.calls)}"]
+
+
+@pytest.fixture
+def client():
+    return SlowSearch()
+
+
+@pytest.fixture
+def manager(client):
+    async def factory(config):
+        return client
+
+    manager = GraphitiClientManager(client_factory=factory, health_interval=0)
+    yield manager
+    manager.close()
+
+
+def search(cache, manager, query, **kwargs):
+    return asyncio.run(cache.search(manager, query, **kwargs))
+
+
+def test_normalize_query_folds_width_case_and_whitespace():
+    assert normalize_query("  Ｈｅｌｌｏ\tWORLD \n") == "hello world"
+    assert RetrievalCache.key("A  b", None, 5) == RetrievalCache.key("a b", None, 5)
+    assert RetrievalCache.key("a b", None, 5) != RetrievalCache.key("a b", "node", 5)
+
+
+def test_repeated_query_is_served_from_the_cache(client, manager):
+    cache = RetrievalCache(max_entries=8, ttl=60)
+    first = search(cache, manager, "Payment retries")
+    assert search(cache, manager, "payment   RETRIES") == first
+    assert client.calls == ["Payment retries"]
+    # Different num_results is a different entry
+    search(cache, manager, "payment retries", num_results=3)
+    assert len(client.calls) == 2
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 2, 2)
+
+
+def test_entries_expire_after_the_ttl(client, manager):
+    cache = RetrievalCache(max_entries=8, ttl=0.05)
+    search(cache, manager, "q")
+    time.sleep(0.06)
+    search(cache, manager, "q")
+    assert len(client.calls) == 2
+    assert cache.stats()["expired"] == 1
+
+
+def test_least_recently_used_entry_is_evicted(client, manager):
+    cache = RetrievalCache(max_entries=2, ttl=60)
+    for query in ("a", "b", "a", "c"):
+        search(cache, manager, query)
+    assert client.calls == ["a", "b", "c"]
+    search(cache, manager, "a")
+    search(cache, manager, "b")
+    assert client.calls == ["a", "b", "c", "b"]
+    assert cache.stats()["evicted"] == 2
+
+
+def test_concurrent_identical_searches_share_one_call(client, manager):
+    client.delay = 0.05
+    cache = RetrievalCache(max_entries=8, ttl=60)
+
+    async def three():
+        return await asyncio.gather(*(cache.search(manager, query) for query in ("q", "Q", " q ")))
+
+    results = asyncio.run(three())
+    assert len(client.calls) == 1
+    assert results[0] == results[1] == results[2]
+    assert cache.stats()["coalesced"] == 2
+
+
+def test_invalidation_drops_entries_and_in_flight_results(client, manager):
+    cache = RetrievalCache(max_entries=8, ttl=60)
+    search(cache, manager, "q")
+    cache.invalidate()
+    assert cache.stats()["size"] == 0
+
+    client.delay = 0.05
+
+    async def invalidated_meanwhile():
+        task = asyncio.ensure_future(cache.search(manager, "slow"))
+        await asyncio.sleep(0.01)
+        cache.invalidate()
+        return await task
+
+    assert asyncio.run(invalidated_meanwhile()) == ["slow:2"]
+    assert cache.get(RetrievalCache.key("slow", None, 10)) is None
+
+
+def test_disabled_cache_always_searches(client, manager):
+    cache = RetrievalCache(max_entries=0, ttl=60)
+    search(cache, manager, "q")
+    search(cache, manager, "q")
+    assert len(client.calls) == 2 and cache.stats()["enabled"] is False
+
+
+def test_failed_search_is_not_cached(client, manager):
+    cache = RetrievalCache(max_entries=8, ttl=60)
+
+    async def failing(query, **kwargs):
+        client.calls.append(query)
+        raise ConnectionError("neo4j down")
+
+    client.search = failing
+    with pytest.raises(ConnectionError):
+        search(cache, manager, "q")
+    with pytest.raises(ConnectionError):
+        search(cache, manager, "q")
+    assert len(client.calls) == 2
+
+
+def test_module_invalidation_reaches_the_shared_cache(monkeypatch):
+    cache = RetrievalCache(max_entries=8, ttl=60)
+    monkeypatch.setattr(retrieval_cache, "_cache", cache)
+    cache._put(RetrievalCache.key("q", None, 10), ["fact"], 0.1, generation=0)
+    retrieval_cache.invalidate_retrieval_cache()
+    assert cache.get(RetrievalCache.key("q", None, 10)) is None
+    assert retrieval_cache.get_retrieval_cache() is cache
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import run_lock
+from run_lock import RunLock
+from watcher import ChangeBatch, run_chunking_batch
+
+
+def test_a_second_run_is_refused_while_one_is_active(tmp_path):
+    path = str(tmp_path / "run.lock")
+    with RunLock(path):
+        assert not RunLock(path).acquire(blocking=False)
+    lock = RunLock(path)
+    assert lock.acquire(blocking=False)
+    lock.release()
+
+
+def test_the_lock_is_shared_with_other_processes(tmp_path):
+    path = str(tmp_path / "run.lock")
+    holder = subprocess.Popen(
+        [sys.executable, "-c", "import sys, time\nfrom run_lock import RunLock\n"
+         f"with RunLock({path!r}):\n    print('held', flush=True)\n    time.sleep(30)"],
+        stdout=subprocess.PIPE, text=True,
+        env={**os.environ, "PYTHONPATH": os.path.dirname(run_lock.__file__)})
+    try:
+        assert holder.stdout.readline().strip() == "held"
+        assert not RunLock(path).acquire(blocking=False)
+    finally:
+        holder.kill()
+        holder.wait()
+    # The kernel drops the lock of a dead process
+    lock = RunLock(path)
+    assert lock.acquire(blocking=False)
+    lock.release()
+
+
+def test_watcher_batches_wait_for_the_active_run(tmp_path, monkeypatch):
+    path = str(tmp_path / "run.lock")
+    monkeypatch.setattr(RunLock.__init__, "__defaults__", (path,))
+    events = []
+
+    class App:
+        def invoke(self, state):
+            events.append(("invoke", state["changed_paths"]))
+
+    active = RunLock(path)
+    active.acquire()
+    worker = threading.Thread(target=run_chunking_batch, args=(App(), "docs", ChangeBatch(["docs/a.py"])))
+    worker.start()
+    time.sleep(0.1)
+    assert events == []
+    events.append(("released", None))
+    active.release()
+    worker.join(5)
+    assert events == [("released", None), ("invoke", ["docs/a.py"])]
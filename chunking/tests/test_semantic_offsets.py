@@ -0,0 +1,83 @@
+from langchain_core.documents import Document
+
+import chuncking
+from run_metrics import RunMetrics
+from semantic_batch import BatchedSemanticSplitter, locate_sub_chunks
+
+PARENT_TEXT = "First one.  Second one?\nThird one!\n\n   Fourth one. Fifth."
+
+
+def parent(text=PARENT_TEXT, start_index=100, start_line=7):
+    return Document(page_content=text, metadata={
+        "source": "/src/a.md", "start_index": start_index, "end_index": start_index + len(text),
+        "start_line": start_line, "end_line": start_line + text.count("\n")})
+
+
+def test_sub_chunks_get_their_own_offsets_and_lines():
+    doc = parent()
+    subs = locate_sub_chunks(doc, ["First one. Second one?", "Third one!", "Fourth one. Fifth."])
+    spans = [(sub.metadata["start_index"], sub.metadata["end_index"]) for sub in subs]
+    assert [PARENT_TEXT[start - 100:end - 100] for start, end in spans] == [
+        "First one.  Second one?", "Third one!", "Fourth one. Fifth."]
+    assert [(sub.metadata["start_line"], sub.metadata["end_line"]) for sub in subs] == [(7, 7), (8, 8), (10, 10)]
+    assert all(sub.metadata["source"] == "/src/a.md" for sub in subs)
+    # The parent keeps its own metadata
+    assert doc.metadata["start_index"] == 100
+
+
+def test_repeated_sub_chunks_are_located_in_order():
+    text = "Same. Other.\nSame. Other."
+    subs = locate_sub_chunks(parent(text, 0, 0), ["Same. Other.", "Same. Other."])
+    assert [sub.metadata["start_index"] for sub in subs] == [0, 13]
+    assert [sub.metadata["start_line"] for sub in subs] == [0, 1]
+
+
+def test_sub_chunk_that_cannot_be_found_keeps_the_parent_span():
+    sub, = locate_sub_chunks(parent(), ["Not in the parent."])
+    assert (sub.metadata["start_index"], sub.metadata["end_index"]) == (100, 100 + len(PARENT_TEXT))
+
+
+class TopicEmbeddings:
+    """Sentences about apples and about trains point in orthogonal directions."""
+    def embed_documents(self, texts):
+        return [[text.count("apple") + 0.01, text.count("train") + 0.01] for text in texts]
+
+
+def test_batched_splitter_sub_chunks_cover_their_own_spans():
+    text = "An apple a day. Apples are red.\nAnother apple. The train is late. A train runs.\nTrains are fast."
+    splitter = BatchedSemanticSplitter(TopicEmbeddings(), breakpoint_percentile=50)
+    subs, = splitter.split_documents([parent(text, 10, 2)])
+    assert len(subs) > 1
+    for sub in subs:
+        start, end = sub.metadata["start_index"] - 10, sub.metadata["end_index"] - 10
+        assert " ".join(text[start:end].split()) == sub.page_content
+        assert sub.metadata["start_line"] == 2 + text.count("\n", 0, start)
+    assert subs[0].metadata["start_index"] == 10
+
+
+def test_semantic_chunker_fallback_offsets(monkeypatch):
+    sentences = [f"Sentence number {i} about {'apple' if i < 40 else 'train'}." for i in range(80)]
+    text = "\n".join(sentences)
+    assert len(text) > 1500
+
+    class FakeChunker:
+        def __init__(self, embeddings, **kwargs):
+            pass
+
+        def split_text(self, value):
+            parts = value.split("\n")
+            return [" ".join(parts[:40]), " ".join(parts[40:])]
+
+    class WholeDocuments:
+        def split_documents(self, documents):
+            return documents
+
+    monkeypatch.setattr(chuncking, "SEMANTIC_BATCH", False)
+    monkeypatch.setattr(chuncking, "SemanticChunker", FakeChunker)
+    monkeypatch.setattr(chuncking, "get_registry", WholeDocuments)
+    monkeypatch.setattr(chuncking, "get_embeddings", lambda: type("E", (), {"loaded": True})())
+    monkeypatch.setattr(chuncking, "cached_embeddings", lambda embeddings: embeddings)
+    chunks = chuncking.split_into_chunks([parent(text, 500, 20)], RunMetrics("t", verbose=False))
+    assert [(c.metadata["start_line"], c.metadata["end_line"]) for c in chunks] == [(20, 59), (60, 99)]
+    assert [c.metadata["start_index"] for c in chunks] == [500, 500 + text.index("Sentence number 40 ")]
+    assert chunks[1].metadata["end_index"] == 500 + len(text)
@@ -0,0 +1,63 @@
+import functools
+import types
+
+import pytest
+
+import chuncking
+import streaming_reader
+from run_metrics import RunMetrics
+
+
+@pytest.fixture
+def big_file(tmp_path, monkeypatch):
+    """A source file above a lowered stream threshold, read in 400-character windows."""
+    monkeypatch.setattr(streaming_reader, "STREAM_THRESHOLD_BYTES", 1000)
+    monkeypatch.setattr(chuncking, "iter_text_windows",
+                        functools.partial(streaming_reader.iter_text_windows, window_chars=400, overlap_chars=50))
+    path = tmp_path / "big.py"
+    path.write_text("".join(f"def f{i}(x):\n    return x * {i}\n\n\n" for i in range(200)), encoding="utf-8")
+    return path
+
+
+def test_load_file_documents_yields_windows_lazily(big_file):
+    documents = chuncking.load_file_documents(str(big_file), big_file.stat().st_size, RunMetrics("t", verbose=False))
+    assert isinstance(documents, types.GeneratorType)
+    first = next(documents)
+    assert first.metadata["window"] == 0 and len(first.page_content) <= 400
+    assert sum(1 for _ in documents) > 5
+
+
+def test_streamed_chunks_have_file_absolute_offsets(big_file):
+    text = big_file.read_text(encoding="utf-8")
+    chunks = chuncking.chunk_streamed_file(str(big_file), big_file.stat().st_size, RunMetrics("t", verbose=False))
+    assert chunks
+    for chunk in chunks:
+        start, end = chunk.metadata["start_index"], chunk.metadata["end_index"]
+        assert text[start:end] == chunk.page_content
+        assert chunk.metadata["start_line"] == text.count("\n", 0, start)
+    assert "def f199(x):" in chunks[-1].page_content
+
+
+@pytest.mark.parametrize("checkpoints", [True, False])
+def test_batch_graph_defers_streamed_files_to_chunking(big_file, tmp_path, monkeypatch, checkpoints):
+    monkeypatch.setattr("checkpoints.CHECKPOINTS_ENABLED", checkpoints)
+    small = tmp_path / "small.py"
+    small.write_text("def g():\n    return 1\n", encoding="utf-8")
+    state = {"file_path": str(tmp_path), "incremental": False, "metrics": RunMetrics("t", verbose=False)}
+    state = chuncking.load_code_node(state)
+    assert state["streamed_files"] == [str(big_file)]
+    assert [doc.metadata["source"] for doc in state["documents"]] == [str(small)]
+
+    state = chuncking.chunk_code_node(state)
+    sources = {chunk.metadata["source"] for chunk in state["chunks"]}
+    assert sources == {str(big_file), str(small)}
+    assert (state["checkpoint"] is not None) == checkpoints
+    assert set(chuncking.changed_files(state)) == {str(big_file), str(small)}
+
+
+def test_unreadable_streamed_file_is_left_out_of_the_manifest(big_file, tmp_path):
+    big_file.write_bytes(b"\xff\xfe" * 1000)
+    state = {"file_path": str(tmp_path), "incremental": False, "metrics": RunMetrics("t", verbose=False)}
+    state = chuncking.chunk_code_node(chuncking.load_code_node(state))
+    assert state["chunks"] == []
+    assert str(big_file) not in state["manifest_updates"]
@@ -0,0 +1,44 @@
+import json
+import os
+
+from symbol_table import SymbolTable, symbol_table_path
+
+SPANS = [
+    {"name": "Parser", "kind": "class", "start_line": 1, "end_line": 20, "dependencies": ["re"]},
+    {"name": "Parser.parse", "kind": "method", "start_line": 5, "end_line": 12, "dependencies": ["tokenize"]},
+]
+
+
+def test_qualified_names_do_not_depend_on_how_the_root_is_spelled(tmp_path, monkeypatch):
+    (tmp_path / "docs" / "pkg").mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+    table = SymbolTable(root=str(tmp_path / "docs"))
+    table.set_file(str(tmp_path / "docs" / "pkg" / "a.py"), SPANS)
+    table.save()
+
+    table = SymbolTable.load("./docs")
+    assert table.files() == ["pkg/a.py"]
+    assert "pkg/a.py::Parser.parse" in table
+    assert table.find_in_file(os.path.join("docs", "pkg", "a.py"), "parse").qualified_name == "pkg/a.py::Parser.parse"
+    symbol, dependencies = table.resolve_span("docs/pkg/../pkg/a.py", 6, 8)
+    assert symbol.name == "Parser.parse" and dependencies == ["tokenize"]
+
+    table.remove_file(str(tmp_path / "docs" / "pkg" / "a.py"))
+    assert len(table) == 0
+
+
+def test_each_root_has_its_own_table(tmp_path):
+    first, second = str(tmp_path / "first"), str(tmp_path / "second")
+    assert symbol_table_path(first) != symbol_table_path(second)
+    table = SymbolTable(root=first)
+    table.set_file(os.path.join(first, "a.py"), SPANS)
+    table.save()
+    SymbolTable(root=second).save()
+    assert len(SymbolTable.load(first)) == 2
+    assert len(SymbolTable.load(second)) == 0
+
+
+def test_tables_keyed_by_spelled_paths_are_not_read(tmp_path):
+    path = tmp_path / "symbols.json"
+    path.write_text(json.dumps({"version": 1, "symbols": [{"path": "docs/a.py", **SPANS[0]}]}), encoding="utf-8")
+    assert len(SymbolTable.load(str(tmp_path), str(path))) == 0
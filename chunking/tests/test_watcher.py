@@ -0,0 +1,155 @@
+import sys
+import time
+
+import pytest
+
+import watcher
+from watcher import ChangeBatch, watch
+
+
+class ScriptedSource:
+    """Returns the scripted (changed, overflow) reads, then nothing."""
+    def __init__(self, reads):
+        self.reads = list(reads)
+        self.closed = False
+
+    def read(self, timeout):
+        if self.reads:
+            return self.reads.pop(0)
+        time.sleep(min(timeout or 0.0, 0.005))
+        return set(), False
+
+    def close(self):
+        self.closed = True
+
+
+def run_watch(monkeypatch, reads, on_batch, until, **kwargs):
+    source = ScriptedSource(reads)
+    monkeypatch.setattr(watcher, "open_source", lambda *args, **kw: source)
+    deadline = time.monotonic() + 5
+    watch("root", on_batch, [".py"], debounce=0.01, max_wait=1.0,
+          stop=lambda: until() or time.monotonic() > deadline, **kwargs)
+    assert source.closed
+    return source
+
+
+def test_debounced_paths_are_delivered_in_batches(monkeypatch):
+    batches = []
+    run_watch(monkeypatch, [({"b.py", "a.py"}, False), ({"c.py"}, False)], batches.append,
+              until=lambda: sum(len(b.paths) for b in batches) >= 3, max_batch=2)
+    assert [b.paths for b in batches] == [["a.py", "b.py"], ["c.py"]]
+
+
+def test_failed_batch_is_retried_with_backoff_and_watching_continues(monkeypatch, capsys):
+    calls = []
+
+    def on_batch(batch: ChangeBatch):
+        calls.append((time.monotonic(), batch.paths))
+        if len(calls) <= 2:
+            raise RuntimeError("neo4j down")
+
+    run_watch(monkeypatch, [({"a.py"}, False)], on_batch, until=lambda: len(calls) >= 3,
+              retry_backoff=0.05, retry_backoff_max=1.0)
+    assert [paths for _, paths in calls] == [["a.py"]] * 3
+    # Second retry waits twice as long as the first
+    assert calls[1][0] - calls[0][0] >= 0.05
+    assert calls[2][0] - calls[1][0] >= 0.1
+    assert "neo4j down" in capsys.readouterr().err
+
+
+def test_events_during_backoff_join_the_retried_batch(monkeypatch):
+    calls = []
+    source = None
+
+    def on_batch(batch: ChangeBatch):
+        calls.append(batch.paths)
+        if len(calls) == 1:
+            # A change arriving while the failed batch waits for its retry
+            source.reads.append(({"b.py"}, False))
+            raise RuntimeError("boom")
+
+    real_open = ScriptedSource
+
+    def open_source(*args, **kwargs):
+        nonlocal source
+        source = real_open([({"a.py"}, False)])
+        return source
+
+    monkeypatch.setattr(watcher, "open_source", open_source)
+    deadline = time.monotonic() + 5
+    watch("root", on_batch, [".py"], debounce=0.01, retry_backoff=0.05,
+          stop=lambda: len(calls) >= 2 or time.monotonic() > deadline)
+    assert calls == [["a.py"], ["a.py", "b.py"]]
+
+
+def test_only_unfinished_sub_batches_stay_pending(monkeypatch):
+    calls = []
+
+    def on_batch(batch: ChangeBatch):
+        calls.append(batch.paths)
+        if len(calls) == 2:
+            raise RuntimeError("second sub-batch failed")
+
+    run_watch(monkeypatch, [({"a.py", "b.py", "c.py", "d.py"}, False)], on_batch,
+              until=lambda: len(calls) >= 3, max_batch=2, retry_backoff=0.01)
+    assert calls == [["a.py", "b.py"], ["c.py", "d.py"], ["c.py", "d.py"]]
+
+
+def test_initial_rescan_is_retried_until_it_succeeds(monkeypatch):
+    calls = []
+
+    def on_batch(batch: ChangeBatch):
+        calls.append(batch.rescan)
+        if len(calls) == 1:
+            raise ConnectionError("refused")
+
+    run_watch(monkeypatch, [], on_batch, until=lambda: len(calls) >= 2, initial_rescan=True, retry_backoff=0.01)
+    assert calls == [True, True]
+
+
+def test_keyboard_interrupt_is_not_swallowed(monkeypatch):
+    def on_batch(batch):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        run_watch(monkeypatch, [({"a.py"}, False)], on_batch, until=lambda: False)
+
+
+def drain(source):
+    changed, rescan = set(), False
+    while True:
+        paths, overflow = source.read(0.2)
+        if not paths and not overflow:
+            return changed, rescan
+        changed |= paths
+        rescan = rescan or overflow
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+def test_moved_directories_are_watched_under_their_new_path(tmp_path):
+    root, outside = tmp_path / "root", tmp_path / "outside"
+    (root / "old" / "deep").mkdir(parents=True)
+    outside.mkdir()
+    (root / "gone").mkdir()
+    try:
+        source = watcher.InotifySource(str(root), [".py"])
+    except OSError as e:
+        pytest.skip(f"inotify unavailable: {e}")
+    try:
+        # Moved within the tree: later events carry the new path
+        (root / "old").rename(root / "new")
+        changed, rescan = drain(source)
+        assert rescan
+        (root / "new" / "deep" / "a.py").write_text("x = 1\n")
+        changed, _ = drain(source)
+        assert changed == {str(root / "new" / "deep" / "a.py")}
+
+        # Moved out of the tree: its files are no longer reported
+        (root / "gone").rename(outside / "gone")
+        _, rescan = drain(source)
+        assert rescan
+        (outside / "gone" / "b.py").write_text("x = 1\n")
+        assert drain(source) == (set(), False)
+        assert all(not path.startswith(str(root / "gone")) for path in source._wd_to_dir.values())
+    finally:
+        source.close()
@@ -0,0 +1,297 @@
+"""
+Watch mode: keeps the knowledge graph in sync with the docs/ tree.
+監看模式：以 inotify (不可用時改用輪詢) 監看 docs/ 目錄，把一連串存檔事件去抖動後，
+以小批次送入既有的 load_code → analyze_code → chunk_code → enrich_chunks → send_to_graphiti 流程。
+
+Usage:
+    python watcher.py ../docs --debounce 1.0
+"""
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from file_scanner import scan_dirs, scan_files, has_extension, is_excluded
+from run_lock import RunLock
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+_WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+               | IN_DELETE_SELF | IN_MOVE_SELF)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class ChangeBatch:
+    """
+    A debounced set of changed paths; rescan=True asks for a full incremental scan instead.
+    去抖動後的一批變更路徑；rescan=True 表示需要以清單比對整個目錄樹 (例如目錄被刪除或事件佇列溢出)。
+    """
+    def __init__(self, paths: Iterable[str] = (), rescan: bool = False):
+        self.paths = sorted(set(paths))
+        self.rescan = rescan
+
+    def __bool__(self):
+        return bool(self.paths) or self.rescan
+
+
+class InotifySource:
+    """
+    Recursive inotify watches through ctypes (Linux only, no extra dependency).
+    透過 ctypes 直接使用 inotify 遞歸監看 (僅限 Linux，不需額外套件)。
+    """
+    def __init__(self, root: str, extensions: Iterable[str]):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.root = root
+        self.extensions = list(extensions)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._wd_to_dir: Dict[int, str] = {}
+        self.add_tree(root)
+
+    def _add_watch(self, dir_path: str):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(dir_path), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            # ENOSPC: fs.inotify.max_user_watches reached, let the caller fall back to polling
+            raise OSError(err, f"inotify_add_watch failed for {dir_path}: {os.strerror(err)}")
+        self._wd_to_dir[wd] = dir_path
+
+    def _remove_tree(self, dir_path: str):
+        """Drops the watches of dir_path and its subdirectories, e.g. after they moved away."""
+        prefix = dir_path.rstrip(os.sep) + os.sep
+        for wd, watched in list(self._wd_to_dir.items()):
+            if watched == dir_path or watched.startswith(prefix):
+                # The kernel still sends IN_IGNORED for wd, which is then no longer known
+                self._libc.inotify_rm_watch(self.fd, wd)
+                del self._wd_to_dir[wd]
+
+    def add_tree(self, dir_path: str) -> List[str]:
+        """Watches dir_path and its non-excluded subdirectories; returns the files already inside."""
+        self._add_watch(dir_path)
+        for sub_dir in scan_dirs(dir_path):
+            self._add_watch(sub_dir)
+        return [f.path for f in scan_files(dir_path, self.extensions)]
+
+    def read(self, timeout: Optional[float]) -> Tuple[Set[str], bool]:
+        """Waits up to timeout seconds; returns (changed paths, rescan needed)."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        changed: Set[str] = set()
+        rescan = False
+        if not ready:
+            return changed, rescan
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    rescan = True
+                    continue
+                if mask & IN_IGNORED:
+                    self._wd_to_dir.pop(wd, None)
+                    continue
+                dir_path = self._wd_to_dir.get(wd)
+                if dir_path is None:
+                    continue
+                path = os.path.join(dir_path, os.fsdecode(name)) if name else dir_path
+                if mask & IN_ISDIR or mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        if not is_excluded(self.root, path):
+                            try:
+                                changed.update(self.add_tree(path))
+                            except OSError:
+                                rescan = True
+                    elif path != self.root:
+                        # A directory went away: its files are only known to the manifest
+                        rescan = True
+                        if mask & IN_MOVED_FROM:
+                            # Its watches would keep reporting events under the old path; a move
+                            # within the tree is watched again under the new one on IN_MOVED_TO
+                            self._remove_tree(path)
+                    continue
+                if mask & IN_CREATE or not has_extension(os.path.basename(path), self.extensions):
+                    # IN_CREATE: wait for IN_CLOSE_WRITE so half-written files are not picked up
+                    continue
+                changed.add(path)
+        return changed, rescan
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingSource:
+    """
+    Fallback that diffs (size, mtime) snapshots from scan_files every interval seconds.
+    備援方案：每隔 interval 秒以 scan_files 比對 (size, mtime) 快照。
+    """
+    def __init__(self, root: str, extensions: Iterable[str], interval: float = 2.0):
+        self.root = root
+        self.extensions = list(extensions)
+        self.interval = interval
+        self._snapshot = self._take_snapshot()
+        self._next_poll = time.monotonic() + interval
+
+    def _take_snapshot(self) -> Dict[str, Tuple[int, float]]:
+        return {f.path: (f.size, f.mtime) for f in scan_files(self.root, self.extensions, with_stat=True)}
+
+    def read(self, timeout: Optional[float]) -> Tuple[Set[str], bool]:
+        wait = self._next_poll - time.monotonic()
+        if timeout is not None:
+            wait = min(wait, timeout)
+        if wait > 0:
+            time.sleep(wait)
+        if time.monotonic() < self._next_poll:
+            return set(), False
+        self._next_poll = time.monotonic() + self.interval
+        snapshot = self._take_snapshot()
+        changed = {p for p, st in snapshot.items() if self._snapshot.get(p) != st}
+        changed.update(p for p in self._snapshot if p not in snapshot)
+        self._snapshot = snapshot
+        return changed, False
+
+    def close(self):
+        pass
+
+
+def open_source(root: str, extensions: Iterable[str], force_poll: bool = False, poll_interval: float = 2.0):
+    """Prefers inotify and falls back to polling when it is unavailable."""
+    if not force_poll and sys.platform.startswith("linux"):
+        try:
+            return InotifySource(root, extensions)
+        except (OSError, AttributeError) as e:
+            print(f"inotify 無法使用 ({e})，改用輪詢模式。")
+    return PollingSource(root, extensions, poll_interval)
+
+
+def watch(root: str, on_batch: Callable[[ChangeBatch], None], extensions: Iterable[str],
+          debounce: float = 1.0, max_wait: float = 10.0, max_batch: int = 500,
+          force_poll: bool = False, poll_interval: float = 2.0,
+          stop: Optional[Callable[[], bool]] = None, initial_rescan: bool = False,
+          retry_backoff: float = 2.0, retry_backoff_max: float = 60.0):
+    """
+    Runs until stop() returns True, calling on_batch with debounced micro-batches.
+    持續監看直到 stop() 為 True，以去抖動後的小批次呼叫 on_batch。
+
+    When on_batch raises (e.g. IngestError or Neo4j being down), the error is logged, the
+    batch's paths stay pending together with newer events, and the batch is retried after
+    an exponential backoff; the watcher itself keeps running.
+    on_batch 失敗時記錄錯誤，該批次的路徑保留在待處理集合中，以指數退避後重試，監看不會中斷。
+
+    :param debounce: 最後一個事件之後靜默多久 (秒) 才送出批次
+    :param max_wait: 持續有事件時，第一個事件之後最多等待多久就強制送出
+    :param max_batch: 單一批次的最大路徑數量
+    :param initial_rescan: 開始時先送出一次 rescan 批次 (補上監看停止期間的變更)
+    :param retry_backoff: 第一次重試前等待的秒數，之後每次失敗加倍
+    :param retry_backoff_max: 重試等待秒數的上限
+    """
+    source = open_source(root, extensions, force_poll, poll_interval)
+    pending: Set[str] = set()
+    rescan = initial_rescan
+    first_event = last_event = time.monotonic() - debounce if initial_rescan else None
+    failures = 0
+    retry_at = 0.0
+    try:
+        while not (stop and stop()):
+            timeout = debounce if pending or rescan else 1.0
+            changed, overflow = source.read(timeout)
+            now = time.monotonic()
+            if changed or overflow:
+                pending |= changed
+                rescan = rescan or overflow
+                last_event = now
+                first_event = first_event or now
+            if not (pending or rescan) or now < retry_at:
+                continue
+            quiet = now - last_event >= debounce
+            overdue = now - first_event >= max_wait
+            if quiet or overdue or len(pending) >= max_batch:
+                try:
+                    if rescan:
+                        # A rescan covers every pending path as well
+                        on_batch(ChangeBatch(rescan=True))
+                        pending.clear()
+                    else:
+                        batch_paths = sorted(pending)
+                        for i in range(0, len(batch_paths), max_batch):
+                            on_batch(ChangeBatch(batch_paths[i:i + max_batch]))
+                            pending.difference_update(batch_paths[i:i + max_batch])
+                except Exception as e:
+                    failures += 1
+                    delay = min(retry_backoff_max, retry_backoff * 2 ** (failures - 1))
+                    retry_at = time.monotonic() + delay
+                    what = "完整比對" if rescan else f"{len(pending)} 個路徑"
+                    print(f"批次處理失敗 ({type(e).__name__}: {e})，{delay:.1f} 秒後重試{what}。", file=sys.stderr)
+                    continue
+                failures = 0
+                rescan = False
+                first_event = last_event = None
+    finally:
+        source.close()
+
+
+def run_chunking_batch(chunking_app, docs_dir: str, batch: ChangeBatch):
+    """Feeds one batch through the compiled chunking graph, waiting for any other run to finish."""
+    state = {
+        "file_path": docs_dir,
+        "documents": [],
+        "analysis_results": {},
+        "chunks": [],
+        "incremental": True,
+        "deleted_files": [],
+        "manifest_updates": {},
+        "changed_paths": [] if batch.rescan else batch.paths,
+    }
+    with RunLock():
+        return chunking_app.invoke(state)
+
+
+if __name__ == "__main__":
+    from chuncking import create_chunking_graph, extensions
+
+    parser = argparse.ArgumentParser(description="Watch a docs tree and ingest changes continuously.")
+    parser.add_argument("docs_dir", nargs="?", default="../docs")
+    parser.add_argument("--debounce", type=float, default=1.0)
+    parser.add_argument("--max-wait", type=float, default=10.0)
+    parser.add_argument("--max-batch", type=int, default=500)
+    parser.add_argument("--poll", action="store_true", help="force polling instead of inotify")
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--retry-backoff", type=float, default=2.0, help="seconds before retrying a failed batch")
+    parser.add_argument("--retry-backoff-max", type=float, default=60.0)
+    args = parser.parse_args()
+
+    chunking_app = create_chunking_graph()
+    print(f"正在監看 {args.docs_dir} ...")
+    try:
+        # Reconcile once first so changes made while the watcher was down are picked up;
+        # like every batch, it is retried when it fails
+        # 啟動時先完整比對一次，補上監看停止期間的變更；失敗時與其他批次一樣會重試
+        watch(args.docs_dir, lambda batch: run_chunking_batch(chunking_app, args.docs_dir, batch),
+              extensions, debounce=args.debounce, max_wait=args.max_wait, max_batch=args.max_batch,
+              force_poll=args.poll, poll_interval=args.poll_interval, initial_rescan=True,
+              retry_backoff=args.retry_backoff, retry_backoff_max=args.retry_backoff_max)
+    except KeyboardInterrupt:
+        pass
@@ -120,5 +120,47 @@ class CodeChunker(Chunker):
 
         return chunks
 
+    def chunk_file(self, file_path, token_limit, window_lines=2000, max_line_chars=10000, encoding="utf-8"):
+        """
+        Chunks a file of any size without reading it into one string.
+
+        Lines are read into windows of at most window_lines lines (longer lines are split
+        every max_line_chars characters) and each window goes through chunk(). The last
+        chunk of a window usually ends at the window edge rather than at a breakpoint, so
+        it is carried over and re-chunked together with the next window.
+        """
+        chunks = {}
+        chunk_number = 1
+        carry = []
+        window = self._read_window(file_path, window_lines, max_line_chars, encoding)
+        next_window = next(window, None)
+        while next_window is not None:
+            lines = carry + next_window
+            next_window = next(window, None)
+            window_chunks = list(self.chunk("\n".join(lines), token_limit).values())
+            carry = []
+            if next_window is not None and len(window_chunks) > 1:
+                carry = window_chunks.pop().split("\n")
+            for chunk_code in window_chunks:
+                chunks[chunk_number] = chunk_code
+                chunk_number += 1
+        return chunks
+
+    @staticmethod
+    def _read_window(file_path, window_lines, max_line_chars, encoding):
+        with open(file_path, "r", encoding=encoding, errors="replace") as f:
+            lines = []
+            while True:
+                # readline(limit) keeps a single huge (e.g. minified) line from being read whole
+                line = f.readline(max_line_chars)
+                if not line:
+                    break
+                lines.append(line[:-1] if line.endswith("\n") else line)
+                if len(lines) >= window_lines:
+                    yield lines
+                    lines = []
+            if lines:
+                yield lines
+
     def get_chunk(self, chunked_codebase, chunk_number):
         return chunked_codebase[chunk_number]
@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("langextract")
+
+import Content_Collector
+from Content_Collector import DocumentCollector, detect_encoding
+
+HANZI = "這是一個測試文件，用來檢查編碼偵測的結果是否正確。"
+
+
+def test_plain_text_is_ascii_or_utf8():
+    assert detect_encoding(b"print('hi')\n") == ("ascii", "print('hi')\n")
+    assert detect_encoding(HANZI.encode("utf-8")) == ("utf-8", HANZI)
+
+
+@pytest.mark.parametrize("encoding, data", [
+    ("utf-8-sig", b"\xef\xbb\xbf" + HANZI.encode("utf-8")),
+    ("utf-16", HANZI.encode("utf-16")),
+    ("utf-32", HANZI.encode("utf-32")),
+])
+def test_byte_order_marks_win_over_the_nul_check(encoding, data):
+    assert detect_encoding(data) == (encoding, HANZI)
+
+
+def test_gbk_text_is_read_as_gb18030_and_big5_as_big5():
+    simplified = "这是一个测试文件，用来检查编码侦测的结果是否正确。"
+    assert detect_encoding(simplified.encode("gbk")) == ("gb18030", simplified)
+    assert detect_encoding(HANZI.encode("big5")) == ("big5", HANZI)
+
+
+def test_only_a_bounded_prefix_is_scored(monkeypatch):
+    scored = []
+    score = Content_Collector._hanzi_score
+    monkeypatch.setattr(Content_Collector, "_hanzi_score", lambda text: scored.append(len(text)) or score(text))
+    text = HANZI * 5000
+    encoding, decoded = detect_encoding(text.encode("big5"))
+    assert (encoding, decoded) == ("big5", text)
+    assert scored and max(scored) <= Content_Collector.ENCODING_SAMPLE_BYTES
+
+
+def test_next_candidate_is_used_when_the_rest_does_not_decode():
+    data = (HANZI * 5000).encode("big5") + b"\x81\x40"
+    assert len(data) > Content_Collector.ENCODING_SAMPLE_BYTES
+    encoding, text = detect_encoding(data)
+    assert encoding == "gb18030" and text.endswith("\u4e02")
+
+
+def test_binary_data_is_not_decoded():
+    assert detect_encoding(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR") == (None, None)
+
+
+def test_binary_files_are_skipped_but_utf16_files_are_loaded(tmp_path):
+    (tmp_path / "image.txt").write_bytes(b"GIF89a\x00\x01" + bytes(range(256)))
+    (tmp_path / "notes.txt").write_bytes(HANZI.encode("utf-16"))
+    collector = DocumentCollector(str(tmp_path), [".txt"])
+    assert collector.load_file(str(tmp_path / "image.txt")) == ("", None)
+    assert collector.metrics.counters["files_skipped_binary"] == 1
+    assert collector.load_file(str(tmp_path / "notes.txt")) == (HANZI, "utf-16")
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for i in range(30):
+        directory = tmp_path / f"d{i % 4}" / f"s{i % 3}"
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"f{i:02d}.txt").write_text(f"document {i}\n", encoding="utf-8")
+    return tmp_path
+
+
+def instrument(collector):
+    """Counts scanned files and files being loaded at once; loads take a varying time."""
+    seen = {"scanned": 0, "active": 0, "max_active": 0}
+    lock = threading.Lock()
+    scan, load = collector.iter_files_with_extensions, collector._load_document
+
+    def counting_scan():
+        for path in scan():
+            seen["scanned"] += 1
+            yield path
+
+    def slow_load(path):
+        with lock:
+            seen["active"] += 1
+            seen["max_active"] = max(seen["max_active"], seen["active"])
+        time.sleep(0.001 * (hash(path) % 5))
+        try:
+            return load(path)
+        finally:
+            with lock:
+                seen["active"] -= 1
+
+    collector.iter_files_with_extensions = counting_scan
+    collector._load_document = slow_load
+    return seen
+
+
+def test_files_are_scanned_lazily(tree):
+    collector = DocumentCollector(str(tree), [".txt"])
+    seen = instrument(collector)
+    documents = collector.iter_documents()
+    next(documents)
+    assert seen["scanned"] == 1
+    documents.close()
+
+
+@pytest.mark.parametrize("workers, in_flight", [(2, 2), (4, 6)])
+def test_files_in_flight_are_bounded(tree, workers, in_flight):
+    collector = DocumentCollector(str(tree), [".txt"], max_workers=workers, max_in_flight=in_flight)
+    seen = instrument(collector)
+    consumed = 0
+    for _ in collector.iter_documents():
+        consumed += 1
+        # Scanned but not yet handed out: at most max_in_flight files
+        assert seen["scanned"] - consumed <= in_flight
+    assert consumed == 30
+    assert seen["max_active"] <= workers
+
+
+def test_output_order_does_not_depend_on_the_worker_count(tree):
+    def ids(**kwargs):
+        collector = DocumentCollector(str(tree), [".txt"], **kwargs)
+        instrument(collector)
+        return [doc.document_id for doc in collector.iter_documents()]
+
+    serial = ids()
+    assert len(serial) == 30
+    assert ids(max_workers=4) == serial
+    assert ids(max_workers=3, max_in_flight=5) == serial
+    assert ids() == serial
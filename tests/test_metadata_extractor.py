@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from Metadata_Extractor import MetadataExtractor
+
+
+@pytest.fixture
+def extractor():
+    return MetadataExtractor()
+
+
+def test_extract_metadata_reads_title_and_content(extractor):
+    metadata = extractor.extract_metadata(
+        "Payment Service v2.1 Troubleshooting",
+        "Limit: 100 requests per minute. This endpoint is DEPRECATED.")
+    assert metadata == {
+        "service": "Payment Service",
+        "version": "2.1",
+        "doc_type": "troubleshooting",
+        "rate_limits": ["100 req/min"],
+        "deprecated": True,
+    }
+
+
+def test_extract_metadata_defaults(extractor):
+    assert extractor.extract_metadata("", "") == {
+        "service": "unknown", "version": "unknown", "doc_type": "reference",
+        "rate_limits": [], "deprecated": False,
+    }
+
+
+@pytest.mark.parametrize("content", [
+    "10 req/min and 20 requests per min",
+    "1000requests/min 5 req min",
+    "req 7 req/min 8req/min req",
+    "30   request per minute, 40 reqs/min",
+    "12 13 req/min",
+    "50 req/min50 req/min",
+    "no limits here",
+])
+def test_rate_limit_scan_matches_findall(extractor, content):
+    content = content.lower()
+    assert extractor._find_rate_limits(content) == MetadataExtractor.RATE_LIMIT_PATTERN.findall(content)
+
+
+def test_rate_limit_scan_matches_findall_on_random_text(extractor):
+    rng = random.Random(0)
+    tokens = ["req", "request", "requests", "per", "min", "minute", "/", " ", "  ", "12", "3", "x", "\n"]
+    for _ in range(500):
+        content = "".join(rng.choice(tokens) for _ in range(rng.randint(0, 30)))
+        assert extractor._find_rate_limits(content) == MetadataExtractor.RATE_LIMIT_PATTERN.findall(content)
+
+
+def test_extract_batch_in_a_process_pool_matches_serial(extractor):
+    documents = [{"id": str(i), "title": f"Search API v1.{i} guide",
+                  "content": f"{i} requests per min" + (" deprecated" if i % 3 == 0 else "")}
+                 for i in range(40)]
+    serial = extractor.extract_batch(documents, processes=1)
+    pooled = extractor.extract_batch(documents, processes=2, min_parallel_docs=0, chunksize=8)
+    assert pooled == serial
+    assert [doc["id"] for doc in pooled] == [doc["id"] for doc in documents]
+    assert serial[3]["metadata"]["rate_limits"] == ["3 req/min"]